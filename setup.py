@@ -36,6 +36,7 @@ setup(
     install_requires=["pandas", "requests", "pyvalem>=2.3"],
     extras_require={
         "dev": ["pytest-cov", "tox", "black", "ipython"],
+        "arrow": ["pyarrow"],
     },
     project_urls={
         "Bug Reports": "https://github.com/hanicinecm/exomole/issues",
@@ -1 +1,3 @@
 # TODO: Write the master readme file with some documentation and for-developers section.
+
+from .dataset import Dataset
@@ -0,0 +1,148 @@
+"""Module containing functionality for yielding the ExoMol data as *Apache Arrow*
+record batches, rather than as `pandas.DataFrame` chunks.
+
+The record batches have no index, so the *.states* index is yielded as the first
+column ``"i"`` of the batches. The schema of the *.states* record batches is given by
+the data types of the *.def* file (see `DefParser.get_states_schema`), while the
+*.trans* columns have the `TRANS_DTYPES`, unless other data types are passed to the
+reader.
+
+Requires the optional `pyarrow` dependency.
+"""
+
+TRANS_DTYPES = {"i": "int64", "f": "int64", "A_if": "float64", "v_if": "float64"}
+OUTPUTS = {"pandas", "arrow"}
+
+
+def _import_pyarrow():
+    """Import the optional `pyarrow` dependency, with an informative message."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "The pyarrow package is required for this functionality, install it by "
+            "running 'pip install exomole[arrow]'."
+        )
+    return pyarrow
+
+
+def _get_arrow_type(dtype):
+    """The *Arrow* data type for the `dtype`, as used by the readers."""
+    pyarrow = _import_pyarrow()
+    if dtype is None or dtype in {str, object, "str", "object", "O"}:
+        return pyarrow.string()
+    if dtype == "category":
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    return pyarrow.from_numpy_dtype(dtype)
+
+
+def get_arrow_schema(columns, dtypes=None):
+    """Get the *Arrow* schema of the data file columns.
+
+    Parameters
+    ----------
+    columns : list of str
+    dtypes : dict, optional
+        Data types keyed by the column names, such as returned by the
+        `DefParser.get_states_dtypes`. The columns missing are strings.
+
+    Returns
+    -------
+    pyarrow.Schema
+
+    Examples
+    --------
+    >>> get_arrow_schema(["i", "E", "kp"], {"i": "int64", "E": "float64"})
+    i: int64
+    E: double
+    kp: string
+    """
+    pyarrow = _import_pyarrow()
+    dtypes = dtypes or {}
+    return pyarrow.schema([(col, _get_arrow_type(dtypes.get(col))) for col in columns])
+
+
+def check_output(output):
+    """Check the `output` argument of the readers.
+
+    Raises
+    ------
+    ValueError
+        If the `output` is not one of the `OUTPUTS`.
+    """
+    if output not in OUTPUTS:
+        raise ValueError(f"Unknown output '{output}', choose from {OUTPUTS}")
+
+
+def to_record_batch(data, schema):
+    """Build a record batch out of the column arrays.
+
+    The numeric `numpy` arrays are wrapped with no copies.
+
+    Parameters
+    ----------
+    data : dict
+        The `numpy` arrays, `pandas.Series` or `pandas.Categorical` keyed by the
+        column names, in the order of the record batch columns.
+    schema : pyarrow.Schema
+        The schema holding (at least) all the columns in the `data`. The arrays are
+        cast to the data types of the schema fields.
+
+    Returns
+    -------
+    pyarrow.RecordBatch
+    """
+    pyarrow = _import_pyarrow()
+    fields = [schema.field(col) for col in data]
+    arrays = []
+    for field, values in zip(fields, data.values()):
+        if isinstance(values, pyarrow.Array):
+            array = values
+        else:
+            array = pyarrow.array(values, from_pandas=True)
+        if array.type != field.type:
+            array = array.cast(field.type)
+        arrays.append(array)
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=pyarrow.schema(fields))
+
+
+def dataframe_to_record_batch(chunk, schema, index_col=None):
+    """Convert a `pandas.DataFrame` chunk into a record batch.
+
+    Parameters
+    ----------
+    chunk : pandas.DataFrame
+    schema : pyarrow.Schema
+    index_col : str, optional
+        If passed, the chunk index is converted into the first column of this name.
+        Otherwise the index is dropped.
+
+    Returns
+    -------
+    pyarrow.RecordBatch
+    """
+    data = {} if index_col is None else {index_col: chunk.index.to_numpy()}
+    data.update((col, chunk[col]) for col in chunk.columns)
+    return to_record_batch(data, schema)
+
+
+def select_columns(batch, columns):
+    """Select the `columns` of the record `batch`, in the order passed.
+
+    Parameters
+    ----------
+    batch : pyarrow.RecordBatch
+    columns : list of str
+
+    Returns
+    -------
+    pyarrow.RecordBatch
+    """
+    if batch.schema.names == list(columns):
+        return batch
+    pyarrow = _import_pyarrow()
+    return pyarrow.RecordBatch.from_arrays(
+        [batch.column(col) for col in columns],
+        schema=pyarrow.schema([batch.schema.field(col) for col in columns]),
+    )
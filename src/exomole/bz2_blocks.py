@@ -0,0 +1,1116 @@
+"""Module grouping functionality for block-level access to *bz2*-compressed ExoMol
+data files.
+
+A *bz2* file consists of one or more *streams*, each of which is a sequence of
+independently compressed *blocks*. The blocks are not byte-aligned, but each of them
+starts with a 48-bit magic number, and each stream ends with another 48-bit magic
+number. Locating those magic numbers in the compressed data allows to slice the file
+into individual blocks, wrap each one of them into a minimal single-block *bz2*
+stream, and decompress them independently of each other - and therefore also in
+parallel over a pool of processes.
+
+The block boundaries, together with the number of rows preceding each block, can also
+be recorded once in a *block index* (see `index_blocks`), kept in a sidecar file next
+to the *bz2* file (or in any `index_dir` chosen). Any row of the file can then be reached by decompressing only the
+single block holding it, rather than all the data before it (see `open_data_file`).
+Similarly, the rows starting within a byte range of the compressed file are read by
+decompressing only the blocks around the range (see `ByteRangeReader`), so that
+independent workers can split a file between them.
+Without any block index, a reader can still keep track of the block holding the row
+it has got to (see `RowTracker`), so the file can later be re-opened straight at that
+block.
+
+This module only groups *helper* functions and classes, which are mostly not designed
+to be used directly by the end-users of the `exomole` package.
+"""
+
+import bz2
+import collections
+import io
+import itertools
+import json
+import os
+import warnings
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .exceptions import BlockIndexWarning, DataParseError
+
+_BLOCK_MAGIC = 0x314159265359
+_EOS_MAGIC = 0x177245385090
+_MAGIC_BITS = 48
+# the 48-bit magic is followed by the 32-bit CRC of the block (or of the stream)
+_HEADER_BITS = _MAGIC_BITS + 32
+
+
+def _magic_patterns(magic):
+    """Byte patterns of the 48-bit `magic` number for all the 8 possible bit shifts.
+
+    Parameters
+    ----------
+    magic : int
+
+    Returns
+    -------
+    list of tuple
+        For each bit shift, the tuple of ``(shift, anchor, anchor_offset, raw,
+        mask)``, where `raw` are the bytes covering the shifted magic number,
+        `mask` marks the bits in `raw` belonging to the magic number and `anchor`
+        is the longest run of the bytes fully covered by the magic number,
+        located at `anchor_offset` in `raw`.
+    """
+    patterns = []
+    for shift in range(8):
+        num_bytes = (_MAGIC_BITS + shift + 7) // 8
+        pad = num_bytes * 8 - _MAGIC_BITS - shift
+        raw = (magic << pad).to_bytes(num_bytes, "big")
+        mask = (((1 << _MAGIC_BITS) - 1) << pad).to_bytes(num_bytes, "big")
+        anchor_offset = 0 if shift == 0 else 1
+        anchor_len = 6 if shift == 0 else 5
+        anchor = raw[anchor_offset : anchor_offset + anchor_len]
+        patterns.append((shift, anchor, anchor_offset, raw, mask))
+    return patterns
+
+
+_BLOCK_PATTERNS = _magic_patterns(_BLOCK_MAGIC)
+_EOS_PATTERNS = _magic_patterns(_EOS_MAGIC)
+
+
+def _find_magic_offsets(data, patterns, data_offset=0):
+    """Find the bit offsets of all the occurrences of a magic number in `data`.
+
+    Parameters
+    ----------
+    data : bytes
+    patterns : list of tuple
+        As returned by `_magic_patterns`.
+    data_offset : int, optional
+        Byte offset of `data` in the file, added to all the offsets found.
+
+    Returns
+    -------
+    set of int
+        Bit offsets (relative to the start of the file).
+    """
+    offsets = set()
+    for shift, anchor, anchor_offset, raw, mask in patterns:
+        pos = data.find(anchor)
+        while pos != -1:
+            start = pos - anchor_offset
+            end = start + len(raw)
+            if start >= 0 and end <= len(data):
+                if all(data[start + j] & mask[j] == raw[j] for j in range(len(raw))):
+                    offsets.add((data_offset + start) * 8 + shift)
+            pos = data.find(anchor, pos + 1)
+    return offsets
+
+
+def find_blocks(file_path, scan_size=2**24, start_byte=0, stop_byte=None):
+    """Find the boundaries of all the compressed blocks in a *bz2* file.
+
+    The file is scanned in pieces of `scan_size` bytes for the block and
+    end-of-stream magic numbers, so the whole compressed file is never held in the
+    memory. No decompression is performed.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    scan_size : int, optional
+        Number of bytes scanned at once.
+    start_byte, stop_byte : int, optional
+        If passed, only the blocks starting within the bytes ``start_byte:stop_byte``
+        of the file are found, and the file is only scanned from the `start_byte`
+        up to the first magic number past the `stop_byte`.
+
+    Returns
+    -------
+    blocks : list of tuple of int
+        List of ``(start_bit, end_bit)`` tuples, one for each block in the file,
+        where ``start_bit`` is the bit offset of the block magic number and
+        ``end_bit`` is the bit offset of the next block or end-of-stream magic number.
+    """
+    # neighbouring pieces need to overlap, so magic numbers spanning two pieces
+    # are not missed:
+    overlap = 8
+    stop_bit = None if stop_byte is None else stop_byte * 8
+    block_offsets, eos_offsets = set(), set()
+    with open(file_path, "rb") as fp:
+        fp.seek(start_byte)
+        data_offset = start_byte
+        tail = b""
+        while True:
+            piece = fp.read(scan_size)
+            if not piece:
+                break
+            data = tail + piece
+            new_blocks = _find_magic_offsets(data, _BLOCK_PATTERNS, data_offset)
+            new_eos = _find_magic_offsets(data, _EOS_PATTERNS, data_offset)
+            block_offsets |= new_blocks
+            eos_offsets |= new_eos
+            tail = data[-overlap:]
+            data_offset += len(data) - len(tail)
+            if (
+                stop_bit is not None
+                and max(new_blocks | new_eos, default=-1) >= stop_bit
+            ):
+                # the end of the last block needed is known:
+                break
+        file_bits = os.fstat(fp.fileno()).st_size * 8
+
+    markers = sorted(block_offsets | eos_offsets)
+    blocks = []
+    for n, offset in enumerate(markers):
+        if offset not in block_offsets:
+            continue
+        if stop_bit is not None and offset >= stop_bit:
+            break
+        end = markers[n + 1] if n + 1 < len(markers) else file_bits
+        blocks.append((offset, end))
+    return blocks
+
+
+def _decompress_bits(raw, bit_shift, num_bits):
+    """Decompress a single block of `num_bits` bits starting `bit_shift` bits into the
+    `raw` bytes.
+
+    The block (starting with its magic number and CRC) is wrapped into a minimal
+    *bz2* stream, consisting of the stream header, the block itself and the
+    end-of-stream marker with the stream CRC (which equals the block CRC for
+    single-block streams).
+
+    Parameters
+    ----------
+    raw : bytes
+    bit_shift : int
+    num_bits : int
+
+    Returns
+    -------
+    bytes
+    """
+    value = int.from_bytes(raw, "big")
+    value >>= len(raw) * 8 - bit_shift - num_bits
+    value &= (1 << num_bits) - 1
+    block_crc = (value >> (num_bits - _HEADER_BITS)) & 0xFFFFFFFF
+    value = (value << _HEADER_BITS) | (_EOS_MAGIC << 32) | block_crc
+    num_bits += _HEADER_BITS
+    pad = -num_bits % 8
+    value <<= pad
+    return bz2.decompress(b"BZh9" + value.to_bytes((num_bits + pad) // 8, "big"))
+
+
+def decompress_block(file_path, start_bit, end_bit):
+    """Decompress a single block of a *bz2* file.
+
+    Only the compressed bytes spanned by the block are read from the file.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    start_bit, end_bit : int
+        The block boundaries, as returned by `find_blocks`.
+
+    Returns
+    -------
+    bytes
+        The decompressed data.
+
+    Raises
+    ------
+    OSError or ValueError
+        If the bits passed do not represent a valid compressed block.
+    """
+    start_byte, end_byte = start_bit // 8, (end_bit + 7) // 8
+    with open(file_path, "rb") as fp:
+        fp.seek(start_byte)
+        raw = fp.read(end_byte - start_byte)
+    return _decompress_bits(raw, start_bit % 8, end_bit - start_bit)
+
+
+def _try_decompress_block(file_path, start_bit, end_bit):
+    """Same as `decompress_block`, but returns ``None`` for invalid blocks."""
+    try:
+        return decompress_block(file_path, start_bit, end_bit)
+    except (OSError, ValueError, EOFError):
+        return None
+
+
+def _try_count_block_lines(file_path, start_bit, end_bit):
+    """Number of line ends in a single block, and whether the block data end with a
+    line end, or ``None`` for invalid blocks."""
+    data = _try_decompress_block(file_path, start_bit, end_bit)
+    if data is None:
+        return None
+    return data.count(b"\n"), data.endswith(b"\n")
+
+
+def _valid_blocks(file_path, blocks, decompressed, decompress=_try_decompress_block):
+    """Generator of the ``(start_bit, end_bit, data)`` of the valid blocks, out of
+    the `blocks` and their `decompressed` data (``None`` for the blocks which failed
+    to decompress, which are merged and passed to `decompress` again).
+
+    As the block magic numbers are located heuristically, a 48-bit sequence in the
+    compressed data might be mistaken for a block boundary. Such spurious boundaries
+    are detected by the resulting blocks failing to decompress, and the affected
+    neighbouring blocks are then merged and decompressed in the main process.
+    """
+    pending_start = None
+    for (start_bit, end_bit), data in zip(blocks, decompressed):
+        if pending_start is not None:
+            # the previous block(s) failed to decompress, merge with this one:
+            data = decompress(file_path, pending_start, end_bit)
+            start_bit = pending_start
+        if data is None:
+            pending_start = start_bit
+            continue
+        pending_start = None
+        yield start_bit, end_bit, data
+    if pending_start is not None:
+        raise DataParseError(f"Corrupted bz2 data detected in {Path(file_path).name}")
+
+
+class BZ2BlocksReader(io.RawIOBase):
+    """Read-only binary stream of the decompressed data of the selected blocks of a
+    *bz2* file.
+
+    The blocks are decompressed one by one, in the main process.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        Path to the *bz2* file.
+    blocks : iterable of tuple of int, optional
+        The ``(start_bit, end_bit)`` blocks to read, possibly located lazily while
+        being read. By default, all the blocks found by `find_blocks` are read.
+    tracker : RowTracker, optional
+        If passed, it gets updated with every block decompressed.
+
+    Examples
+    --------
+    >>> import bz2
+    >>> path = "tests/resources/dummy_data_5x5_int.bz2"
+    >>> with BZ2BlocksReader(path) as reader:
+    ...     data = reader.read()
+    >>> data == bz2.open(path).read()
+    True
+    """
+
+    def __init__(self, file_path, blocks=None, tracker=None):
+        super().__init__()
+        self.file_path = str(file_path)
+        self.blocks = blocks
+        self.tracker = tracker
+        self._decompressed = None
+        self._buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            if self._decompressed is None:
+                self._decompressed = self._decompressed_blocks()
+            try:
+                start_bit, data = next(self._decompressed)
+            except StopIteration:
+                return 0
+            if self.tracker is not None:
+                self.tracker.add_piece(start_bit, data)
+            self._buffer = memoryview(data)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def _get_blocks(self):
+        return self.blocks if self.blocks is not None else find_blocks(self.file_path)
+
+    def _decompressed_blocks(self):
+        """Generator of the ``(start_bit, data)`` of the decompressed blocks, in the
+        original order."""
+        blocks, to_decompress = itertools.tee(self._get_blocks())
+        decompressed = (
+            _try_decompress_block(self.file_path, start_bit, end_bit)
+            for start_bit, end_bit in to_decompress
+        )
+        for start_bit, _, data in _valid_blocks(self.file_path, blocks, decompressed):
+            yield start_bit, data
+
+
+class ParallelBZ2Reader(BZ2BlocksReader):
+    """Read-only binary stream of the decompressed data of a *bz2* file, with the
+    individual blocks decompressed in parallel over a pool of processes.
+
+    The blocks are decompressed ahead of the reader position, but the decompressed
+    data are always streamed in the original order. At most `max_blocks_in_flight`
+    decompressed blocks are kept in the memory at any time.
+
+    As the block magic numbers are located heuristically, a 48-bit sequence in the
+    compressed data might be mistaken for a block boundary. Such spurious boundaries
+    are detected by the resulting blocks failing to decompress, and the affected
+    neighbouring blocks are then merged and decompressed in the main process.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        Path to the *bz2* file.
+    num_workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs available.
+    blocks : iterable of tuple of int, optional
+        The ``(start_bit, end_bit)`` blocks to read, possibly located lazily while
+        being read. By default, all the blocks found by `find_blocks` are read.
+    max_blocks_in_flight : int, optional
+        Defaults to twice the number of worker processes.
+    tracker : RowTracker, optional
+        If passed, it gets updated with every block read.
+
+    Examples
+    --------
+    >>> import bz2
+    >>> path = "tests/resources/dummy_data_5x5_int.bz2"
+    >>> with ParallelBZ2Reader(path, num_workers=2) as reader:
+    ...     data = reader.read()
+    >>> data == bz2.open(path).read()
+    True
+    """
+
+    def __init__(
+        self,
+        file_path,
+        num_workers=None,
+        blocks=None,
+        max_blocks_in_flight=None,
+        tracker=None,
+    ):
+        super().__init__(file_path, blocks, tracker)
+        self.num_workers = num_workers
+        self.max_blocks_in_flight = max_blocks_in_flight
+        self._executor = None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        super().close()
+
+    def _decompressed_blocks(self):
+        """Generator of the ``(start_bit, data)`` of the decompressed blocks, in the
+        original order."""
+        blocks, to_decompress = itertools.tee(self._get_blocks())
+        num_workers = self.num_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(max_workers=num_workers)
+        max_in_flight = self.max_blocks_in_flight or 2 * num_workers
+        decompressed = _in_flight(
+            self._executor,
+            _try_decompress_block,
+            self.file_path,
+            to_decompress,
+            max_in_flight,
+        )
+        for start_bit, _, data in _valid_blocks(self.file_path, blocks, decompressed):
+            yield start_bit, data
+        self._executor.shutdown()
+        self._executor = None
+
+
+def _in_flight(executor, func, file_path, blocks, max_in_flight):
+    """Generator of the ``func(file_path, start_bit, end_bit)`` results for all the
+    `blocks`, in order, submitted to the `executor` at most `max_in_flight` ahead."""
+    futures = collections.deque()
+    for start_bit, end_bit in blocks:
+        futures.append(executor.submit(func, file_path, start_bit, end_bit))
+        if len(futures) == max_in_flight:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+class BlockIndex:
+    """Index of the blocks of a *bz2* file, with the number of rows preceding each.
+
+    Built by `index_blocks`, and mostly accessed through `get_block_index`.
+
+    Parameters
+    ----------
+    blocks : list of tuple of int
+        The ``(start_bit, end_bit)`` of all the (valid) blocks of the file.
+    rows_before : list of int
+        For each block, the number of line ends in all the data before it, which is
+        also the number of the row in progress at the start of the block.
+    num_rows : int
+        Number of rows in the whole file.
+    """
+
+    def __init__(self, blocks, rows_before, num_rows):
+        self.blocks = [tuple(block) for block in blocks]
+        self.rows_before = list(rows_before)
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def locate(self, row):
+        """Locate the start of the `row` in the blocks.
+
+        Parameters
+        ----------
+        row : int
+            The 0-based row number.
+
+        Returns
+        -------
+        position : int
+            Position (in the `blocks`) of the block holding the start of the `row`.
+        num_lines : int
+            Number of lines to skip from the start of the block to get to the `row`.
+
+        Examples
+        --------
+        >>> index = BlockIndex([(32, 1000), (1000, 2000)], [0, 13], 20)
+        >>> index.locate(5), index.locate(13), index.locate(14)
+        ((0, 5), (0, 13), (1, 1))
+        """
+        position = max(bisect_left(self.rows_before, row) - 1, 0)
+        return position, row - self.rows_before[position]
+
+
+def get_index_path(file_path, index_dir=None):
+    """Path of the sidecar file holding the block index of a *bz2* file.
+
+    The sidecar file is placed next to the *bz2* file, unless the `index_dir` is
+    passed.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    index_dir : str or Path or bool, optional
+        The directory of the sidecar file, or ``False`` for no sidecar file at all.
+
+    Returns
+    -------
+    Path or NoneType
+        ``None`` if ``index_dir is False``.
+
+    Examples
+    --------
+    >>> get_index_path("data/12C-16O__Li2015.trans.bz2").as_posix()
+    'data/12C-16O__Li2015.trans.bz2.idx'
+    >>> get_index_path("data/12C-16O__Li2015.trans.bz2", index_dir="idx").as_posix()
+    'idx/12C-16O__Li2015.trans.bz2.idx'
+    """
+    if index_dir is False:
+        return None
+    file_path = Path(file_path)
+    if index_dir is None:
+        return file_path.with_name(f"{file_path.name}.idx")
+    return Path(index_dir) / f"{file_path.name}.idx"
+
+
+def _get_source_stamp(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_block_index(file_path, num_workers=None):
+    """Build the block index of a *bz2* file, with no sidecar file written.
+
+    All the blocks are decompressed once, to count their lines.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    num_workers : int, optional
+        If passed, the blocks are decompressed in parallel over a pool of
+        `num_workers` processes.
+
+    Returns
+    -------
+    BlockIndex
+
+    Raises
+    ------
+    DataParseError
+        If the file holds corrupted *bz2* data.
+    """
+    file_path = str(file_path)
+    blocks = find_blocks(file_path)
+    executor = None
+    if num_workers is not None:
+        executor = ProcessPoolExecutor(max_workers=num_workers)
+        counts = _in_flight(
+            executor, _try_count_block_lines, file_path, blocks, 2 * num_workers
+        )
+    else:
+        counts = (
+            _try_count_block_lines(file_path, start_bit, end_bit)
+            for start_bit, end_bit in blocks
+        )
+    valid_blocks, rows_before = [], []
+    num_lines, ends_with_line_end = 0, True
+    try:
+        for start_bit, end_bit, (count, ends_with_line_end) in _valid_blocks(
+            file_path, blocks, counts, decompress=_try_count_block_lines
+        ):
+            valid_blocks.append((start_bit, end_bit))
+            rows_before.append(num_lines)
+            num_lines += count
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    # the last line with no line end still counts:
+    num_rows = num_lines + (0 if ends_with_line_end else 1)
+    return BlockIndex(valid_blocks, rows_before, num_rows)
+
+
+def _save_block_index(index, file_path, index_dir=None):
+    index_path = get_index_path(file_path, index_dir)
+    if index_path is None:
+        return
+    header = {**_get_source_stamp(file_path), "num_rows": index.num_rows}
+    table = np.column_stack(
+        [np.array(index.blocks, dtype="int64").reshape(-1, 2), index.rows_before]
+    )
+    tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as fp:
+        fp.write(f"# {json.dumps(header)}\n")
+        np.savetxt(fp, table, fmt="%d")
+    os.replace(tmp_path, index_path)
+
+
+def index_blocks(file_path, num_workers=None, index_dir=None):
+    """Build the block index of a *bz2* file and save it into the sidecar file.
+
+    The one-time indexing decompresses the whole file, after which any row of the
+    file can be reached by decompressing a single block (see `open_data_file`).
+
+    Parameters
+    ----------
+    file_path : str or Path
+    num_workers : int, optional
+        If passed, the blocks are decompressed in parallel over a pool of
+        `num_workers` processes.
+    index_dir : str or Path or bool, optional
+        The directory of the sidecar file (see `get_index_path`), next to the *bz2*
+        file by default. With ``False``, the index is only kept in the memory.
+
+    Returns
+    -------
+    BlockIndex
+
+    Raises
+    ------
+    DataParseError
+        If the file holds corrupted *bz2* data.
+    OSError
+        If the sidecar file (see `get_index_path`) cannot be written.
+    """
+    index = build_block_index(file_path, num_workers=num_workers)
+    _save_block_index(index, file_path, index_dir)
+    _BLOCK_INDEXES[_block_index_key(file_path)] = index
+    return index
+
+
+def load_block_index(file_path, index_dir=None):
+    """Load the block index of a *bz2* file from its sidecar file.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    index_dir : str or Path or bool, optional
+        The directory of the sidecar file (see `get_index_path`).
+
+    Returns
+    -------
+    BlockIndex or NoneType
+        ``None`` if the sidecar file does not exist, or does not match the *bz2*
+        file (which has been modified since indexed), or if ``index_dir is False``.
+    """
+    index_path = get_index_path(file_path, index_dir)
+    if index_path is None:
+        return None
+    try:
+        with open(index_path, "r") as fp:
+            header = json.loads(fp.readline().lstrip("#"))
+        table = np.loadtxt(index_path, dtype="int64", ndmin=2)
+    except (OSError, ValueError):
+        return None
+    num_rows = header.pop("num_rows", None)
+    if num_rows is None or header != _get_source_stamp(file_path):
+        return None
+    return BlockIndex(table[:, :2].tolist(), table[:, 2].tolist(), num_rows)
+
+
+# the block indexes already loaded or built, keyed by the file path and stamp:
+_BLOCK_INDEXES = {}
+
+
+def _block_index_key(file_path):
+    stamp = _get_source_stamp(file_path)
+    return str(Path(file_path).resolve()), stamp["mtime_ns"], stamp["size"]
+
+
+def get_block_index(file_path, num_workers=None, index_dir=None):
+    """Get the block index of a *bz2* file, indexing it only if not indexed yet.
+
+    The index is loaded from the sidecar file if up to date. Otherwise, the file is
+    indexed and the sidecar file written. Either way, the index is remembered for
+    any later calls.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    num_workers : int, optional
+        If passed, and the file needs indexing, the blocks are decompressed in
+        parallel over a pool of `num_workers` processes.
+    index_dir : str or Path or bool, optional
+        The directory of the sidecar file (see `get_index_path`), next to the *bz2*
+        file by default. With ``False``, no sidecar file is read or written, and the
+        index is only kept in the memory.
+
+    Returns
+    -------
+    BlockIndex
+
+    Warns
+    -----
+    BlockIndexWarning
+        If the sidecar file cannot be written, in which case the index is only kept
+        in the memory.
+    """
+    key = _block_index_key(file_path)
+    if key not in _BLOCK_INDEXES:
+        index = load_block_index(file_path, index_dir)
+        if index is None:
+            index = build_block_index(file_path, num_workers=num_workers)
+            try:
+                _save_block_index(index, file_path, index_dir)
+            except OSError as error:
+                warnings.warn(
+                    f"The block index of {Path(file_path).name} could not be saved "
+                    f"({error}), pass a writable index_dir.",
+                    BlockIndexWarning,
+                )
+        _BLOCK_INDEXES[key] = index
+    return _BLOCK_INDEXES[key]
+
+
+def _blocks_from(file_path, start_byte, window=2**22):
+    """Generator of the blocks of a *bz2* file starting from the `start_byte`, with
+    the file scanned lazily, `window` bytes at a time."""
+    file_size = os.path.getsize(file_path)
+    while start_byte < file_size:
+        yield from find_blocks(
+            file_path,
+            scan_size=2**20,
+            start_byte=start_byte,
+            stop_byte=start_byte + window,
+        )
+        start_byte += window
+
+
+def _block_before(file_path, stop_byte, window=2**20):
+    """The last block of a *bz2* file starting before the `stop_byte`, or ``None``."""
+    while True:
+        start_byte = max(stop_byte - window, 0)
+        blocks = find_blocks(
+            file_path, scan_size=2**20, start_byte=start_byte, stop_byte=stop_byte
+        )
+        if blocks:
+            return blocks[-1]
+        if not start_byte:
+            return None
+        window *= 2
+
+
+def _range_blocks(file_path, start_byte, index_dir=None):
+    """Generator of the blocks of a *bz2* file, from the last one starting before the
+    `start_byte` (if any) to the end of the file.
+
+    The blocks of the block index are used if the file has been indexed, otherwise
+    the blocks are located by scanning the file lazily.
+    """
+    index = _BLOCK_INDEXES.get(_block_index_key(file_path))
+    if index is None:
+        index = load_block_index(file_path, index_dir)
+    if index is not None:
+        starts = [start_bit for start_bit, _ in index.blocks]
+        yield from index.blocks[max(bisect_left(starts, start_byte * 8) - 1, 0) :]
+        return
+    if start_byte:
+        block = _block_before(file_path, start_byte)
+        if block is not None:
+            yield block
+    yield from _blocks_from(file_path, start_byte)
+
+
+def _range_pieces(file_path, start_byte, stop_byte, piece_size=2**20, index_dir=None):
+    """Generator of the ``(location, data)`` pieces of the decompressed data of a
+    file, from the piece just before the bytes ``start_byte:stop_byte`` of the
+    (compressed) file to the end of the file.
+
+    The `location` is -1, 0 or 1 for the pieces before, within or after the range.
+    The pieces of a *bz2* file are its blocks, within the range if starting within
+    the bytes. The pieces of an uncompressed file are its bytes, starting with the
+    single byte before the range.
+    """
+
+    def locate(position):
+        return -1 if position < start_byte else 0 if position < stop_byte else 1
+
+    if str(file_path).endswith("bz2"):
+        for start_bit, end_bit in _range_blocks(file_path, start_byte, index_dir):
+            data = _try_decompress_block(file_path, start_bit, end_bit)
+            if data is None:
+                raise DataParseError(
+                    f"Spurious bz2 block boundary found in {Path(file_path).name}, "
+                    f"index the file first (see index_blocks)."
+                )
+            yield locate(start_bit // 8), data
+        return
+    with open(file_path, "rb") as fp:
+        if start_byte:
+            fp.seek(start_byte - 1)
+            yield -1, fp.read(1)
+        position = start_byte
+        while True:
+            size = piece_size
+            if position < stop_byte:
+                size = min(size, stop_byte - position)
+            data = fp.read(size)
+            if not data:
+                return
+            yield locate(position), data
+            position += len(data)
+
+
+def _rows_in_range(pieces):
+    """Generator of the data of all the rows starting within the range, out of the
+    `pieces` located relative to the range (see `_range_pieces`), with the row in
+    progress at the end of the range read to its end, and the pieces following it
+    not read at all."""
+    at_row_start, row_in_range = True, False
+    for location, data in pieces:
+        if location > 0:
+            if at_row_start or not row_in_range:
+                return
+            row_end = data.find(b"\n")
+            if row_end != -1:
+                yield data[: row_end + 1]
+                return
+            yield data
+            continue
+        if location == 0:
+            if not at_row_start and not row_in_range:
+                # the row in progress started before the range:
+                row_end = data.find(b"\n")
+                if row_end == -1:
+                    continue
+                yield data[row_end + 1 :]
+            else:
+                yield data
+            row_in_range = True
+        if data:
+            at_row_start = data.endswith(b"\n")
+
+
+class ByteRangeReader(io.RawIOBase):
+    """Read-only binary stream of the decompressed data of the rows of a data file
+    starting within a byte range of the file.
+
+    The rows of a *.bz2* compressed file starting within the range are those starting
+    in the blocks which start within the range (see `find_blocks`). Each row
+    belongs to exactly one range out of any ranges adjoining each other, so a file
+    split into ranges can be read by independent workers, with no rows read twice.
+    Only the blocks of (or the bytes of the uncompressed file) from just before the
+    range, up to the end of the last row of the range, are read.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        Path to the data file, either *.bz2* compressed or not.
+    start_byte, stop_byte : int
+        The range of the bytes of the (compressed) file.
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar file (see `get_index_path`), which
+        is used if the *bz2* file has been indexed, but never written.
+
+    Raises
+    ------
+    DataParseError
+        On reading, if a *bz2* file not indexed (see `index_blocks`) happens to hold
+        a spurious block magic number in the blocks read.
+
+    Examples
+    --------
+    >>> path = "tests/resources/dummy_data_5x5_int.no_compression"
+    >>> with ByteRangeReader(path, 0, 20) as reader:
+    ...     reader.read()
+    b'0 1 2 3 4\\n5 6 7 8 9\\n'
+    >>> with ByteRangeReader(path, 20, 100) as reader:
+    ...     reader.read()
+    b'10 11 12 13 14\\n15 16 17 18 19\\n20 21 22 23 24\\n'
+    """
+
+    def __init__(self, file_path, start_byte, stop_byte, index_dir=None):
+        super().__init__()
+        self.file_path = str(file_path)
+        self.start_byte = start_byte
+        self.stop_byte = stop_byte
+        self.index_dir = index_dir
+        self._data = None
+        self._buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            if self._data is None:
+                self._data = _rows_in_range(
+                    _range_pieces(
+                        self.file_path,
+                        self.start_byte,
+                        self.stop_byte,
+                        index_dir=self.index_dir,
+                    )
+                )
+            try:
+                self._buffer = memoryview(next(self._data))
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+        super().close()
+
+
+class RowTracker:
+    """Position of the row following the rows parsed out of a data file stream, in
+    terms of the pieces of the (compressed) file read.
+
+    The reader of the stream (see `open_data_file`) records the start of every piece
+    of the decompressed data read, which are the blocks of a *bz2* file, or any
+    pieces of an uncompressed file, while the parser of the stream counts the rows
+    parsed. The next `row` can then be located in the piece holding it, and the file
+    re-opened straight at that piece, with no block index needed.
+
+    Parameters
+    ----------
+    row : int, optional
+        The row the stream starts at.
+
+    Attributes
+    ----------
+    row : int
+        The number of the row following the rows parsed so far, to be advanced by
+        the parser.
+
+    Examples
+    --------
+    >>> path = "tests/resources/dummy_data_5x5_int.no_compression"
+    >>> tracker = RowTracker(2)
+    >>> with open_data_file(path, start_row=2, tracker=tracker) as stream:
+    ...     stream.readline()
+    ...     tracker.row += 1
+    b'10 11 12 13 14\\n'
+    >>> tracker.locate()
+    (0, 3)
+    """
+
+    def __init__(self, row=0):
+        self.row = row
+        # the (start_bit, rows_before) of the pieces, only from the piece holding the
+        # row on:
+        self._pieces = collections.deque()
+        self._num_lines = row
+
+    def begin(self, rows_before):
+        """Start recording the pieces, the first of which starts with the
+        `rows_before` line ends before it."""
+        self._pieces.clear()
+        self._num_lines = rows_before
+
+    def add_piece(self, start_bit, data):
+        """Record the next piece of the decompressed `data` read, starting at the
+        `start_bit` of the file."""
+        self._pieces.append((start_bit, self._num_lines))
+        self._num_lines += data.count(b"\n")
+
+    def locate(self):
+        """Locate the start of the `row` in the pieces read.
+
+        Returns
+        -------
+        tuple of int or NoneType
+            The ``(start_bit, num_lines)`` of the piece holding the start of the
+            `row`, and of the number of the lines to skip from the start of the piece
+            to get to the `row`, or ``None`` if no pieces have been read.
+        """
+        while len(self._pieces) > 1 and self._pieces[1][1] < self.row:
+            # the pieces before the row are never needed again:
+            self._pieces.popleft()
+        if not self._pieces:
+            return None
+        start_bit, rows_before = self._pieces[0]
+        return start_bit, self.row - rows_before
+
+
+class _FileReader(io.RawIOBase):
+    """Read-only binary stream of an uncompressed file from the `start_byte`, with the
+    `tracker` updated with every piece read."""
+
+    def __init__(self, file_path, start_byte, tracker):
+        super().__init__()
+        self._fp = open(file_path, "rb")
+        self._fp.seek(start_byte)
+        self.tracker = tracker
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        position = self._fp.tell()
+        data = self._fp.read(len(b))
+        if data:
+            self.tracker.add_piece(position * 8, data)
+        b[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._fp.close()
+        super().close()
+
+
+def _skip_lines(stream, num_lines):
+    """Read past the next `num_lines` lines of the binary `stream`."""
+    collections.deque(itertools.islice(stream, num_lines), maxlen=0)
+
+
+def open_data_file(
+    file_path,
+    num_workers=None,
+    start_row=None,
+    byte_range=None,
+    start_block=None,
+    tracker=None,
+    index_dir=None,
+):
+    """Open a data file as a binary stream of its decompressed data.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        Path to the data file, either *.bz2* compressed or not.
+    num_workers : int, optional
+        If passed, the *.bz2* compressed file is decompressed in parallel (see the
+        `ParallelBZ2Reader`). Ignored for uncompressed files.
+    start_row : int, optional
+        If passed, the stream starts at the 0-based `start_row` row of the file.
+        A *.bz2* compressed file is decompressed only from the block holding the
+        row, located by the block index of the file (see `get_block_index`), which
+        gets built on the first access. An uncompressed file is read past all the
+        rows before.
+    byte_range : tuple of int, optional
+        If passed, only the rows starting within the ``(start_byte, stop_byte)``
+        range of the bytes of the (compressed) file are streamed (see the
+        `ByteRangeReader`). Cannot be combined with the `start_row`, the
+        `start_block` and the `tracker`, and the `num_workers` are ignored.
+    start_block : tuple of int, optional
+        The ``(start_bit, num_lines)`` location of the `start_row` in the file, as
+        returned by `RowTracker.locate`. If passed, the file is opened straight at
+        the piece starting at the `start_bit`, and read past its `num_lines` lines,
+        with no block index needed. The blocks of a *.bz2* compressed file are then
+        located by scanning the file lazily forward from the `start_bit`, only as far
+        as the blocks are read.
+    tracker : RowTracker, optional
+        If passed, it gets updated with every piece of the file read, so the rows
+        parsed from the stream can be located in the file. A *.bz2* compressed file
+        is then always decompressed block by block (in parallel with the
+        `num_workers`).
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar file (see `get_block_index`), next
+        to the *bz2* file by default, or ``False`` for no sidecar file at all.
+
+    Returns
+    -------
+    io.BufferedIOBase
+
+    Raises
+    ------
+    ValueError
+        If the `byte_range` is combined with the `start_row`, the `start_block` or
+        the `tracker`.
+
+    Examples
+    --------
+    >>> with open_data_file(
+    ...     "tests/resources/dummy_data_5x5_int.no_compression", start_row=3
+    ... ) as stream:
+    ...     stream.read()
+    b'15 16 17 18 19\\n20 21 22 23 24\\n'
+    """
+    if byte_range is not None:
+        if start_row:
+            raise ValueError("The start_row cannot be combined with the byte_range.")
+        if start_block is not None or tracker is not None:
+            raise ValueError("The byte_range cannot be combined with a tracker.")
+        return io.BufferedReader(
+            ByteRangeReader(file_path, *byte_range, index_dir=index_dir), 2**20
+        )
+    compressed = str(file_path).endswith("bz2")
+    start_row = start_row or 0
+    if not start_row and start_block is None and tracker is None:
+        if not compressed:
+            return open(file_path, "rb")
+        if num_workers is None:
+            return bz2.open(file_path, "rb")
+        return io.BufferedReader(
+            ParallelBZ2Reader(file_path, num_workers=num_workers),
+            buffer_size=2**20,
+        )
+    blocks = None
+    if start_block is not None:
+        start_bit, num_lines = start_block
+        if compressed:
+            blocks = (
+                block
+                for block in _blocks_from(file_path, start_bit // 8)
+                if block[0] >= start_bit
+            )
+    elif compressed and start_row:
+        index = get_block_index(file_path, num_workers=num_workers, index_dir=index_dir)
+        position, num_lines = index.locate(start_row)
+        blocks = index.blocks[position:]
+    else:
+        start_bit, num_lines = 0, start_row
+    if tracker is not None:
+        tracker.begin(start_row - num_lines)
+    if compressed:
+        if num_workers is None:
+            reader = BZ2BlocksReader(file_path, blocks=blocks, tracker=tracker)
+        else:
+            reader = ParallelBZ2Reader(
+                file_path, num_workers, blocks=blocks, tracker=tracker
+            )
+        stream = io.BufferedReader(reader, buffer_size=2**20)
+    elif tracker is not None:
+        stream = io.BufferedReader(
+            _FileReader(file_path, start_bit // 8, tracker), buffer_size=2**20
+        )
+    else:
+        stream = open(file_path, "rb")
+        stream.seek(start_bit // 8)
+    try:
+        _skip_lines(stream, num_lines)
+    except BaseException:
+        stream.close()
+        raise
+    return stream
@@ -0,0 +1,292 @@
+"""Module grouping functionality for the persistent columnar cache of the ExoMol data
+files.
+
+Decompressing and parsing the *.states* and *.trans* files is expensive, so the
+parsed chunks can be written into a *Parquet* file in the cache directory the first
+time any data file is read, and all the subsequent reads are then served from the
+cache, with no decompression or text parsing involved.
+Each cache file holds the data of a single data file, with a row group per chunk.
+The cache files are keyed by the source file path (and by the parsing options), while
+the size and modification time of the source file are stored in the cache file
+metadata. A cache file not matching its source file is silently rebuilt.
+
+The cache requires the optional `pyarrow` dependency.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas
+
+from .arrow import _import_pyarrow, to_record_batch
+from .filters import filter_dataframe, filter_record_batch
+from .memory import ChunkSizer
+
+_METADATA_KEY = b"exomole"
+# the running row number kept through the filtering of the non-indexed caches:
+_ROW_NUMBER = "__row_number__"
+
+
+def _get_source_stamp(file_path):
+    """Size and modification time of the `file_path` passed."""
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def get_cache_path(file_path, cache_dir, variant=""):
+    """Get the path of the cache file belonging to a data file.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        Path to the source data file.
+    cache_dir : str or Path
+    variant : str, optional
+        Any string identifying the parsing options, as the same data file parsed with
+        different options needs to be cached separately.
+
+    Returns
+    -------
+    Path
+    """
+    key = f"{Path(file_path).resolve()}|{variant}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return Path(cache_dir) / f"{Path(file_path).name}.{digest}.parquet"
+
+
+def is_cached(file_path, cache_dir, variant=""):
+    """Check if the up-to-date cache file exists for the data file under `file_path`.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    cache_dir : str or Path
+    variant : str, optional
+
+    Returns
+    -------
+    bool
+    """
+    cache_path = get_cache_path(file_path, cache_dir, variant)
+    if not cache_path.is_file():
+        return False
+    pyarrow = _import_pyarrow()
+    try:
+        metadata = pyarrow.parquet.read_metadata(cache_path).metadata or {}
+    except pyarrow.ArrowException:
+        return False
+    if _METADATA_KEY not in metadata:
+        return False
+    return json.loads(metadata[_METADATA_KEY]) == _get_source_stamp(file_path)
+
+
+def _read_cache(
+    cache_path, chunk_size, columns, index_col, filters, sizer=None, schema=None
+):
+    """Generator of `pandas.DataFrame` chunks of an existing cache file.
+
+    The `filters` are evaluated on the record batches, before the conversion to
+    `pandas`. With the `sizer`, the record batches are read in the probing size, and
+    as many of them are converted into each chunk as the `sizer` allows. With the
+    `schema`, the record batches are yielded instead, with no `pandas` involved.
+    """
+    pyarrow = _import_pyarrow()
+    read_columns = columns
+    if columns is not None:
+        read_columns = list(columns)
+        for col in [index_col] + [col for col, _, _ in filters or []]:
+            if col is not None and col not in read_columns:
+                read_columns.append(col)
+    batch_size = chunk_size if sizer is None else sizer.size
+    parquet_file = pyarrow.parquet.ParquetFile(cache_path)
+    # rows read from the cache, and rows converted into chunks (with no filters):
+    num_rows = first_row = 0
+    batches = []
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=read_columns):
+        batch_num_rows = batch.num_rows
+        if filters:
+            if index_col is None and schema is None:
+                row_numbers = pyarrow.array(range(num_rows, num_rows + batch_num_rows))
+                batch = pyarrow.RecordBatch.from_arrays(
+                    batch.columns + [row_numbers],
+                    names=batch.schema.names + [_ROW_NUMBER],
+                )
+            batch = filter_record_batch(batch, filters)
+        num_rows += batch_num_rows
+        if sizer is None:
+            yield _to_chunk(
+                [batch], first_row, columns, index_col, filters, sizer, schema
+            )
+            first_row = num_rows
+            continue
+        while batch.num_rows:
+            # the batches are sliced to fill the chunks up to the size exactly:
+            num_missing = sizer.size - sum(batch.num_rows for batch in batches)
+            batches.append(batch.slice(0, num_missing))
+            batch = batch.slice(num_missing)
+            if sum(batch.num_rows for batch in batches) == sizer.size:
+                chunk = _to_chunk(
+                    batches, first_row, columns, index_col, filters, sizer, schema
+                )
+                batches = []
+                first_row += len(chunk)
+                yield chunk
+    if batches:
+        yield _to_chunk(batches, first_row, columns, index_col, filters, sizer, schema)
+
+
+def _to_record_batch(batch, columns, index_col, schema):
+    """Select the `columns` of the `batch` (the `index_col` first) and cast them to
+    the `schema`."""
+    if columns is None:
+        names = batch.schema.names
+    else:
+        names = [col for col in [index_col] + list(columns) if col is not None]
+        names = list(dict.fromkeys(names))
+    return to_record_batch({name: batch.column(name) for name in names}, schema)
+
+
+def _to_chunk(batches, first_row, columns, index_col, filters, sizer, schema):
+    """Convert the record `batches` read from the cache into a `pandas.DataFrame`, or
+    into a single record batch with the `schema`."""
+    pyarrow = _import_pyarrow()
+    if schema is not None:
+        if len(batches) > 1:
+            batches = pyarrow.Table.from_batches(batches).combine_chunks().to_batches()
+        chunk = _to_record_batch(batches[0], columns, index_col, schema)
+        if sizer is not None:
+            sizer.update(chunk)
+        return chunk
+    chunk = pyarrow.Table.from_batches(batches).to_pandas()
+    if index_col is not None:
+        chunk = chunk.set_index(index_col).rename_axis(None)
+    elif filters:
+        chunk = chunk.set_index(_ROW_NUMBER).rename_axis(None)
+    else:
+        chunk.index = pandas.RangeIndex(first_row, first_row + len(chunk))
+    if columns is not None:
+        chunk = chunk[[col for col in columns if col != index_col]]
+    if sizer is not None:
+        sizer.update(chunk)
+    return chunk
+
+
+def _write_through_cache(
+    chunks, file_path, cache_path, chunk_size, columns, index_col, filters, schema=None
+):
+    """Generator yielding the `chunks`, while writing them into the `cache_path`.
+
+    The cache file is only moved in place after all the chunks have been written.
+    All the rows are cached, while only the rows satisfying the `filters` are
+    yielded. With the `schema`, the record batches written are yielded instead.
+    """
+    pyarrow = _import_pyarrow()
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    source_stamp = json.dumps(_get_source_stamp(file_path)).encode()
+    writer = None
+    try:
+        for chunk in chunks:
+            if index_col is not None:
+                table_chunk = chunk.rename_axis(index_col).reset_index()
+            else:
+                table_chunk = chunk
+            table = pyarrow.Table.from_pandas(table_chunk, preserve_index=False)
+            if writer is None:
+                cache_schema = table.schema.with_metadata(
+                    {**(table.schema.metadata or {}), _METADATA_KEY: source_stamp}
+                )
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                writer = pyarrow.parquet.ParquetWriter(tmp_path, cache_schema)
+            writer.write_table(table.cast(writer.schema), row_group_size=chunk_size)
+            if schema is not None:
+                for batch in table.to_batches():
+                    batch = filter_record_batch(batch, filters)
+                    yield _to_record_batch(batch, columns, index_col, schema)
+                continue
+            chunk = filter_dataframe(chunk, filters, index_col)
+            yield chunk if columns is None else chunk[list(columns)]
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_path, cache_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def cached_chunks(
+    file_path,
+    load_chunks,
+    cache_dir,
+    chunk_size,
+    variant="",
+    columns=None,
+    index_col=None,
+    filters=None,
+    memory_budget=None,
+    schema=None,
+):
+    """Generate chunks of a data file, served from the cache if possible.
+
+    If the up-to-date cache file for the `file_path` exists in the `cache_dir`, the
+    chunks are read from it, otherwise they are loaded by `load_chunks` and written
+    into the cache on the way.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        Path to the source data file.
+    load_chunks : callable
+        Called with no arguments to get an iterable of the `pandas.DataFrame` chunks of
+        the source data file (parsed from the text).
+    cache_dir : str or Path
+    chunk_size : int
+        Number of rows in the chunks read from the cache, and the row group size of
+        the cache file.
+    variant : str, optional
+        Any string identifying the parsing options used by `load_chunks`.
+    columns : list of str, optional
+        If passed, only these columns are read (and yielded).
+    index_col : str, optional
+        Name under which the chunk index is stored in the cache file. If not passed,
+        the index is not cached and the chunks read from the cache are indexed by the
+        running row number, the same as the chunks parsed by `pandas`.
+    filters : list of tuple, optional
+        The validated ``(column, operator, value)`` filters (see the
+        `exomole.filters` module), which the rows yielded need to satisfy. All the
+        rows are still cached.
+    memory_budget : int or str, optional
+        If passed, the `chunk_size` of the chunks read from the cache is ignored, and
+        their numbers of rows are derived from the budget instead (see the
+        `memory.ChunkSizer`). The `load_chunks` need to be sized by the budget
+        themselves.
+    schema : pyarrow.Schema, optional
+        If passed, `pyarrow.RecordBatch` chunks with the data types of the `schema`
+        are yielded instead, with the `index_col` as their first column. The
+        `load_chunks` still need to yield the `pandas.DataFrame` chunks.
+
+    Yields
+    ------
+    chunk : pandas.DataFrame or pyarrow.RecordBatch
+    """
+    cache_path = get_cache_path(file_path, cache_dir, variant)
+    if is_cached(file_path, cache_dir, variant):
+        sizer = None if memory_budget is None else ChunkSizer(memory_budget)
+        yield from _read_cache(
+            cache_path, chunk_size, columns, index_col, filters, sizer, schema
+        )
+    else:
+        yield from _write_through_cache(
+            load_chunks(),
+            file_path,
+            cache_path,
+            chunk_size,
+            columns,
+            index_col,
+            filters,
+            schema,
+        )
@@ -0,0 +1,277 @@
+"""Module containing functionality for calculating the absorption cross-sections of
+the ExoMol datasets.
+
+The line intensities of all the transitions are streamed chunk by chunk (see the
+`intensities` module) and accumulated onto a fixed uniform wavenumber grid, with each
+line broadened by the line profile evaluated only within a window around the line
+centre. The memory used is therefore bounded by the grid size and by the batch size,
+not by the size of the line list.
+"""
+
+import numpy as np
+
+from .intensities import line_intensities
+
+# Boltzmann constant in J/K:
+K_B = 1.380649e-23
+# atomic mass unit in kg:
+AMU = 1.66053906660e-27
+# speed of light in m/s:
+C_SI = 2.99792458e8
+
+PROFILES = {"histogram", "gaussian", "voigt"}
+
+
+def doppler_hwhm(wavenumbers, temperature, mass):
+    """Doppler (Gaussian) half-widths at half-maximum of lines.
+
+    Parameters
+    ----------
+    wavenumbers : array-like of float
+        Line centres in cm-1.
+    temperature : float
+        Temperature in K.
+    mass : float
+        Molecular mass in Da.
+
+    Returns
+    -------
+    numpy.ndarray
+        Half-widths in cm-1.
+
+    Examples
+    --------
+    >>> doppler_hwhm([2000.0], 296, 28.0).round(6)
+    array([0.002329])
+    """
+    factor = np.sqrt(2 * np.log(2) * K_B * temperature / (mass * AMU)) / C_SI
+    return factor * np.asarray(wavenumbers, dtype="float64")
+
+
+def _gaussian(dx, hwhm):
+    return np.sqrt(np.log(2) / np.pi) / hwhm * np.exp(-np.log(2) * (dx / hwhm) ** 2)
+
+
+def _lorentzian(dx, hwhm):
+    return hwhm / np.pi / (dx**2 + hwhm**2)
+
+
+def _pseudo_voigt(dx, gauss_hwhm, lorentz_hwhm):
+    """Pseudo-Voigt approximation of the Voigt profile (Thompson, Cox and Hastings,
+    J. Appl. Cryst. 20, 79 (1987)), accurate to about 1 %."""
+    f_g, f_l = 2 * gauss_hwhm, 2 * lorentz_hwhm
+    f = (
+        f_g**5
+        + 2.69269 * f_g**4 * f_l
+        + 2.42843 * f_g**3 * f_l**2
+        + 4.47163 * f_g**2 * f_l**3
+        + 0.07842 * f_g * f_l**4
+        + f_l**5
+    ) ** 0.2
+    ratio = f_l / f
+    eta = 1.36603 * ratio - 0.47719 * ratio**2 + 0.11116 * ratio**3
+    return eta * _lorentzian(dx, f / 2) + (1 - eta) * _gaussian(dx, f / 2)
+
+
+def accumulate_lines(
+    sigma,
+    grid_start,
+    grid_step,
+    centres,
+    intensities,
+    profile="histogram",
+    gauss_hwhm=None,
+    lorentz_hwhm=0.0,
+    num_widths=25.0,
+    max_batch_size=2**22,
+):
+    """Accumulate the broadened lines onto the cross-section grid, in place.
+
+    Parameters
+    ----------
+    sigma : numpy.ndarray
+        The cross-section values on the uniform grid, which get incremented.
+    grid_start, grid_step : float
+        The first grid point and the grid spacing, in cm-1.
+    centres, intensities : numpy.ndarray
+        Line centres in cm-1 and line intensities in cm/molecule.
+    profile : {"histogram", "gaussian", "voigt"}, optional
+        With ``"histogram"``, each line is simply added into the grid bin it falls
+        into (the grid points being the bin centres).
+    gauss_hwhm : numpy.ndarray, optional
+        Gaussian half-widths of the lines in cm-1, required for ``"gaussian"`` and
+        ``"voigt"`` profiles.
+    lorentz_hwhm : float or numpy.ndarray, optional
+        Lorentzian half-widths of the lines in cm-1, used by the ``"voigt"`` profile.
+    num_widths : float, optional
+        The profile of each line is only evaluated within `num_widths` of its
+        half-widths from the line centre.
+    max_batch_size : int, optional
+        Maximum number of the profile values (lines times window points) evaluated
+        at once.
+
+    Raises
+    ------
+    ValueError
+        For unknown `profile`, or missing `gauss_hwhm`.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile}', choose from {PROFILES}.")
+    num_points = len(sigma)
+    positions = (np.asarray(centres, dtype="float64") - grid_start) / grid_step
+    intensities = np.asarray(intensities, dtype="float64")
+    if profile == "histogram":
+        bins = np.rint(positions).astype("int64")
+        in_grid = (bins >= 0) & (bins < num_points)
+        sigma += np.bincount(
+            bins[in_grid],
+            weights=intensities[in_grid] / grid_step,
+            minlength=num_points,
+        )
+        return
+    if gauss_hwhm is None:
+        raise ValueError(f"Gaussian half-widths are required for '{profile}'.")
+    gauss_hwhm = np.broadcast_to(gauss_hwhm, positions.shape)
+    lorentz_hwhm = np.broadcast_to(lorentz_hwhm, positions.shape)
+    if profile == "gaussian":
+        total_hwhm = gauss_hwhm
+    else:
+        total_hwhm = gauss_hwhm + lorentz_hwhm
+    half_window = num_widths * total_hwhm / grid_step
+    # lines the windows of which overlap the grid:
+    relevant = (positions + half_window >= 0) & (positions - half_window < num_points)
+    positions, half_window = positions[relevant], half_window[relevant]
+    intensities = intensities[relevant]
+    gauss_hwhm, lorentz_hwhm = gauss_hwhm[relevant], lorentz_hwhm[relevant]
+    # the lines are processed in batches in the order of increasing window widths,
+    # with all the windows in a batch as wide as the window of its last line:
+    order = np.argsort(half_window)
+    window_lens = 2 * np.ceil(half_window[order]).astype("int64") + 1
+    start = 0
+    while start < len(order):
+        stop = start + max(1, max_batch_size // window_lens[start])
+        stop = start + max(1, max_batch_size // window_lens[min(stop, len(order)) - 1])
+        batch = order[start:stop]
+        window_len = window_lens[min(stop, len(order)) - 1]
+        start = stop
+        first = np.ceil(positions[batch] - half_window[batch]).astype("int64")
+        idx = first[:, np.newaxis] + np.arange(window_len)
+        dx = (idx - positions[batch, np.newaxis]) * grid_step
+        within = (
+            (idx >= 0)
+            & (idx < num_points)
+            & (np.abs(dx) <= (half_window[batch] * grid_step)[:, np.newaxis])
+        )
+        if profile == "gaussian":
+            values = _gaussian(dx, gauss_hwhm[batch, np.newaxis])
+        else:
+            values = _pseudo_voigt(
+                dx, gauss_hwhm[batch, np.newaxis], lorentz_hwhm[batch, np.newaxis]
+            )
+        values *= intensities[batch, np.newaxis]
+        sigma += np.bincount(idx[within], weights=values[within], minlength=num_points)
+
+
+def cross_section(
+    def_parser,
+    temperature,
+    wavenumbers,
+    profile="gaussian",
+    lorentz_hwhm=0.0,
+    num_widths=25.0,
+    states_table=None,
+    **trans_kwargs,
+):
+    """Calculate the absorption cross-section of a dataset on a wavenumber grid.
+
+    The transitions are streamed chunk by chunk, and the intensities of the lines
+    (see `intensities.line_intensities`) are accumulated onto the grid, broadened by
+    the selected line `profile`. The Gaussian profile corresponds to the Doppler
+    broadening at the `temperature`, given the molecular mass from the *.def* file.
+    The Voigt profile (approximated by the pseudo-Voigt profile) combines the
+    Doppler broadening with the Lorentzian (pressure) broadening given by
+    `lorentz_hwhm`.
+    The grid spacing needs to resolve the line widths, for the profiles to be
+    sampled faithfully.
+
+    Parameters
+    ----------
+    def_parser : DefParser
+        Parsed *.def* file of the dataset, in the local mode.
+    temperature : float
+        Temperature in K.
+    wavenumbers : array-like of float
+        Uniform grid of wavenumbers in cm-1.
+    profile : {"histogram", "gaussian", "voigt"}, optional
+    lorentz_hwhm : float, optional
+        Lorentzian half-width at half-maximum in cm-1, for the ``"voigt"`` profile.
+    num_widths : float, optional
+        Line profiles are only evaluated within `num_widths` half-widths from the
+        line centres.
+    states_table : StatesTable, optional
+        Passed to the `intensities.line_intensities`.
+    trans_kwargs
+        Passed to the `read_data.trans_chunks`, such as `chunk_size`. Unless passed
+        explicitly, the `wavenumber_range` covering the grid (widened by the line
+        profile windows) is passed, so any *.trans* files split by wavenumber which
+        lie outside the grid are not read at all.
+
+    Returns
+    -------
+    numpy.ndarray
+        The cross-section in cm2/molecule at all the `wavenumbers`.
+
+    Raises
+    ------
+    ValueError
+        If the `wavenumbers` grid is not uniform, or for unknown `profile`.
+
+    Examples
+    --------
+    >>> from exomole.read_def import DefParser
+    >>> parser = DefParser(
+    ...     path="tests/resources/exomol_data/CO/12C-16O/Li2015/12C-16O__Li2015.def"
+    ... )
+    >>> parser.parse(warn_on_comments=False)
+    >>> grid = np.linspace(2172.7, 2172.8, 101)
+    >>> sigma = cross_section(parser, 296, grid, profile="gaussian")
+    >>> float(grid[sigma.argmax()])
+    2172.759
+    """
+    wavenumbers = np.asarray(wavenumbers, dtype="float64")
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile}', choose from {PROFILES}.")
+    steps = np.diff(wavenumbers)
+    if len(wavenumbers) < 2 or not np.allclose(steps, steps[0], rtol=1e-6):
+        raise ValueError("The wavenumbers grid needs to be uniform.")
+    grid_start, grid_step = wavenumbers[0], steps[0]
+    sigma = np.zeros(len(wavenumbers))
+    if profile == "histogram":
+        wing = grid_step / 2
+    else:
+        max_hwhm = doppler_hwhm(wavenumbers[-1], temperature, def_parser.mass)
+        wing = num_widths * (max_hwhm + lorentz_hwhm)
+    trans_kwargs.setdefault(
+        "wavenumber_range", (wavenumbers[0] - wing, wavenumbers[-1] + wing)
+    )
+    label = f"S_{temperature:g}"
+    chunks = line_intensities(
+        def_parser, [temperature], states_table=states_table, **trans_kwargs
+    )
+    for chunk in chunks:
+        centres = chunk["v_if"].to_numpy()
+        gauss_hwhm = None
+        if profile != "histogram":
+            gauss_hwhm = doppler_hwhm(centres, temperature, def_parser.mass)
+        accumulate_lines(
+            sigma,
+            grid_start,
+            grid_step,
+            centres,
+            chunk[label].to_numpy(),
+            profile=profile,
+            gauss_hwhm=gauss_hwhm,
+            lorentz_hwhm=lorentz_hwhm,
+            num_widths=num_widths,
+        )
+    return sigma
@@ -0,0 +1,206 @@
+"""Module containing the cursors of the scans over the ExoMol data files.
+
+A `ScanCursor` passed to the `read_data.trans_chunks` (or `read_data.states_chunks`)
+reader is updated with every chunk yielded, to point just past the rows of the
+chunk, as the index of the data file and the number of its rows already read, and
+as the location of the next row in the file: the start bit of the *bz2* block holding
+it, and the number of the lines of the block before it (see
+`bz2_blocks.RowTracker`).
+The cursor can be saved at any chunk boundary, and passed to the same reader after a
+crash, to resume the scan from where it stopped. The files before the cursor are
+skipped altogether, and a *.bz2* file is decompressed only from the block holding
+the next row, with no need to index the file first (see
+`bz2_blocks.open_data_file`).
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+class ScanCursor:
+    """Position of a scan over the data files, resumable after a crash.
+
+    Parameters
+    ----------
+    file_index : int, optional
+        Index of the data file to read next, out of all the files scanned (the
+        sorted *.trans* files, after the `wavenumber_range` applied).
+    row : int, optional
+        Number of the rows of that file already read.
+    file_name : str, optional
+        Name of that file, checked when resuming.
+    block_start_bit : int, optional
+        Bit offset of the start of the *bz2* block holding the `row` (or of a piece
+        of an uncompressed file), if known.
+    block_lines : int, optional
+        Number of the lines of that block before the `row`.
+
+    Examples
+    --------
+    >>> from pathlib import Path
+    >>> from exomole.read_data import trans_chunks
+    >>> tr_paths = sorted(Path("tests/resources").glob("*.trans*0*.bz2"))
+    >>> cursor = ScanCursor()
+    >>> for chunk in trans_chunks(tr_paths, chunk_size=4, cursor=cursor):
+    ...     break  # a crash!
+    >>> cursor.file_index, cursor.row, cursor.block_start_bit, cursor.block_lines
+    (0, 4, 32, 4)
+    >>> saved = cursor.to_json()
+
+    Resume the scan:
+    >>> cursor = ScanCursor.from_json(saved)
+    >>> for chunk in trans_chunks(tr_paths, chunk_size=4, cursor=cursor):
+    ...     print(len(chunk), cursor.file_index, cursor.row)
+    1 0 5
+    4 1 4
+    1 1 5
+    4 2 4
+    1 2 5
+    >>> cursor
+    ScanCursor(file_index=3, row=0, file_name=None, block_start_bit=None, block_lines=0)
+    """
+
+    def __init__(
+        self, file_index=0, row=0, file_name=None, block_start_bit=None, block_lines=0
+    ):
+        self.file_index = file_index
+        self.row = row
+        self.file_name = file_name
+        self.block_start_bit = block_start_bit
+        self.block_lines = block_lines
+
+    def __repr__(self):
+        attrs_str = ", ".join(f"{attr}={val!r}" for attr, val in vars(self).items())
+        return f"{self.__class__.__name__}({attrs_str})"
+
+    def __eq__(self, other):
+        return isinstance(other, ScanCursor) and vars(self) == vars(other)
+
+    def to_dict(self):
+        """The cursor as a JSON-serialisable dictionary.
+
+        Returns
+        -------
+        dict
+        """
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Re-create the cursor from the dictionary returned by `to_dict`.
+
+        Parameters
+        ----------
+        data : dict
+
+        Returns
+        -------
+        ScanCursor
+        """
+        return cls(**data)
+
+    def to_json(self):
+        """The cursor serialised into a JSON string.
+
+        Returns
+        -------
+        str
+        """
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, text):
+        """Re-create the cursor from the JSON string returned by `to_json`.
+
+        Parameters
+        ----------
+        text : str
+
+        Returns
+        -------
+        ScanCursor
+        """
+        return cls.from_dict(json.loads(text))
+
+    def save(self, path):
+        """Save the cursor into a JSON file.
+
+        The file is replaced atomically, so a crash while saving leaves the
+        previously saved cursor intact.
+
+        Parameters
+        ----------
+        path : str or Path
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.to_json())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load the cursor saved by `save`.
+
+        Parameters
+        ----------
+        path : str or Path
+
+        Returns
+        -------
+        ScanCursor
+        """
+        return cls.from_json(Path(path).read_text())
+
+    def check(self, file_paths):
+        """Check that the cursor points into the `file_paths` scanned.
+
+        Parameters
+        ----------
+        file_paths : list of (str or Path)
+
+        Raises
+        ------
+        ValueError
+            If the cursor points to a file other than the one it was saved for, or
+            to a position out of the `file_paths`.
+        """
+        if (
+            self.file_index < 0
+            or self.row < 0
+            or self.block_lines < 0
+            or self.file_index > len(file_paths)
+        ):
+            raise ValueError(f"{self!r} out of the {len(file_paths)} files scanned.")
+        if self.file_index < len(file_paths) and self.file_name is not None:
+            file_name = Path(file_paths[self.file_index]).name
+            if file_name != self.file_name:
+                raise ValueError(f"{self!r} does not point to {file_name}.")
+
+    @property
+    def start_block(self):
+        """The ``(start_bit, num_lines)`` location of the `row` in the file, or
+        ``None`` if not known (see `bz2_blocks.open_data_file`)."""
+        if self.block_start_bit is None:
+            return None
+        return self.block_start_bit, self.block_lines
+
+    def advance(self, file_paths, file_index, row=0, start_block=None):
+        """Move the cursor to the `row` of the file under the `file_index`.
+
+        Parameters
+        ----------
+        file_paths : list of (str or Path)
+            All the files scanned.
+        file_index : int
+        row : int, optional
+        start_block : tuple of int, optional
+            The ``(start_bit, num_lines)`` location of the `row` in the file, as
+            returned by `bz2_blocks.RowTracker.locate`.
+        """
+        self.file_index = file_index
+        self.row = row
+        self.file_name = None
+        if file_index < len(file_paths):
+            self.file_name = Path(file_paths[file_index]).name
+        self.block_start_bit, self.block_lines = start_block or (None, 0)
@@ -0,0 +1,550 @@
+"""Module containing the lazy query interface to the ExoMol datasets.
+
+A `Dataset` ties together the parsed *.def* file of a dataset with its *.states* and
+*.trans* files. Its `Dataset.states` and `Dataset.transitions` methods return lazy
+queries, built up by chaining the ``filter``, ``select`` and ``join_states`` methods,
+and only executed by ``chunks`` or ``collect``. Before being executed, each query is
+turned into a plan, which
+
+- pushes the filters and the columns needed down into the readers,
+- turns the filters on the states columns joined onto the transitions (such as
+  ``("E_f", "<", 1000)``) into dense masks over the state IDs, evaluated once on the
+  states, and only looked up by the state IDs of each *.trans* chunk,
+- skips the *.trans* files lying outside the wavenumber range implied by the
+  ``"v_if"`` filters,
+- only reads the *.states* columns needed for the join,
+- decides between reading several *.trans* files in parallel and decompressing a
+  single file in parallel.
+
+The plan can be inspected with ``explain``.
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas
+
+from .filters import filter_dataframe, filter_mask, validate_filters
+from .intensities import get_states_table
+from .read_data import states_chunks, trans_chunks
+from .states_table import join_states
+from .utils import filter_trans_paths, get_num_columns
+
+_SIDES = ("i", "f")
+
+
+class Dataset:
+    """An ExoMol dataset, with lazy queries over its *.states* and *.trans* files.
+
+    Parameters
+    ----------
+    def_parser : DefParser
+        The *.def* file of the dataset, in the local mode. Gets parsed if not parsed
+        yet.
+    chunk_size : int, optional
+        Passed to the readers, see `read_data.states_chunks` and
+        `read_data.trans_chunks`. The readers' defaults are used otherwise.
+    num_workers : int, optional
+        If passed, up to `num_workers` processes are used for reading the data files,
+        either reading several *.trans* files at once, or decompressing a single
+        *.bz2* file block by block.
+    cache_dir : str or Path, optional
+        Passed to the readers, see the `exomole.cache` module.
+    backend : {"pandas", "numpy"}, optional
+        The parser backend of the readers.
+    memory_budget : int or str, optional
+        Passed to the readers, see the `exomole.memory` module.
+
+    Examples
+    --------
+    >>> from exomole.read_def import DefParser
+    >>> parser = DefParser(
+    ...     path="tests/resources/exomol_data/CO/12C-16O/Li2015/12C-16O__Li2015.def"
+    ... )
+    >>> ds = Dataset(parser)
+    >>> query = (
+    ...     ds.transitions()
+    ...     .filter("v_if", "<", 20)
+    ...     .join_states(["E", "J"])
+    ...     .filter("E_f", "<", 20)
+    ...     .select(["v_if", "E_i", "J_i", "J_f"])
+    ... )
+    >>> query.collect()
+            v_if      E_i  J_i  J_f
+    0   3.845033   3.8450  1.0  0.0
+    1   7.689919  11.5350  2.0  1.0
+    2  11.534511  23.0695  3.0  2.0
+    >>> print(query.explain())
+    TransQuery over Dataset(12C-16O__Li2015):
+      trans files: 1 of 1 in (None, 20)
+      trans filters: [('v_if', '<', 20)]
+      state ID filters: {'f': [('E', '<', 20)]}
+      states columns: ['E', 'J']
+      post-join filters: []
+      output columns: ['v_if', 'E_i', 'J_i', 'J_f']
+      parallel: none
+    """
+
+    def __init__(
+        self,
+        def_parser,
+        chunk_size=None,
+        num_workers=None,
+        cache_dir=None,
+        backend="pandas",
+        memory_budget=None,
+    ):
+        if not def_parser.parsed:
+            def_parser.parse(warn_on_comments=False)
+        self.def_parser = def_parser
+        self.chunk_size = chunk_size
+        self.num_workers = num_workers
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.memory_budget = memory_budget
+        self._trans_columns = None
+        self._states_table = None
+
+    def __repr__(self):
+        return f"Dataset({self.def_parser.file_name[:-4]})"
+
+    @property
+    def states_columns(self):
+        """Names of all the columns of the *.states* file."""
+        return self.def_parser.get_states_header()
+
+    @property
+    def trans_columns(self):
+        """Names of all the columns of the *.trans* files."""
+        if self._trans_columns is None:
+            trans_paths = self.def_parser.get_trans_paths()
+            num_cols = get_num_columns(trans_paths[0]) if trans_paths else 4
+            self._trans_columns = ["i", "f", "A_if", "v_if"][: max(num_cols, 3)]
+        return list(self._trans_columns)
+
+    def states(self):
+        """Start a lazy query over the states of the dataset.
+
+        Returns
+        -------
+        StatesQuery
+        """
+        return StatesQuery(self)
+
+    def transitions(self):
+        """Start a lazy query over the transitions of the dataset.
+
+        Returns
+        -------
+        TransQuery
+        """
+        return TransQuery(self)
+
+    def _reader_kwargs(self, file_paths=()):
+        """Keyword arguments shared by the readers, with the `num_workers` for the
+        block-parallel decompression if worth it for the `file_paths` read."""
+        kwargs = {
+            "cache_dir": self.cache_dir,
+            "backend": self.backend,
+            "memory_budget": self.memory_budget,
+        }
+        if self.chunk_size is not None:
+            kwargs["chunk_size"] = self.chunk_size
+        if _decompressed_in_parallel(self.num_workers, file_paths):
+            kwargs["num_workers"] = self.num_workers
+        return kwargs
+
+    def get_states_table(self, columns):
+        """Get the `StatesTable` with (at least) the `columns` of the states.
+
+        The table is kept and re-used by all the following queries, as long as it
+        holds all the columns needed.
+
+        Parameters
+        ----------
+        columns : iterable of str
+
+        Returns
+        -------
+        StatesTable
+        """
+        columns = list(columns)
+        table = self._states_table
+        if table is None or not set(columns).issubset(table.columns):
+            if table is not None:
+                columns += [col for col in table.columns if col not in columns]
+            states_path = self.def_parser.get_states_path()
+            table = get_states_table(
+                self.def_parser, columns, **self._reader_kwargs([states_path])
+            )
+            self._states_table = table
+        return table
+
+
+def _decompressed_in_parallel(num_workers, file_paths):
+    """Whether a single *.bz2* file is read, worth decompressing in parallel."""
+    return (
+        num_workers is not None
+        and len(file_paths) == 1
+        and str(file_paths[0]).endswith(".bz2")
+    )
+
+
+class _Query(ABC):
+    """Base class of the lazy queries, each method returning a new query."""
+
+    def __init__(self, dataset, filters=(), columns=None):
+        self.dataset = dataset
+        self.filters = list(filters)
+        self.columns = None if columns is None else list(columns)
+
+    def _replace(self, **changes):
+        attrs = {**vars(self), **changes}
+        query = self.__class__.__new__(self.__class__)
+        query.__dict__.update(attrs)
+        return query
+
+    def filter(self, column, op, value):
+        """Keep only the rows satisfying the ``(column, op, value)`` filter.
+
+        See the `exomole.filters` module for the operators supported. Chaining
+        several filters keeps only the rows satisfying all of them.
+
+        Parameters
+        ----------
+        column : str
+        op : str
+        value : object
+
+        Returns
+        -------
+        _Query
+            The new query.
+        """
+        return self._replace(filters=self.filters + [(column, op, value)])
+
+    def select(self, columns):
+        """Keep only the `columns`, in the order passed.
+
+        Parameters
+        ----------
+        columns : list of str
+
+        Returns
+        -------
+        _Query
+            The new query.
+        """
+        return self._replace(columns=list(columns))
+
+    @abstractmethod
+    def chunks(self):
+        """Execute the query, generating the results chunk by chunk.
+
+        Yields
+        ------
+        pandas.DataFrame
+
+        Raises
+        ------
+        ValueError
+            If any of the filters is invalid, or if any of the columns referred to
+            is not available.
+        """
+
+    def __iter__(self):
+        return self.chunks()
+
+    @abstractmethod
+    def collect(self):
+        """Execute the query, concatenating all the results into a single frame.
+
+        Returns
+        -------
+        pandas.DataFrame
+
+        Raises
+        ------
+        ValueError
+            If any of the filters is invalid, or if any of the columns referred to
+            is not available.
+        """
+
+    @abstractmethod
+    def plan(self):
+        """The optimised plan of executing the query.
+
+        Returns
+        -------
+        dict
+
+        Raises
+        ------
+        ValueError
+            If any of the filters is invalid, or if any of the columns referred to
+            is not available.
+        """
+
+    def explain(self):
+        """Human-readable description of the `plan` of the query.
+
+        Returns
+        -------
+        str
+        """
+        lines = [f"{self.__class__.__name__} over {self.dataset!r}:"]
+        lines.extend(f"  {step}: {value}" for step, value in self.plan().items())
+        return "\n".join(lines)
+
+
+def _check_columns(columns, available):
+    """Raise ValueError if any of the `columns` is not among the `available`."""
+    missing = [col for col in columns if col not in available]
+    if missing:
+        raise ValueError(f"Columns {missing} not available, choose from {available}.")
+
+
+class StatesQuery(_Query):
+    """Lazy query over the *.states* file of a dataset, see `Dataset.states`.
+
+    The filters and the columns selected are passed down to the
+    `read_data.states_chunks` reader, so the rows and the columns not needed are
+    never converted into the chunks. The chunks are indexed by the state IDs.
+    """
+
+    def plan(self):
+        ds = self.dataset
+        columns = ds.states_columns
+        filters = validate_filters(self.filters, columns)
+        if self.columns is not None:
+            _check_columns(self.columns, columns[1:])
+        states_path = ds.def_parser.get_states_path()
+        return {
+            "states file": states_path.name,
+            "states filters": filters,
+            "states columns": self.columns or columns[1:],
+            "parallel": _describe_parallel(ds.num_workers, [states_path], None),
+        }
+
+    def chunks(self):
+        ds = self.dataset
+        plan = self.plan()
+        states_path = ds.def_parser.get_states_path()
+        yield from states_chunks(
+            states_path,
+            columns=ds.states_columns,
+            dtypes=ds.def_parser.get_states_dtypes(),
+            filters=plan["states filters"],
+            columns_to_read=self.columns,
+            **ds._reader_kwargs([states_path]),
+        )
+
+    def collect(self):
+        chunks = list(self.chunks())
+        if not chunks:
+            columns = self.plan()["states columns"]
+            return pandas.DataFrame(columns=columns, index=pandas.Index([], "int64"))
+        return pandas.concat(chunks)
+
+
+class TransQuery(_Query):
+    """Lazy query over the *.trans* files of a dataset, see `Dataset.transitions`.
+
+    Besides the *.trans* columns (``"i"``, ``"f"``, ``"A_if"`` and ``"v_if"``), the
+    queries can refer to the columns of the upper and lower states, named
+    ``"<column>_i"`` and ``"<column>_f"``, such as ``"E_f"`` or ``"J_i"``. These are
+    looked up in a `StatesTable` of the dataset, which only holds the states columns
+    needed. The ``"v_if"`` wavenumbers missing from the *.trans* files are calculated
+    from the state energies.
+    """
+
+    def __init__(self, dataset, filters=(), columns=None, joined=()):
+        super().__init__(dataset, filters, columns)
+        self.joined = list(joined)
+
+    def join_states(self, columns):
+        """Join the `columns` of the upper and lower states onto the transitions.
+
+        The columns joined are named ``"<column>_i"`` and ``"<column>_f"``.
+
+        Parameters
+        ----------
+        columns : list of str
+            Any of the *.states* columns, other than ``"i"``.
+
+        Returns
+        -------
+        TransQuery
+            The new query.
+        """
+        joined = self.joined + [col for col in columns if col not in self.joined]
+        return self._replace(joined=joined)
+
+    def _available_columns(self):
+        ds = self.dataset
+        columns = ["i", "f", "A_if", "v_if"]
+        for col in ds.states_columns[1:]:
+            columns.extend(f"{col}_{side}" for side in _SIDES)
+        return columns
+
+    def _output_columns(self):
+        if self.columns is not None:
+            return self.columns
+        output = self.dataset.trans_columns
+        for col in self.joined:
+            output.extend(f"{col}_{side}" for side in _SIDES)
+        return output
+
+    def plan(self):
+        ds = self.dataset
+        available = self._available_columns()
+        _check_columns([f"{col}_i" for col in self.joined], available)
+        output = self._output_columns()
+        _check_columns(output, available)
+        filters = validate_filters(self.filters, available)
+        trans_columns = ds.trans_columns
+
+        trans_filters, states_filters, post_filters = [], {}, []
+        for column, op, value in filters:
+            state_col, _, side = column.rpartition("_")
+            if column in trans_columns:
+                trans_filters.append((column, op, value))
+            elif column == "v_if":
+                # calculated from the energies only after the join:
+                post_filters.append((column, op, value))
+            else:
+                states_filters.setdefault(side, []).append((state_col, op, value))
+
+        all_trans_paths = ds.def_parser.get_trans_paths()
+        wavenumber_range = _get_wavenumber_range(filters)
+        trans_paths = all_trans_paths
+        if wavenumber_range is not None:
+            trans_paths = filter_trans_paths(all_trans_paths, wavenumber_range)
+
+        joined_output = [col for col in output if col not in trans_columns]
+        states_columns = []
+        for column in joined_output + [col for col, _, _ in post_filters]:
+            state_col = "E" if column == "v_if" else column.rpartition("_")[0]
+            if state_col not in states_columns:
+                states_columns.append(state_col)
+        for side_filters in states_filters.values():
+            for state_col, _, _ in side_filters:
+                if state_col not in states_columns:
+                    states_columns.append(state_col)
+        if "v_if" in joined_output + [col for col, _, _ in post_filters]:
+            _check_columns(["E"], ds.states_columns)
+
+        file_workers = None
+        if ds.num_workers is not None and len(trans_paths) > 1:
+            file_workers = min(ds.num_workers, len(trans_paths))
+        return {
+            "trans files": (
+                f"{len(trans_paths)} of {len(all_trans_paths)}"
+                + ("" if wavenumber_range is None else f" in {wavenumber_range}")
+            ),
+            "trans filters": trans_filters,
+            "state ID filters": {
+                side: states_filters[side] for side in _SIDES if side in states_filters
+            },
+            "states columns": states_columns,
+            "post-join filters": post_filters,
+            "output columns": output,
+            "parallel": _describe_parallel(ds.num_workers, trans_paths, file_workers),
+            # not described, only needed for the execution:
+            "_trans_paths": trans_paths,
+            "_file_workers": file_workers,
+        }
+
+    def explain(self):
+        lines = super().explain().splitlines()
+        return "\n".join(line for line in lines if not line.startswith("  _"))
+
+    def chunks(self):
+        ds = self.dataset
+        plan = self.plan()
+        output = plan["output columns"]
+        table = None
+        if plan["states columns"]:
+            table = ds.get_states_table(plan["states columns"])
+        state_masks = {
+            side: _get_state_mask(table, side_filters)
+            for side, side_filters in plan["state ID filters"].items()
+        }
+        chunks = trans_chunks(
+            plan["_trans_paths"],
+            filters=plan["trans filters"],
+            num_file_workers=plan["_file_workers"],
+            **ds._reader_kwargs(plan["_trans_paths"]),
+        )
+        if state_masks:
+            chunks = _masked_chunks(chunks, table, state_masks)
+        post_filters = plan["post-join filters"]
+        needed = list(output)
+        for column, _, _ in post_filters:
+            if column not in needed:
+                needed.append(column)
+        if any(col not in ds.trans_columns for col in needed):
+            chunks = join_states(chunks, table, columns=needed)
+        for chunk in chunks:
+            chunk = filter_dataframe(chunk, post_filters)
+            if list(chunk.columns) != output:
+                chunk = chunk[output]
+            yield chunk
+
+    def collect(self):
+        chunks = list(self.chunks())
+        if not chunks:
+            return pandas.DataFrame(columns=self.plan()["output columns"])
+        return pandas.concat(chunks, ignore_index=True)
+
+
+def _get_wavenumber_range(filters):
+    """The ``(lower, upper)`` wavenumber range implied by the ``"v_if"`` filters, or
+    ``None`` if the wavenumbers are not filtered."""
+    lower, upper = None, None
+    for column, op, value in filters:
+        if column != "v_if" or op in {"!=", "not in"}:
+            continue
+        values = value if op == "in" else [value]
+        if not values:
+            continue
+        if op in {">", ">=", "==", "in"}:
+            lower = max(min(values), -np.inf if lower is None else lower)
+        if op in {"<", "<=", "==", "in"}:
+            upper = min(max(values), np.inf if upper is None else upper)
+    if lower is None and upper is None:
+        return None
+    return lower, upper
+
+
+def _get_state_mask(table, filters):
+    """Dense mask of the states in the `table` satisfying all the states `filters`,
+    indexed by the state IDs."""
+
+    def get_values(column):
+        values = table[column]
+        if column in table.categories:
+            # the missing values (code -1) are mapped to the last, None category:
+            values = np.array(table.categories[column] + [None], dtype=object)[values]
+        return values
+
+    return filter_mask(get_values, filters, len(table.present)) & table.present
+
+
+def _masked_chunks(trans_chunks, table, state_masks):
+    """Generator of the `trans_chunks` with only the transitions between the states
+    of the `state_masks` (keyed by the ``"i"`` and ``"f"`` sides) kept."""
+    for chunk in trans_chunks:
+        keep = np.ones(len(chunk), dtype=bool)
+        for side, mask in state_masks.items():
+            keep &= mask[table.validate_ids(chunk[side].to_numpy())]
+        yield chunk if keep.all() else chunk[keep]
+
+
+def _describe_parallel(num_workers, file_paths, file_workers):
+    """Description of the parallelism chosen for reading the `file_paths`."""
+    if file_workers is not None:
+        return f"{file_workers} files read at once"
+    if _decompressed_in_parallel(num_workers, file_paths):
+        return f"decompressed over {num_workers} workers"
+    return "none"
@@ -45,3 +45,15 @@ class StatesParseError(DataParseError):
 
 class TransParseError(DataParseError):
     pass
+
+
+class StatesLookupError(Exception):
+    pass
+
+
+class TemperatureWarning(UserWarning):
+    pass
+
+
+class BlockIndexWarning(UserWarning):
+    pass
@@ -0,0 +1,188 @@
+"""Module containing functionality for filtering the rows of the ExoMol data files
+while they are being read.
+
+The filters are passed to the readers as a list of ``(column, operator, value)``
+tuples, such as ``[("E", "<", 20000), ("J", "<=", 50)]``, and a row is kept only if
+it satisfies all of them. The supported operators are ``"<"``, ``"<="``, ``">"``,
+``">="``, ``"=="``, ``"!="``, ``"in"`` and ``"not in"`` (the last two with any
+collection of values).
+The filters are evaluated on the raw column arrays, either of the columns parsed by
+the fixed-width ``"numpy"`` parser backend, of the columns filtered on parsed first
+out of each chunk of lines by the ``"pandas"`` parser backend, or of the *Arrow*
+record batches read from the cache, so the rows rejected are never built into any
+chunk at all. Only with no column names known does the ``"pandas"`` backend fall
+back to filtering each chunk after parsing it.
+"""
+
+import numbers
+import operator
+
+import numpy as np
+
+_COMPARISONS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+_ARROW_COMPARISONS = {
+    "<": "less",
+    "<=": "less_equal",
+    ">": "greater",
+    ">=": "greater_equal",
+    "==": "equal",
+    "!=": "not_equal",
+}
+OPERATORS = set(_COMPARISONS) | {"in", "not in"}
+
+
+def validate_filters(filters, columns):
+    """Check the `filters` passed and normalise them into a list of tuples.
+
+    Parameters
+    ----------
+    filters : iterable of tuple
+        The ``(column, operator, value)`` filters.
+    columns : iterable of str
+        All the columns available for filtering.
+
+    Returns
+    -------
+    list of tuple
+
+    Raises
+    ------
+    ValueError
+        If any of the filters is not a valid ``(column, operator, value)`` tuple, or
+        if it refers to a column not available.
+    """
+    validated = []
+    for filter_ in filters:
+        try:
+            column, op, value = filter_
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid filter: {filter_!r}")
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown filter operator '{op}', choose from {OPERATORS}")
+        if column not in columns:
+            raise ValueError(f"Cannot filter on column {column}, not available!")
+        if op in {"in", "not in"}:
+            value = list(value)
+        validated.append((column, op, value))
+    return validated
+
+
+def _is_numeric(op, value):
+    values = value if op in {"in", "not in"} else [value]
+    return bool(values) and all(
+        isinstance(val, numbers.Number) and not isinstance(val, bool) for val in values
+    )
+
+
+def filter_mask(get_values, filters, num_rows):
+    """Evaluate the `filters` into a mask of the rows kept.
+
+    Parameters
+    ----------
+    get_values : callable
+        Called with a column name to get the `numpy` array of the column values.
+        Only called for the columns filtered on, and only as long as any rows remain.
+    filters : list of tuple
+        The validated ``(column, operator, value)`` filters.
+    num_rows : int
+
+    Returns
+    -------
+    numpy.ndarray of bool
+
+    Examples
+    --------
+    >>> data = {"E": np.array([0.0, 1e3, 3e4]), "J": np.array(["0", "1", "2"])}
+    >>> filter_mask(data.get, [("E", "<", 2e4), ("J", "in", [1, 2])], 3)
+    array([False,  True, False])
+    """
+    mask = np.ones(num_rows, dtype=bool)
+    for column, op, value in filters:
+        if not mask.any():
+            break
+        values = np.asarray(get_values(column))
+        if values.dtype.kind in "OSU" and _is_numeric(op, value):
+            # the columns parsed as strings are only converted for the comparison:
+            values = values.astype("float64")
+        if op == "in":
+            mask &= np.isin(values, value)
+        elif op == "not in":
+            mask &= ~np.isin(values, value)
+        else:
+            mask &= _COMPARISONS[op](values, value)
+    return mask
+
+
+def filter_dataframe(chunk, filters, index_col=None):
+    """Filter the rows of a `pandas.DataFrame` chunk.
+
+    Parameters
+    ----------
+    chunk : pandas.DataFrame
+    filters : list of tuple
+        The validated ``(column, operator, value)`` filters.
+    index_col : str, optional
+        Name under which the filters refer to the chunk index.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows of the `chunk` satisfying all the `filters`, with the original index.
+    """
+    if not filters:
+        return chunk
+
+    def get_values(column):
+        if column == index_col:
+            return chunk.index.to_numpy()
+        return chunk[column].to_numpy()
+
+    mask = filter_mask(get_values, filters, len(chunk))
+    return chunk if mask.all() else chunk[mask]
+
+
+def filter_record_batch(batch, filters):
+    """Filter the rows of a `pyarrow.RecordBatch`, before any conversion to `pandas`.
+
+    Parameters
+    ----------
+    batch : pyarrow.RecordBatch
+    filters : list of tuple
+        The validated ``(column, operator, value)`` filters.
+
+    Returns
+    -------
+    pyarrow.RecordBatch
+    """
+    import pyarrow
+    import pyarrow.compute
+
+    if not filters:
+        return batch
+    mask = None
+    for column, op, value in filters:
+        values = batch.column(column)
+        if pyarrow.types.is_dictionary(values.type):
+            values = values.dictionary_decode()
+        if pyarrow.types.is_string(values.type) and _is_numeric(op, value):
+            values = pyarrow.compute.cast(values, pyarrow.float64())
+        if op in {"in", "not in"}:
+            value_set = pyarrow.array(value).cast(values.type)
+            column_mask = pyarrow.compute.is_in(values, value_set=value_set)
+            if op == "not in":
+                column_mask = pyarrow.compute.invert(column_mask)
+        else:
+            compare = getattr(pyarrow.compute, _ARROW_COMPARISONS[op])
+            column_mask = compare(values, value)
+        if mask is None:
+            mask = column_mask
+        else:
+            mask = pyarrow.compute.and_(mask, column_mask)
+    return batch.filter(mask)
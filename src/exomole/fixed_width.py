@@ -0,0 +1,504 @@
+"""Module containing the fixed-width parser backend for the ExoMol data files.
+
+The ExoMol *.states* and *.trans* files are fixed-width: all the lines of a file have
+the same length, and each column occupies the same character positions in every
+line. Each chunk of a file can therefore be read as a single byte buffer, viewed as a
+2-D `numpy` array of characters (one row per line), and every column sliced out of
+it with no splitting of lines into tokens.
+The numeric columns are then converted from the digits by vectorised arithmetic,
+while the string and categorical columns are only decoded for their unique values.
+
+The column positions are determined from the first chunk of each file, as the runs
+of character positions which are not blank in all the lines. Each column is taken to
+extend leftwards up to the previous column, so the right-aligned values (such as
+negative numbers) can grow in the subsequent chunks.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas
+
+from .arrow import to_record_batch
+from .bz2_blocks import open_data_file
+from .exceptions import DataParseError
+from .filters import filter_mask
+
+_NEWLINE, _RETURN, _SPACE, _PLUS, _MINUS, _DOT, _DIGIT_0 = 10, 13, 32, 43, 45, 46, 48
+# the exponent characters, including the Fortran double precision ones:
+_EXPONENTS = np.frombuffer(b"EeDd", dtype="uint8")
+_FORTRAN_EXPONENTS = _EXPONENTS[2:]
+# maximum numbers of digits converted exactly to float64 and int64:
+_MAX_FLOAT_DIGITS, _MAX_INT_DIGITS = 15, 18
+# powers of 10 exactly representable as float64:
+_MAX_EXACT_POW10 = 22
+# number of rows converted at once, to keep the temporary arrays small:
+_BLOCK_ROWS = 2**16
+
+
+def _is_blank(chars):
+    return chars == _SPACE
+
+
+def _as_strings(chars):
+    """View the `chars` (2-D array of bytes) as a 1-D array of byte strings."""
+    return np.ascontiguousarray(chars).view(f"S{chars.shape[1]}").ravel()
+
+
+def _to_floats(chars):
+    """Convert the `chars` by `numpy`, with the Fortran exponents replaced."""
+    is_fortran = (chars == _FORTRAN_EXPONENTS[0]) | (chars == _FORTRAN_EXPONENTS[1])
+    if is_fortran.any():
+        chars = np.where(is_fortran, _EXPONENTS[0], chars)
+    return _as_strings(chars).astype("float64")
+
+
+def _trim(chars):
+    """Contiguous copy of the `chars`, with the leading columns blank in all the rows
+    dropped."""
+    start = 0
+    while start < chars.shape[1] and _is_blank(chars[:, start]).all():
+        start += 1
+    return np.ascontiguousarray(chars[:, start:])
+
+
+def _digits(chars):
+    """Values of all the `chars` as digits, and the mask of the actual digits."""
+    digits = chars - np.uint8(_DIGIT_0)
+    return digits, digits <= 9
+
+
+def _is_right_aligned(chars, is_digit):
+    """Check that all the rows of the `chars` are right-aligned integers, consisting of
+    the blank padding, an optional sign, and digits."""
+    if not chars.shape[1]:
+        return False
+    is_blank = _is_blank(chars)
+    is_sign = (chars == _MINUS) | (chars == _PLUS)
+    return bool(
+        is_digit[:, -1].all()
+        and (is_digit | is_blank | is_sign).all()
+        # anything but blanks followed only by digits:
+        and not (~is_blank[:, :-1] & ~is_digit[:, 1:]).any()
+    )
+
+
+def _digits_value(digits, is_digit, dtype, skip_col=None):
+    """Values of the right-aligned `digits`, ignoring any other characters (validated
+    before), and the whole `skip_col` column."""
+    num_rows, width = digits.shape
+    if width > _MAX_FLOAT_DIGITS:
+        values = np.zeros(num_rows, dtype="int64")
+        for col in range(width):
+            values *= 10
+            values += digits[:, col] * is_digit[:, col]
+        return values.astype(dtype, copy=False)
+    # exact up to the _MAX_FLOAT_DIGITS, and with the matrix products much faster:
+    powers = np.arange(width - 1, -1, -1)
+    if skip_col is not None:
+        powers[:skip_col] -= 1
+    weights = 10.0**powers
+    if skip_col is not None:
+        weights[skip_col] = 0
+    values = np.empty(num_rows)
+    for start in range(0, num_rows, _BLOCK_ROWS):
+        block = slice(start, start + _BLOCK_ROWS)
+        values[block] = (digits[block] * is_digit[block]).astype("float64") @ weights
+    return values.astype(dtype, copy=False)
+
+
+def _with_signs(values, chars):
+    is_minus = chars == _MINUS
+    if is_minus.any():
+        values = np.where(is_minus.any(axis=1), -values, values)
+    return values
+
+
+def parse_ints(chars):
+    """Parse a column of right-aligned integers.
+
+    Parameters
+    ----------
+    chars : numpy.ndarray
+        2-D ``uint8`` array of the column characters, one row per line.
+
+    Returns
+    -------
+    numpy.ndarray of int64
+
+    Raises
+    ------
+    ValueError
+        If any of the values is not an integer.
+
+    Examples
+    --------
+    >>> chars = np.frombuffer(b"  12  -7 305", dtype="uint8").reshape(3, -1)
+    >>> parse_ints(chars)
+    array([ 12,  -7, 305])
+    """
+    chars = _trim(chars)
+    digits, is_digit = _digits(chars)
+    if chars.shape[1] > _MAX_INT_DIGITS or not _is_right_aligned(chars, is_digit):
+        # irregular values are left to the (slower) numpy conversion:
+        return _as_strings(chars).astype("int64")
+    return _with_signs(_digits_value(digits, is_digit, "int64"), chars)
+
+
+def parse_floats(chars):
+    """Parse a column of right-aligned floating-point numbers.
+
+    The fast path requires the decimal point and the exponent character (if any) to
+    be in the same position in all the rows, as given by a fixed-width format.
+    The numbers are then assembled from their integer mantissas and decimal
+    exponents, which gives the correctly rounded values for the mantissas up to 15
+    digits and the decimal exponents up to 22. Any other values are converted by
+    `numpy`.
+
+    Parameters
+    ----------
+    chars : numpy.ndarray
+        2-D ``uint8`` array of the column characters, one row per line.
+
+    Returns
+    -------
+    numpy.ndarray of float64
+
+    Raises
+    ------
+    ValueError
+        If any of the values is not a number.
+
+    Examples
+    --------
+    >>> chars = np.frombuffer(b" 1.1550E-06-2.0000E+00 3.0000e+03", dtype="uint8")
+    >>> parse_floats(chars.reshape(3, -1))
+    array([ 1.155e-06, -2.000e+00,  3.000e+03])
+    """
+    chars = _trim(chars)
+    num_rows, width = chars.shape
+    if not num_rows:
+        return np.empty(0)
+    # the layout is taken from the first row, and validated for all the rows:
+    exponent_cols = np.flatnonzero(np.isin(chars[0], _EXPONENTS))
+    exponent_col = exponent_cols[0] if len(exponent_cols) else width
+    dot_cols = np.flatnonzero(chars[0, :exponent_col] == _DOT)
+    dot_col = dot_cols[0] if len(dot_cols) else None
+    digits, is_digit = _digits(chars)
+    regular = (
+        len(exponent_cols) <= 1
+        and len(dot_cols) <= 1
+        and exponent_col - len(dot_cols) <= _MAX_FLOAT_DIGITS
+    )
+    if regular and dot_col is not None:
+        regular = (
+            (chars[:, dot_col] == _DOT).all()
+            and is_digit[:, dot_col + 1 : exponent_col].all()
+            and _is_right_aligned(chars[:, :dot_col], is_digit[:, :dot_col])
+        )
+    elif regular:
+        regular = _is_right_aligned(chars[:, :exponent_col], is_digit[:, :exponent_col])
+    if regular and exponent_col < width:
+        regular = np.isin(chars[:, exponent_col], _EXPONENTS).all() and (
+            _is_right_aligned(
+                chars[:, exponent_col + 1 :], is_digit[:, exponent_col + 1 :]
+            )
+        )
+    if not regular:
+        return _to_floats(chars)
+
+    mantissa = np.s_[:, :exponent_col]
+    values = _digits_value(digits[mantissa], is_digit[mantissa], "float64", dot_col)
+    values = _with_signs(values, chars[mantissa])
+    scale = 0 if dot_col is None else dot_col + 1 - exponent_col
+    if exponent_col < width:
+        exponent = np.s_[:, exponent_col + 1 :]
+        exponent_values = _digits_value(digits[exponent], is_digit[exponent], "int64")
+        scale = scale + _with_signs(exponent_values, chars[exponent])
+        exact = np.abs(scale) <= _MAX_EXACT_POW10
+        pow10 = 10.0 ** np.clip(np.abs(scale), 0, _MAX_EXACT_POW10)
+        values = np.where(scale >= 0, values * pow10, values / pow10)
+        if not exact.all():
+            # the values which might not be correctly rounded are converted by numpy:
+            values[~exact] = _to_floats(chars[~exact])
+    elif scale:
+        values /= 10.0**-scale
+    return values
+
+
+def parse_strings(chars, categorical=False):
+    """Parse a column of strings, stripped of the blank padding.
+
+    Only the unique values of the column are decoded.
+
+    Parameters
+    ----------
+    chars : numpy.ndarray
+        2-D ``uint8`` array of the column characters, one row per line.
+    categorical : bool, optional
+        If ``True``, a `pandas.Categorical` is returned, with sorted categories.
+
+    Returns
+    -------
+    numpy.ndarray of object or pandas.Categorical
+
+    Examples
+    --------
+    >>> chars = np.frombuffer(b"  a bb  a", dtype="uint8").reshape(3, -1)
+    >>> parse_strings(chars)
+    array(['a', 'bb', 'a'], dtype=object)
+    """
+    unique, inverse = np.unique(_as_strings(chars), return_inverse=True)
+    labels = np.array(
+        [value.decode().strip() for value in unique.tolist()], dtype=object
+    )
+    if not categorical:
+        return labels[inverse]
+    categories, label_codes = np.unique(labels.astype(str), return_inverse=True)
+    return pandas.Categorical.from_codes(label_codes[inverse], categories)
+
+
+def _parse_column(chars, dtype):
+    """Parse a column of characters into the `dtype` requested."""
+    if dtype is None:
+        # inferred, similarly to pandas:
+        try:
+            return parse_ints(chars)
+        except ValueError:
+            pass
+        try:
+            return parse_floats(chars)
+        except ValueError:
+            return parse_strings(chars)
+    if dtype in {str, object, "str", "object", "O"}:
+        return parse_strings(chars)
+    if dtype == "category" or isinstance(dtype, pandas.CategoricalDtype):
+        return parse_strings(chars, categorical=True)
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu":
+        return parse_ints(chars).astype(dtype, copy=False)
+    if dtype.kind == "f":
+        return parse_floats(chars).astype(dtype, copy=False)
+    if dtype.kind == "b":
+        return parse_ints(chars).astype(bool)
+    raise ValueError(f"Data type {dtype} not supported by the fixed-width parser.")
+
+
+def get_field_bounds(chars):
+    """Determine the character positions of all the fields of a fixed-width chunk.
+
+    Parameters
+    ----------
+    chars : numpy.ndarray
+        2-D ``uint8`` array of the chunk characters, one row per line, excluding the
+        line ends.
+
+    Returns
+    -------
+    list of tuple of int
+        The ``(start, stop)`` positions of all the fields. Each field starts right
+        after the previous field, and so it includes the blank separator before it.
+
+    Examples
+    --------
+    >>> chars = np.frombuffer(b"  1 a   3.5 12 b  -0.1", dtype="uint8")
+    >>> get_field_bounds(chars.reshape(2, -1))
+    [(0, 3), (3, 5), (5, 11)]
+    """
+    filled = ~_is_blank(chars).all(axis=0)
+    padded = np.concatenate([[False], filled, [False]])
+    stops = np.flatnonzero(padded[1:-1] & ~padded[2:]) + 1
+    starts = np.concatenate([[0], stops[:-1]])
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def _line_chunks(stream, get_chunk_size, file_name):
+    """Generator of the 2-D character arrays of the consecutive chunks of lines, with
+    the number of lines of each chunk given by the `get_chunk_size` callable."""
+    first_line = stream.readline()
+    line_length = len(first_line)
+    if not line_length:
+        return
+    buffer = first_line + stream.read(line_length * (get_chunk_size() - 1))
+    while buffer:
+        if not buffer.endswith(b"\n") and len(buffer) % line_length == line_length - 1:
+            # the last line with no line end:
+            buffer += b"\n"
+        if len(buffer) % line_length:
+            raise DataParseError(
+                f"{file_name} is not a fixed-width file, use the 'pandas' backend."
+            )
+        chars = np.frombuffer(buffer, dtype="uint8").reshape(-1, line_length)
+        if not (chars[:, -1] == _NEWLINE).all():
+            raise DataParseError(
+                f"{file_name} is not a fixed-width file, use the 'pandas' backend."
+            )
+        chars = chars[:, :-1]
+        if chars.shape[1] and (chars[:, -1] == _RETURN).all():
+            # the Windows line ends:
+            chars = chars[:, :-1]
+        yield chars
+        buffer = stream.read(line_length * get_chunk_size())
+
+
+def _to_dataframe(data, first_col_is_index, first_row, num_rows, mask=None):
+    """Build the `pandas.DataFrame` chunk out of the parsed column arrays, with only
+    the rows of the `mask` (if passed) kept in the arrays."""
+    columns = list(data)
+    if first_col_is_index:
+        index = pandas.Index(data.pop(columns.pop(0)))
+    else:
+        index = pandas.RangeIndex(first_row, first_row + num_rows)
+        if mask is not None:
+            index = index[mask]
+    return pandas.DataFrame(data, index=index, columns=columns)
+
+
+def fixed_width_chunks(
+    file_path,
+    chunk_size,
+    column_names,
+    first_col_is_index=False,
+    dtype=None,
+    usecols=None,
+    num_workers=None,
+    sizer=None,
+    schema=None,
+    start_row=None,
+    stop_row=None,
+    byte_range=None,
+    filters=None,
+    start_block=None,
+    tracker=None,
+    index_dir=None,
+):
+    """Generates chunks of a fixed-width ExoMol data file.
+
+    The counterpart of the `utils.load_dataframe_chunks` for the fixed-width files,
+    yielding the same `pandas.DataFrame` chunks. Only the columns in `usecols` are
+    sliced and converted at all, and only the rows satisfying the `filters` are
+    built into the chunks.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        Path to the data file, either *.bz2* compressed or not.
+    chunk_size : int
+    column_names : list of str
+        Names of all the columns of the file.
+    first_col_is_index : bool, optional
+        If ``True``, the first column values are set as the chunk index.
+    dtype : type or dict, optional
+        Data type of all the columns, or data types keyed by the column names. The
+        data types not passed are inferred (as integer, floating-point or string,
+        whichever parses).
+    usecols : list of str, optional
+        Names of the only columns to parse.
+    num_workers : int, optional
+        If passed, the *.bz2* compressed file is decompressed in parallel (see the
+        `bz2_blocks.ParallelBZ2Reader`).
+    sizer : memory.ChunkSizer, optional
+        If passed, the number of rows of each chunk is taken from the `sizer` (and
+        the `chunk_size` ignored), which is updated with every chunk read.
+    schema : pyarrow.Schema, optional
+        If passed, `pyarrow.RecordBatch` chunks with the data types of the `schema`
+        are yielded instead, built directly out of the parsed arrays (see the
+        `exomole.arrow` module). The first column values are then the first column
+        of the record batches, even if `first_col_is_index`.
+    start_row, stop_row : int, optional
+        If passed, only the rows ``start_row:stop_row`` are parsed, with the file
+        opened straight at the `start_row` (see `bz2_blocks.open_data_file`).
+    byte_range : tuple of int, optional
+        If passed, only the rows starting within the ``(start_byte, stop_byte)``
+        range of the bytes of the file are parsed (see `bz2_blocks.ByteRangeReader`).
+    filters : list of tuple, optional
+        The validated ``(column, operator, value)`` filters (see the
+        `exomole.filters` module), evaluated on the parsed column arrays before any
+        chunk is built. The columns filtered on are parsed even if not among the
+        `usecols`, and the chunks keep the original row numbers as their index
+        (unless `first_col_is_index`).
+    start_block : tuple of int, optional
+        The location of the `start_row` in the file, see `bz2_blocks.open_data_file`.
+    tracker : bz2_blocks.RowTracker, optional
+        If passed, it gets updated with the pieces of the file read, and advanced
+        past the rows of every chunk parsed (whether filtered or not).
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar file, see `bz2_blocks.open_data_file`.
+
+    Yields
+    ------
+    pandas.DataFrame or pyarrow.RecordBatch
+
+    Raises
+    ------
+    DataParseError
+        If the file is not fixed-width, or if the number of its columns is not
+        consistent with the `column_names`.
+    ValueError
+        If any of the values cannot be parsed as the data type passed.
+    """
+    file_name = Path(file_path).name
+    usecols = set(column_names if usecols is None else usecols)
+    if first_col_is_index:
+        usecols.add(column_names[0])
+    usecols.update(col for col, _, _ in filters or [])
+    if not isinstance(dtype, dict):
+        dtype = {col: dtype for col in column_names}
+    bounds = None
+    num_rows = start_row or 0
+    if stop_row is not None and stop_row <= num_rows:
+        return
+
+    def get_chunk_size():
+        size = chunk_size if sizer is None else sizer.size
+        return size if stop_row is None else min(size, stop_row - num_rows)
+
+    with open_data_file(
+        file_path,
+        num_workers,
+        start_row=start_row,
+        byte_range=byte_range,
+        start_block=start_block,
+        tracker=tracker,
+        index_dir=index_dir,
+    ) as stream:
+        for chars in _line_chunks(stream, get_chunk_size, file_name):
+            if bounds is None:
+                bounds = get_field_bounds(chars)
+                if len(bounds) != len(column_names):
+                    raise DataParseError(
+                        f"{file_name} has {len(bounds)} columns, but column names "
+                        f"{column_names} were passed."
+                    )
+            # the values overflowing the field bounds of the first chunk:
+            separators = [start for start, _ in bounds[1:]]
+            if not (
+                _is_blank(chars[:, separators]).all()
+                and _is_blank(chars[:, bounds[-1][1] :]).all()
+            ):
+                raise DataParseError(
+                    f"{file_name} is not a fixed-width file, use the 'pandas' backend."
+                )
+            data = {}
+            for col, (start, stop) in zip(column_names, bounds):
+                if col in usecols:
+                    data[col] = _parse_column(chars[:, start:stop], dtype.get(col))
+            mask = None
+            if filters:
+                mask = filter_mask(data.get, filters, len(chars))
+                if mask.all():
+                    mask = None
+                else:
+                    data = {col: values[mask] for col, values in data.items()}
+            if schema is not None:
+                chunk = to_record_batch(data, schema)
+            else:
+                chunk = _to_dataframe(
+                    data, first_col_is_index, num_rows, len(chars), mask
+                )
+            num_rows += len(chars)
+            if tracker is not None:
+                tracker.row += len(chars)
+            if sizer is not None:
+                sizer.update(chunk)
+            yield chunk
@@ -0,0 +1,134 @@
+"""Module containing functionality for calculating the LTE line intensities of the
+ExoMol datasets.
+
+The line intensities are calculated for all the transitions of a dataset and for a
+whole grid of temperatures in a single pass over the *.trans* files, with the states
+data held in memory in a `StatesTable`.
+"""
+
+import numpy as np
+import pandas
+
+from .partition import C2, partition_sums, check_temperatures
+from .read_data import states_chunks, trans_chunks
+from .states_table import StatesTable, join_states
+
+# speed of light in cm/s:
+C = 2.99792458e10
+
+
+def get_states_table(def_parser, columns=("E", "g_tot"), **states_chunks_kwargs):
+    """Read the *.states* file belonging to a dataset into a `StatesTable`.
+
+    Parameters
+    ----------
+    def_parser : DefParser
+        Parsed *.def* file of the dataset, in the local mode.
+    columns : iterable of str, optional
+        Columns of the *.states* file to keep.
+    states_chunks_kwargs
+        Passed to the `read_data.states_chunks`.
+
+    Returns
+    -------
+    StatesTable
+    """
+    chunks = states_chunks(
+        def_parser.get_states_path(),
+        columns=def_parser.get_states_header(),
+        dtypes=def_parser.get_states_dtypes(),
+        columns_to_read=list(columns),
+        **states_chunks_kwargs,
+    )
+    return StatesTable.from_chunks(chunks, num_states=def_parser.num_states)
+
+
+def line_intensities(
+    def_parser, temperatures, states_table=None, trans_paths=None, **trans_kwargs
+):
+    """Generate the LTE line intensities of all the transitions of a dataset.
+
+    The intensity of each transition (in cm/molecule) is calculated at all the
+    `temperatures` as
+
+    .. math::
+        S = \\frac{g_i A_{if}}{8 \\pi c \\tilde{\\nu}^2}
+        \\frac{e^{-c_2 E_f / T} (1 - e^{-c_2 \\tilde{\\nu} / T})}{Q(T)},
+
+    where the partition function :math:`Q(T)` is calculated from the states of the
+    dataset. The *.trans* files are only decompressed and parsed once, regardless
+    of the number of `temperatures`.
+
+    Parameters
+    ----------
+    def_parser : DefParser
+        Parsed *.def* file of the dataset, in the local mode.
+    temperatures : iterable of float
+        Temperatures in K.
+    states_table : StatesTable, optional
+        States of the dataset, with at least the ``"E"`` and ``"g_tot"`` columns.
+        Read from the *.states* file by default.
+    trans_paths : list of (str or Path), optional
+        Defaults to all the *.trans* files of the dataset.
+    trans_kwargs
+        Passed to the `read_data.trans_chunks`, such as `chunk_size`.
+
+    Warns
+    -----
+    TemperatureWarning
+        If any of the temperatures exceeds the maximum temperature of the line list.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Chunks with the ``"i"``, ``"f"`` and ``"v_if"`` columns of the transitions,
+        followed by a column of intensities for each of the `temperatures`, named
+        ``"S_<temperature>"``, such as ``"S_296"``.
+
+    Examples
+    --------
+    >>> from exomole.read_def import DefParser
+    >>> parser = DefParser(
+    ...     path="tests/resources/exomol_data/CO/12C-16O/Li2015/12C-16O__Li2015.def"
+    ... )
+    >>> parser.parse(warn_on_comments=False)
+    >>> chunks = line_intensities(parser, [296, 1000.0], chunk_size=200_000)
+    >>> intensities = next(chunks)
+    >>> list(intensities.columns)
+    ['i', 'f', 'v_if', 'S_296', 'S_1000']
+    >>> strongest = intensities.loc[intensities["S_296"].idxmax()]
+    >>> round(strongest["v_if"], 3), f"{strongest['S_296']:.3e}"
+    (2172.759, '4.619e-19')
+    """
+    temperatures = np.asarray(temperatures, dtype="float64")
+    check_temperatures(def_parser, temperatures)
+    if states_table is None:
+        states_table = get_states_table(def_parser)
+    present = states_table.present
+    q = partition_sums(
+        states_table["E"][present], states_table["g_tot"][present], temperatures
+    )
+    if trans_paths is None:
+        trans_paths = def_parser.get_trans_paths()
+    joined_chunks = join_states(
+        trans_chunks(trans_paths, **trans_kwargs),
+        states_table,
+        columns=["i", "f", "A_if", "v_if", "E_f", "g_tot_i"],
+    )
+    labels = [f"S_{temperature:g}" for temperature in temperatures]
+    for chunk in joined_chunks:
+        v = chunk["v_if"].to_numpy()[:, np.newaxis]
+        e_f = chunk["E_f"].to_numpy()[:, np.newaxis]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            prefactor = chunk["g_tot_i"].to_numpy() * chunk["A_if"].to_numpy()
+            prefactor = prefactor[:, np.newaxis] / (8 * np.pi * C * v**2)
+            intensities = (
+                prefactor
+                * np.exp(-C2 * e_f / temperatures)
+                * -np.expm1(-C2 * v / temperatures)
+                / q
+            )
+        result = chunk[["i", "f", "v_if"]].copy()
+        for label, column in zip(labels, intensities.T):
+            result[label] = column
+        yield result
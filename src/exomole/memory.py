@@ -0,0 +1,145 @@
+"""Module grouping functionality for reading the ExoMol data files within a memory
+budget.
+
+The memory taken by a chunk of a given number of rows varies a lot between the data
+files, depending on the number of the columns and on their data types (the states
+files with many quanta labels parsed as strings take several times more memory per
+row than the trans files). Instead of the number of rows, the readers can therefore
+be given a memory budget, such as ``"2GB"``, and the number of rows of each chunk is
+derived from the budget and from the memory per row measured on the chunks read so
+far. The first chunk read is a small one, only probing the memory per row.
+Measuring the memory of the string columns takes a pass over all their values, so
+the memory per row is only measured on the first chunks, and re-sampled on every
+few chunks after that.
+
+This module only groups *helper* functions and classes, which are not designed to be
+used directly by the end-users of the `exomole` package.
+"""
+
+import re
+
+import pandas
+
+_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 10**3,
+    "MB": 10**6,
+    "GB": 10**9,
+    "TB": 10**12,
+    "KIB": 2**10,
+    "MIB": 2**20,
+    "GIB": 2**30,
+    "TIB": 2**40,
+}
+_MEMORY_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d*)?|\.\d+)\s*([a-zA-Z]*)\s*$")
+# number of rows of the first chunk, only probing the memory per row:
+_FIRST_CHUNK_SIZE = 10_000
+# the parsed chunk only takes a fraction of the memory needed to produce it, the rest
+# taken by the raw text and the parser buffers:
+_PARSING_OVERHEAD = 3
+# the memory per row is measured on the probing chunk and on the first full-size
+# chunk, and then only re-sampled on every _RESAMPLE_EVERY chunks:
+_NUM_FIRST_SAMPLES = 2
+_RESAMPLE_EVERY = 16
+
+
+def parse_memory_size(memory_size):
+    """Convert the memory size passed into the number of bytes.
+
+    Parameters
+    ----------
+    memory_size : int or str
+        Either the number of bytes, or a string with a decimal (``"kB"``, ``"MB"``,
+        ``"GB"``, ``"TB"``) or a binary (``"KiB"``, ``"MiB"``, ``"GiB"``, ``"TiB"``)
+        unit. The units are case-insensitive.
+
+    Returns
+    -------
+    int
+
+    Raises
+    ------
+    ValueError
+        If the `memory_size` cannot be parsed, or is not positive.
+
+    Examples
+    --------
+    >>> parse_memory_size("2GB")
+    2000000000
+    >>> parse_memory_size("1.5 GiB")
+    1610612736
+    """
+    if isinstance(memory_size, str):
+        match = _MEMORY_SIZE_PATTERN.match(memory_size)
+        if match is None or match.group(2).upper() not in _UNITS:
+            raise ValueError(f"Invalid memory size: {memory_size!r}")
+        number, unit = match.groups()
+        num_bytes = int(float(number) * _UNITS[unit.upper()])
+    else:
+        num_bytes = int(memory_size)
+    if num_bytes <= 0:
+        raise ValueError(f"Invalid memory size: {memory_size!r}")
+    return num_bytes
+
+
+class ChunkSizer:
+    """Number of rows of the chunks read within a memory budget.
+
+    The `size` starts at a small probing number of rows, and is updated from the
+    largest memory per row measured so far. The memory per row is measured on the
+    first two chunks read (the probing one and the first full-size one), and then
+    re-sampled on every 16th chunk only.
+
+    Parameters
+    ----------
+    memory_budget : int or str
+        The memory available for reading the chunks, see `parse_memory_size`.
+
+    Attributes
+    ----------
+    size : int
+        The number of rows of the next chunk to read.
+    bytes_per_row : float or NoneType
+        The largest memory per row measured so far.
+
+    Examples
+    --------
+    >>> import pandas
+    >>> sizer = ChunkSizer("3MB")
+    >>> sizer.size
+    10000
+    >>> chunk = pandas.DataFrame({"i": range(1000), "E": 0.0}).set_index("i")
+    >>> sizer.update(chunk)  # 16 bytes per row, the index included
+    >>> sizer.size
+    62500
+    """
+
+    def __init__(self, memory_budget):
+        self.memory_budget = parse_memory_size(memory_budget)
+        self.bytes_per_row = None
+        self.size = _FIRST_CHUNK_SIZE
+        self._num_chunks = 0
+
+    def update(self, chunk):
+        """Update the `size` from the memory taken by the `chunk` just read, if the
+        chunk is one of those sampled.
+
+        Parameters
+        ----------
+        chunk : pandas.DataFrame or pyarrow.RecordBatch
+        """
+        if not len(chunk):
+            return
+        self._num_chunks += 1
+        num_resampled = self._num_chunks - _NUM_FIRST_SAMPLES
+        if num_resampled > 0 and num_resampled % _RESAMPLE_EVERY:
+            return
+        if isinstance(chunk, pandas.DataFrame):
+            num_bytes = chunk.memory_usage(index=True, deep=True).sum()
+        else:
+            num_bytes = chunk.nbytes
+        bytes_per_row = num_bytes / len(chunk)
+        self.bytes_per_row = max(bytes_per_row, self.bytes_per_row or 0)
+        chunk_memory = self.memory_budget / _PARSING_OVERHEAD
+        self.size = max(1, int(chunk_memory / self.bytes_per_row))
@@ -0,0 +1,359 @@
+"""Module grouping functionality for reading ExoMol data files concurrently.
+
+This module mostly groups *helper* functions, which are not designed to be used
+directly by the end-users of the `exomole` package. The exception is the
+`PrefetchStats` class, collecting the statistics of the chunks prefetched in the
+background.
+
+Besides the concurrency within a single process, the data files can be split into
+*shards* read by independent workers, possibly on different nodes sharing the file
+system, with no coordination between them (see `get_shard_ranges`).
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .exceptions import DataParseError
+
+
+# the loader, the chunk queues and the cancellation event of the worker processes of
+# the pool, set by the pool initializer:
+_worker_load_file_chunks, _worker_queues, _worker_cancelled = None, None, None
+
+
+def _init_file_worker(load_file_chunks, chunks_queues, cancelled):
+    """Initializer of the worker processes of the pool, see `_file_worker`."""
+    global _worker_load_file_chunks, _worker_queues, _worker_cancelled
+    for chunks_queue in chunks_queues:
+        # the chunks left in the queues once cancelled are never read anyway:
+        chunks_queue.cancel_join_thread()
+    _worker_load_file_chunks = load_file_chunks
+    _worker_queues, _worker_cancelled = chunks_queues, cancelled
+
+
+def _put(chunks_queue, message):
+    """Put the `message` into the `chunks_queue`, unless cancelled meanwhile."""
+    while not _worker_cancelled.is_set():
+        try:
+            chunks_queue.put(message, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _file_worker(file_index, file_path, slot):
+    """Task of the worker processes of the pool, putting all the chunks of a single
+    file loaded by the `load_file_chunks` passed to the pool initializer into the
+    chunks queue of the `slot`, followed by a sentinel (or by the exception raised).
+
+    Parameters
+    ----------
+    file_index : int
+    file_path : str or Path
+    slot : int
+        The index of the chunks queue passed to the pool initializer.
+    """
+    chunks_queue = _worker_queues[slot]
+    try:
+        for chunk in _worker_load_file_chunks(file_path):
+            if not _put(chunks_queue, ("chunk", file_index, chunk)):
+                return
+    except Exception as e:
+        _put(chunks_queue, ("error", file_index, e))
+    else:
+        _put(chunks_queue, ("done", file_index, None))
+
+
+def _get_message(chunks_queue, futures, file_paths):
+    """Get the next message from the `chunks_queue`, guarding against any of the
+    worker processes dying without a word."""
+    while True:
+        try:
+            return chunks_queue.get(timeout=1)
+        except queue.Empty:
+            for file_index, future in futures.items():
+                if future.done() and future.exception() is not None:
+                    raise DataParseError(
+                        f"Worker process reading {Path(file_paths[file_index]).name} "
+                        f"died: {future.exception()}"
+                    )
+
+
+def file_chunks_in_parallel(
+    load_file_chunks, file_paths, num_workers, ordered=True, max_chunks_in_flight=None
+):
+    """Generate chunks of several data files, read over a pool of processes.
+
+    The files are read by a pool of `num_workers` worker processes, each file by a
+    single worker, and at most `num_workers` files at any time. The chunks are
+    either yielded in the order of the `file_paths` (and in the original order
+    within each file), or as soon as they are ready.
+    Either way, at most `max_chunks_in_flight` chunks are held in the queues between
+    the workers and the consumer, before the workers get blocked.
+
+    Parameters
+    ----------
+    load_file_chunks : callable
+        Called as ``load_file_chunks(file_path)`` in the worker processes, returning
+        an iterable of chunks of the file. Passed to the worker processes once, when
+        they are started, so it needs to be picklable (such as a `functools.partial`
+        of a module-level function) unless the processes are forked.
+    file_paths : list of (str or Path)
+    num_workers : int
+        Number of the worker processes, and of the files read concurrently.
+    ordered : bool, optional
+        If ``True``, chunks are yielded in the original order, otherwise as soon as
+        they are read by any of the workers.
+    max_chunks_in_flight : int, optional
+        Defaults to twice the `num_workers`.
+
+    Yields
+    ------
+    chunk
+        Whatever is generated by `load_file_chunks`.
+
+    Raises
+    ------
+    DataParseError
+        If any of the worker processes dies unexpectedly.
+        Any exceptions raised while reading the files in the worker processes are
+        re-raised.
+    """
+    ctx = multiprocessing.get_context()
+    if max_chunks_in_flight is None:
+        max_chunks_in_flight = 2 * num_workers
+    # in the ordered mode, the files read concurrently take turns in the queue slots,
+    # so the chunks of the earliest unfinished file can be waited for:
+    if ordered:
+        num_slots, queue_size = num_workers, max(1, max_chunks_in_flight // num_workers)
+    else:
+        num_slots, queue_size = 1, max_chunks_in_flight
+    chunks_queues = [ctx.Queue(queue_size) for _ in range(num_slots)]
+    cancelled = ctx.Event()
+    # the worker processes are not daemonic, so they can run process pools of their
+    # own:
+    executor = ProcessPoolExecutor(
+        num_workers,
+        mp_context=ctx,
+        initializer=_init_file_worker,
+        initargs=(load_file_chunks, chunks_queues, cancelled),
+    )
+    futures = {}
+
+    def submit(file_index):
+        futures[file_index] = executor.submit(
+            _file_worker, file_index, file_paths[file_index], file_index % num_slots
+        )
+
+    next_to_submit = min(num_workers, len(file_paths))
+    try:
+        for file_index in range(next_to_submit):
+            submit(file_index)
+        num_done = 0
+        while num_done < len(file_paths):
+            # in the ordered mode, only ever wait for the earliest unfinished file:
+            chunks_queue = chunks_queues[num_done % num_slots]
+            kind, file_index, payload = _get_message(chunks_queue, futures, file_paths)
+            if kind == "chunk":
+                yield payload
+            elif kind == "error":
+                raise payload
+            else:
+                futures.pop(file_index).result()
+                num_done += 1
+                if next_to_submit < len(file_paths):
+                    submit(next_to_submit)
+                    next_to_submit += 1
+    finally:
+        # the workers blocked on the full queues give up:
+        cancelled.set()
+        executor.shutdown()
+
+
+class PrefetchStats:
+    """Statistics of the chunks prefetched in the background, see `prefetch_chunks`.
+
+    Pass an instance into the readers (such as the `read_data.states_chunks`) as
+    `prefetch_stats`, and it gets updated while the chunks are consumed.
+
+    Attributes
+    ----------
+    num_chunks : int
+        Number of chunks yielded so far.
+    num_stalls : int
+        Number of times the consumer asked for the next chunk and found the queue
+        of the prefetched chunks empty (including the very first chunk).
+    stall_time : float
+        Total time in seconds the consumer waited for the chunks.
+    """
+
+    def __init__(self):
+        self.num_chunks = 0
+        self.num_stalls = 0
+        self.stall_time = 0.0
+
+    def __repr__(self):
+        return (
+            f"PrefetchStats(num_chunks={self.num_chunks}, "
+            f"num_stalls={self.num_stalls}, stall_time={self.stall_time:.3f})"
+        )
+
+
+def prefetch_chunks(chunks, num_chunks, stats=None):
+    """Generate the `chunks`, while the following ones are read by a background thread.
+
+    Up to `num_chunks` chunks are read ahead, while the current one is processed by
+    the consumer. The decompression and most of the parsing do not hold the GIL,
+    so they run concurrently with the consumer even in a thread.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Any iterable of chunks, such as returned by the `read_data.states_chunks`.
+        Iterated over in the background thread (and closed there, if it is a
+        generator).
+    num_chunks : int
+        Maximum number of chunks read ahead.
+    stats : PrefetchStats, optional
+        If passed, updated with the statistics of the consumer waiting for the
+        chunks.
+
+    Yields
+    ------
+    chunk
+        Whatever is generated by the `chunks`.
+
+    Raises
+    ------
+    ValueError
+        If the `num_chunks` is not positive.
+        Any exceptions raised while reading the `chunks` are re-raised.
+
+    Examples
+    --------
+    >>> stats = PrefetchStats()
+    >>> list(prefetch_chunks(range(3), 2, stats))
+    [0, 1, 2]
+    >>> stats.num_chunks
+    3
+    """
+    if num_chunks < 1:
+        raise ValueError(f"Invalid number of chunks to prefetch: {num_chunks}")
+    chunks_queue = queue.Queue(num_chunks)
+    stop = threading.Event()
+
+    def put(message):
+        # only blocking until the consumer stops:
+        while not stop.is_set():
+            try:
+                chunks_queue.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read_chunks():
+        try:
+            for chunk in chunks:
+                if not put(("chunk", chunk)):
+                    return
+        except BaseException as e:
+            put(("error", e))
+        else:
+            put(("done", None))
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    thread = threading.Thread(target=read_chunks, name="exomole-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            stall_time = None
+            try:
+                kind, payload = chunks_queue.get_nowait()
+            except queue.Empty:
+                start = time.perf_counter()
+                kind, payload = chunks_queue.get()
+                stall_time = time.perf_counter() - start
+            if kind == "chunk":
+                if stats is not None:
+                    stats.num_chunks += 1
+                    if stall_time is not None:
+                        stats.num_stalls += 1
+                        stats.stall_time += stall_time
+                yield payload
+            elif kind == "error":
+                raise payload
+            else:
+                return
+    finally:
+        stop.set()
+        thread.join()
+
+
+def get_shard_ranges(file_paths, shard, num_shards):
+    """Get the parts of the data files making up a single shard out of `num_shards`.
+
+    The (compressed) bytes of all the `file_paths`, taken one after another, are
+    split evenly into `num_shards` consecutive slices, so the shards are balanced
+    however the file sizes vary. Each shard consists of the rows starting within its
+    slice, which is either a whole file, or a byte range of a file, snapped to the
+    *bz2* block boundaries (see `bz2_blocks.ByteRangeReader`). The shards are
+    therefore disjoint, and together hold all the rows of all the files, while each
+    one is computed from the file sizes alone.
+
+    Parameters
+    ----------
+    file_paths : list of (str or Path)
+    shard : int
+        The 0-based index of the shard.
+    num_shards : int
+
+    Returns
+    -------
+    dict
+        The ``(start_byte, stop_byte)`` byte ranges of the files holding any part of
+        the shard, keyed by their paths, in the order of the `file_paths`. The byte
+        range is ``None`` for the files wholly belonging to the shard.
+
+    Raises
+    ------
+    ValueError
+        If the `shard` is not within ``range(num_shards)``.
+
+    Examples
+    --------
+    >>> from pathlib import Path
+    >>> tr_paths = sorted(Path("tests/resources").glob("*.trans*0*.bz2"))
+    >>> for shard in range(2):
+    ...     for path, byte_range in get_shard_ranges(tr_paths, shard, 2).items():
+    ...         print(shard, path.name, byte_range)
+    0 dummy_trans_5x4_int_int_float_float.trans01.bz2 None
+    0 dummy_trans_5x4_int_int_float_float.trans02.bz2 (0, 74)
+    1 dummy_trans_5x4_int_int_float_float.trans02.bz2 (74, 149)
+    1 dummy_trans_5x4_int_int_float_float.trans03.bz2 None
+    """
+    if not isinstance(num_shards, int) or num_shards < 1:
+        raise ValueError(f"Invalid number of shards: {num_shards}")
+    if not isinstance(shard, int) or not 0 <= shard < num_shards:
+        raise ValueError(f"Invalid shard {shard} out of {num_shards} shards.")
+    sizes = [os.path.getsize(file_path) for file_path in file_paths]
+    total_size = sum(sizes)
+    start = shard * total_size // num_shards
+    stop = (shard + 1) * total_size // num_shards
+    shard_ranges = {}
+    offset = 0
+    for file_path, size in zip(file_paths, sizes):
+        file_start, file_stop = max(start - offset, 0), min(stop - offset, size)
+        if file_start < file_stop:
+            whole = file_start == 0 and file_stop == size
+            shard_ranges[file_path] = None if whole else (file_start, file_stop)
+        offset += size
+    return shard_ranges
@@ -0,0 +1,253 @@
+"""Module containing functionality for calculating the partition functions of the
+ExoMol datasets from their *.states* files.
+
+The partition function is calculated over a whole grid of temperatures in a single
+pass over the *.states* file, and cached in a file next to the dataset *.def* file.
+All the subsequent calls then interpolate the cached values, with no need to re-read
+the *.states* file.
+"""
+
+import json
+import os
+import warnings
+
+import numpy as np
+
+from .exceptions import TemperatureWarning
+from .read_data import states_chunks
+
+# second radiation constant (hc/k) in cm K:
+C2 = 1.4387769
+# the states_chunks arguments selecting only some of the states, which the cache
+# cannot tell apart:
+_ROW_SELECTING_KWARGS = {"filters", "cursor", "shard", "num_shards"}
+
+
+def partition_sums(energies, degeneracies, temperatures, max_batch_size=2**24):
+    """Calculate the partition function of a set of states at all the `temperatures`.
+
+    Parameters
+    ----------
+    energies : array-like of float
+        Energies of the states in cm-1.
+    degeneracies : array-like of int
+        Total degeneracies of the states.
+    temperatures : array-like of float
+        Temperatures in K.
+    max_batch_size : int, optional
+        Maximum number of the Boltzmann factors (states times temperatures) held in
+        the memory at once.
+
+    Returns
+    -------
+    numpy.ndarray
+        Partition function values for all the `temperatures`.
+
+    Examples
+    --------
+    >>> partition_sums([0, 1000], [1, 3], [100, 1000])
+    array([1.00000169, 1.71165317])
+    """
+    energies = np.asarray(energies, dtype="float64")
+    degeneracies = np.asarray(degeneracies, dtype="float64")
+    inv_temperatures = 1 / np.asarray(temperatures, dtype="float64")
+    result = np.zeros(len(inv_temperatures))
+    batch_size = max(1, max_batch_size // max(1, len(inv_temperatures)))
+    for start in range(0, len(energies), batch_size):
+        batch = slice(start, start + batch_size)
+        boltzmann = np.exp(-C2 * np.outer(energies[batch], inv_temperatures))
+        result += degeneracies[batch] @ boltzmann
+    return result
+
+
+def compute_partition_function(states_chunks_iter, temperatures):
+    """Calculate the partition function by accumulating over the chunks of states.
+
+    Parameters
+    ----------
+    states_chunks_iter : iterable of pandas.DataFrame
+        Chunks with (at least) the ``"E"`` and ``"g_tot"`` columns, such as yielded
+        by `read_data.states_chunks`.
+    temperatures : array-like of float
+        Temperatures in K.
+
+    Returns
+    -------
+    numpy.ndarray
+        Partition function values for all the `temperatures`.
+    """
+    result = np.zeros(len(temperatures))
+    for chunk in states_chunks_iter:
+        result += partition_sums(
+            chunk["E"].to_numpy(dtype="float64"),
+            chunk["g_tot"].to_numpy(dtype="float64"),
+            temperatures,
+        )
+    return result
+
+
+def check_temperatures(def_parser, temperatures):
+    """Check the `temperatures` against the maximum temperature of the dataset.
+
+    Parameters
+    ----------
+    def_parser : DefParser
+        Parsed *.def* file of the dataset.
+    temperatures : array-like of float
+
+    Raises
+    ------
+    ValueError
+        If any of the temperatures is not positive.
+
+    Warns
+    -----
+    TemperatureWarning
+        If any of the temperatures exceeds the maximum temperature of the line list
+        (`DefParser.max_temp`), as the line list might not be complete enough there.
+    """
+    temperatures = np.asarray(temperatures, dtype="float64")
+    if (temperatures <= 0).any():
+        raise ValueError("All the temperatures need to be positive!")
+    if def_parser.max_temp is not None and temperatures.max() > def_parser.max_temp:
+        warnings.warn(
+            f"Temperature {temperatures.max()} K exceeds the maximum temperature of "
+            f"the {def_parser.file_name} line list ({def_parser.max_temp} K).",
+            TemperatureWarning,
+        )
+
+
+def get_cache_path(def_parser):
+    """Path of the partition function cache file belonging to a dataset.
+
+    The cache file is placed next to the *.def* file.
+
+    Parameters
+    ----------
+    def_parser : DefParser
+        In the local mode.
+
+    Returns
+    -------
+    Path
+    """
+    return def_parser.path.with_name(f"{def_parser.path.name[:-4]}.pf.cache")
+
+
+def _get_states_stamp(states_path):
+    stat = os.stat(states_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _load_cache(cache_path, states_path):
+    """Cached temperature grid and partition function, or ``None`` if not valid."""
+    try:
+        with open(cache_path, "r") as fp:
+            header = json.loads(fp.readline().lstrip("#"))
+        grid = np.loadtxt(cache_path, ndmin=2)
+    except (OSError, ValueError):
+        return None
+    if header != _get_states_stamp(states_path):
+        return None
+    return grid[:, 0], grid[:, 1]
+
+
+def _save_cache(cache_path, states_path, grid, values):
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as fp:
+        fp.write(f"# {json.dumps(_get_states_stamp(states_path))}\n")
+        np.savetxt(fp, np.column_stack([grid, values]), fmt="%.12e")
+    os.replace(tmp_path, cache_path)
+
+
+def get_partition_function(
+    def_parser, temperatures, use_cache=True, num_grid_points=500, **states_kwargs
+):
+    """Get the partition function of a dataset at all the `temperatures`.
+
+    The partition function is calculated on a logarithmic grid of temperatures from
+    1 K up to the maximum temperature of the line list (or to the highest temperature
+    requested, whichever is higher) in a single pass over the *.states* file, and
+    interpolated (in the log-log space) to the `temperatures` requested.
+    With `use_cache`, the grid values are cached next to the *.def* file, and any
+    subsequent calls only interpolate the cached values, unless the *.states* file
+    has changed since, or the `temperatures` requested lie outside the cached grid.
+
+    Parameters
+    ----------
+    def_parser : DefParser
+        Parsed *.def* file of the dataset, in the local mode.
+    temperatures : array-like of float
+        Temperatures in K.
+    use_cache : bool, optional
+    num_grid_points : int, optional
+        Number of the temperature grid points.
+    states_kwargs
+        Passed to the `read_data.states_chunks`, only those affecting how the
+        *.states* file is read, such as `chunk_size`, `num_workers`, `backend`,
+        `memory_budget` or `cache_dir`. The arguments selecting only some of the
+        states (`filters`, `cursor`, `shard` or `num_shards`) are only allowed with
+        no `use_cache`, as the cache holds the partition function of all the states.
+
+    Returns
+    -------
+    numpy.ndarray
+        Partition function values for all the `temperatures`.
+
+    Raises
+    ------
+    ValueError
+        If any of the `states_kwargs` selecting only some of the states is passed
+        with `use_cache`.
+
+    Warns
+    -----
+    TemperatureWarning
+        If any of the temperatures exceeds the maximum temperature of the line list.
+
+    Examples
+    --------
+    >>> from exomole.read_def import DefParser
+    >>> parser = DefParser(
+    ...     path="tests/resources/exomol_data/CO/12C-16O/Li2015/12C-16O__Li2015.def"
+    ... )
+    >>> parser.parse(warn_on_comments=False)
+    >>> get_partition_function(parser, [296, 1000], use_cache=False).round(2)
+    array([107.42, 380.3 ])
+    """
+    selecting = sorted(_ROW_SELECTING_KWARGS.intersection(states_kwargs))
+    if use_cache and selecting:
+        raise ValueError(
+            f"The partition function of only some of the states ({selecting}) "
+            "cannot be cached, pass use_cache=False."
+        )
+    temperatures = np.asarray(temperatures, dtype="float64")
+    check_temperatures(def_parser, temperatures)
+    states_path = def_parser.get_states_path()
+    cache_path = get_cache_path(def_parser)
+    cached = _load_cache(cache_path, states_path) if use_cache else None
+    if cached is not None:
+        grid, values = cached
+        if grid[0] <= temperatures.min() and temperatures.max() <= grid[-1]:
+            return _interpolate(temperatures, grid, values)
+
+    min_temp = min(1.0, temperatures.min())
+    max_temp = max(def_parser.max_temp or 0.0, temperatures.max())
+    grid = np.geomspace(min_temp, max_temp, num_grid_points)
+    chunks = states_chunks(
+        states_path,
+        columns=def_parser.get_states_header(),
+        dtypes=def_parser.get_states_dtypes(),
+        columns_to_read=["E", "g_tot"],
+        **states_kwargs,
+    )
+    values = compute_partition_function(chunks, grid)
+    if use_cache:
+        _save_cache(cache_path, states_path, grid, values)
+    return _interpolate(temperatures, grid, values)
+
+
+def _interpolate(temperatures, grid, values):
+    """Interpolate the partition function `values` on the `grid` in the log-log
+    space, where it is nearly linear."""
+    return np.exp(np.interp(np.log(temperatures), np.log(grid), np.log(values)))
@@ -4,13 +4,47 @@ Two stand-alone functions are provided for reading *bz2*-compressed ExoMol files
 with states (*.states.bz2* files) and with transitions (*.trans.bz2*).
 """
 
+from functools import partial
 from pathlib import Path
 
+import numpy as np
+
+from .arrow import TRANS_DTYPES, check_output, get_arrow_schema, select_columns
+from .bz2_blocks import RowTracker
+from .cache import cached_chunks
 from .exceptions import DataParseError, StatesParseError, TransParseError
-from .utils import load_dataframe_chunks, get_num_columns
+from .filters import validate_filters
+from .memory import parse_memory_size
+from .parallel import file_chunks_in_parallel, get_shard_ranges, prefetch_chunks
+from .utils import (
+    load_dataframe_chunks,
+    get_num_columns,
+    get_num_rows,
+    filter_trans_paths,
+)
 
 
-def states_chunks(states_path, columns, chunk_size=1_000_000):
+def states_chunks(
+    states_path,
+    columns,
+    chunk_size=1_000_000,
+    num_workers=None,
+    dtypes=None,
+    cache_dir=None,
+    filters=None,
+    columns_to_read=None,
+    backend="pandas",
+    memory_budget=None,
+    prefetch=None,
+    prefetch_stats=None,
+    output="pandas",
+    cursor=None,
+    shard=None,
+    num_shards=None,
+    vocabulary=None,
+    label_codes=False,
+    index_dir=None,
+):
     """
     Get a generator of chunks of the dataset *.states.bz2* file.
 
@@ -31,6 +65,9 @@ def states_chunks(states_path, columns, chunk_size=1_000_000):
     The columns can be re-casted downstream to the more appropriate data types
     for faster processing. An example for the energy column might be as follows:
     ``state_chunk['E'] = state_chunk['col'].astype('float64')``
+    Alternatively, the data types can be passed explicitly as `dtypes`, in which case
+    the columns are parsed directly into the desired data types. The data types
+    implied by the dataset *.def* file are given by `DefParser.get_states_dtypes`.
 
     Parameters
     ----------
@@ -38,27 +75,122 @@ def states_chunks(states_path, columns, chunk_size=1_000_000):
         Path to the *.states* file on the local file system.
     chunk_size : int, optional
         Chunk size, should be chosen appropriately with regards to the RAM size.
-        Roughly 1_000_000 per 1GB consumed.
+        Roughly 1_000_000 per 1GB consumed, but depending on the number of columns.
+        Ignored if the `memory_budget` is passed.
     columns : iterable of str
         Column names for all the columns in the *.states* file including the (first)
         index column named "i".
         Therefore, ``len(columns)`` must be equal the number of actual columns
         in the *.states* file.
+    num_workers : int, optional
+        If passed, the *.bz2* compressed file is decompressed block by block in
+        parallel, over a pool of `num_workers` processes. Worth it only for large files.
+    dtypes : dict, optional
+        Data types keyed by the column names, such as returned by
+        `DefParser.get_states_dtypes`. Columns missing from `dtypes` are parsed as
+        ``str``, and the index is always ``"int64"``.
+        Note that the ``"category"`` columns get their categories inferred
+        independently for each chunk (see `vocabulary`).
+    cache_dir : str or Path, optional
+        If passed, the parsed chunks are cached in a *Parquet* file in the `cache_dir`
+        the first time the *.states* file is read, and all the subsequent calls read
+        the cached data instead, with no decompression and parsing involved (see the
+        `exomole.cache` module). Requires the optional `pyarrow` package.
+    filters : list of tuple, optional
+        If passed, only the states satisfying all the ``(column, operator, value)``
+        filters are yielded, such as ``[("E", "<", 20000), ("J", "<=", 50)]``, see the
+        `exomole.filters` module. The filters can refer to any of the `columns`
+        including ``"i"``. With the ``"numpy"`` `backend`, they are evaluated on the
+        parsed column arrays, before any chunk is built out of them, and with
+        `cache_dir`, on the *Arrow* data read from the cache. With the ``"pandas"``
+        `backend`, only the columns filtered on are parsed first, and only the lines
+        satisfying the filters are then parsed into the chunks.
+    columns_to_read : list of str, optional
+        If passed, only these columns (out of the `columns`) are parsed and yielded,
+        in the order passed. The values of all the other columns (such as the quanta
+        labels not needed) are skipped by the tokeniser, rather than parsed and
+        dropped. The index is always read. With `cache_dir`, the cache still holds
+        all the columns, while only the `columns_to_read` are read from it.
+    backend : {"pandas", "numpy"}, optional
+        The parser backend, see `utils.load_dataframe_chunks`. The ``"numpy"``
+        backend slices the fixed-width columns out of the raw bytes with vectorised
+        `numpy` operations, rather than splitting the lines into tokens.
+    memory_budget : int or str, optional
+        The memory available for reading the chunks, such as ``"2GB"``. If passed,
+        the number of rows of each chunk is derived from the budget and from the
+        memory per row measured on the chunks already read (starting with a small
+        probing chunk), instead of the fixed `chunk_size`. With `prefetch`, the
+        budget is shared evenly by the chunk being processed and the `prefetch`
+        chunks read ahead, so each chunk gets ``1 / (prefetch + 1)`` of it. See the
+        `exomole.memory` module.
+    prefetch : int, optional
+        If passed, up to `prefetch` following chunks are read by a background
+        thread while the current chunk is being processed by the consumer (see
+        `parallel.prefetch_chunks`).
+    prefetch_stats : parallel.PrefetchStats, optional
+        Only relevant with `prefetch`. If passed, it gets updated with the number of
+        times the consumer found no chunk prefetched, and with the total time it
+        waited for the chunks.
+    output : {"pandas", "arrow"}, optional
+        With ``"arrow"``, `pyarrow.RecordBatch` chunks are yielded instead of the
+        `pandas.DataFrame` chunks, with the index as their first column ``"i"``, and
+        with the schema given by the `dtypes` (see the `exomole.arrow` module and
+        `DefParser.get_states_schema`). With the ``"numpy"`` `backend`, the record
+        batches are built directly out of the parsed arrays, and with `cache_dir`,
+        out of the cached data, with no `pandas` involved. Requires the optional
+        `pyarrow` package.
+    cursor : cursor.ScanCursor, optional
+        If passed, the reading starts from the position of the `cursor`, which is
+        updated with every chunk yielded, to point just past the chunk, and once the
+        whole file is read, to point past the file. The cursor can be saved at any
+        chunk boundary, and passed again to resume the reading, with a *.bz2* file
+        decompressed straight from the block holding the next row (see the
+        `exomole.cursor` module). The `cache_dir` is ignored.
+    shard, num_shards : int, optional
+        If passed, only the `shard` (0-based) out of the `num_shards` balanced and
+        disjoint shards of the *.states* file is read, so the file can be split
+        between `num_shards` independent workers (see
+        `parallel.get_shard_ranges`). Each shard holds the rows starting within a
+        byte range of the (compressed) file, and a *.bz2* compressed file is only
+        decompressed from the blocks of the shard. Cannot be combined with the
+        `cursor`. The `cache_dir` is ignored with more than one shard.
+    vocabulary : vocabulary.LabelVocabulary, optional
+        If passed, the label columns of the `vocabulary` (such as the string quanta
+        columns of the `DefParser.get_label_vocabulary`) are parsed as categorical
+        and encoded through the `vocabulary`, which gets updated with any new labels
+        read. The label columns are yielded as `pandas.Categorical`, with the same
+        codes for the same labels in all the chunks, and with all the labels known
+        so far as the categories. Only with the ``"pandas"`` `output`.
+    label_codes : bool, optional
+        Only relevant with `vocabulary`. If ``True``, the label columns are yielded
+        as their ``"int32"`` codes instead, which can be decoded by the
+        `vocabulary`.
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar file, only ever needed for
+        resuming from a `cursor` with no block location (see
+        `bz2_blocks.get_block_index`). Next to the *.states* file by default, or
+        ``False`` for the block index only kept in the memory.
 
     Yields
     ------
-    states_chunk : pandas.DataFrame
+    states_chunk : pandas.DataFrame or pyarrow.RecordBatch
         Generated chunks of the *.states* file, each is a `pandas.DataFrame` with
         columns according to the `columns` passed, and indexed by the values in the
         first column in the *.states* file.
-        The whole `DataFrame` is of string (``"O"``) data type, except the index, which
-        is ``"int64"``.
+        The whole `DataFrame` is of string (``"O"``) data type (unless `dtypes` are
+        passed), except the index, which is ``"int64"``.
 
     Raises
     ------
     StatesParseError
         If ``len(columns)`` inconsistent with the number of columns in the *.states*
-        file.
+        file, or if any of the values cannot be parsed as the data type passed in
+        `dtypes`.
+    ValueError
+        If any of the `filters` is invalid, any of the `columns_to_read` is not
+        among the `columns`, or if the `memory_budget`, the `output`, the `cursor`
+        or the `shard` is invalid, or if the `vocabulary` is passed with the
+        ``"arrow"`` `output`.
 
     Examples
     --------
@@ -74,25 +206,300 @@ def states_chunks(states_path, columns, chunk_size=1_000_000):
     4   0.4704792592345922   95    d    1
     5   0.8168636898850669    6    e    9
     """
+    chunks = _states_chunks(
+        states_path,
+        columns,
+        chunk_size=chunk_size,
+        num_workers=num_workers,
+        dtypes=dtypes,
+        cache_dir=cache_dir,
+        filters=filters,
+        columns_to_read=columns_to_read,
+        backend=backend,
+        memory_budget=memory_budget,
+        prefetch=prefetch,
+        output=output,
+        cursor=cursor,
+        shard=shard,
+        num_shards=num_shards,
+        vocabulary=vocabulary,
+        label_codes=label_codes,
+        index_dir=index_dir,
+    )
+    if prefetch:
+        chunks = prefetch_chunks(chunks, prefetch, stats=prefetch_stats)
+    for position, chunk in chunks:
+        if cursor is not None:
+            cursor.advance([states_path], *position)
+        yield chunk
+    if cursor is not None:
+        # only known once the consumer asks for a chunk past the last one:
+        cursor.advance([states_path], 1)
+
+
+def _states_chunks(
+    states_path,
+    columns,
+    chunk_size,
+    num_workers,
+    dtypes,
+    cache_dir,
+    filters,
+    columns_to_read,
+    backend,
+    memory_budget,
+    prefetch,
+    output,
+    cursor,
+    shard,
+    num_shards,
+    vocabulary,
+    label_codes,
+    index_dir,
+):
+    """Generator of the ``(position, chunk)`` of the *.states* file, with the
+    ``(file_index, row, start_block)`` cursor `position` following each chunk, or
+    ``None`` with no `cursor`. See `states_chunks` for the parameters."""
+    check_output(output)
     if columns[0] != "i":
         raise StatesParseError("The first column of any .states file needs to be 'i'.")
-    try:
-        chunks = load_dataframe_chunks(
+    if dtypes is None:
+        dtype = str
+    else:
+        dtype = {col: dtypes.get(col, str) for col in columns[1:]}
+    if vocabulary is not None:
+        if output != "pandas":
+            raise ValueError("The vocabulary requires the pandas output.")
+        if dtype is str:
+            dtype = {col: str for col in columns[1:]}
+        # only the categories of the label columns are looked up in the vocabulary:
+        dtype.update(
+            (col, "category") for col in vocabulary.columns if col in columns[1:]
+        )
+    filters = validate_filters(filters or [], columns)
+    if memory_budget is not None:
+        memory_budget = parse_memory_size(memory_budget) // ((prefetch or 0) + 1)
+    usecols = None
+    if columns_to_read is not None:
+        columns_to_read = [col for col in columns_to_read if col != "i"]
+        if not set(columns_to_read).issubset(columns):
+            raise ValueError(f"Columns {columns_to_read} not among {columns}.")
+        # the columns only filtered on still need to be read:
+        usecols = columns_to_read + [
+            col for col, _, _ in filters if col not in columns_to_read + ["i"]
+        ]
+
+    schema = None
+    if output == "arrow":
+        schema = get_arrow_schema(columns, {"i": "int64", **(dtypes or {})})
+    start_row, start_block, tracker = None, None, None
+    if cursor is not None:
+        cursor.check([states_path])
+        if cursor.file_index:
+            return
+        start_row, start_block = cursor.row, cursor.start_block
+        tracker = RowTracker(start_row)
+        cache_dir = None
+    byte_range = None
+    if shard is not None or num_shards is not None:
+        if cursor is not None:
+            raise ValueError("The shards cannot be combined with the cursor.")
+        shard_ranges = get_shard_ranges([states_path], shard, num_shards)
+        if states_path not in shard_ranges:
+            return
+        byte_range = shard_ranges[states_path]
+        if byte_range is not None:
+            cache_dir = None
+
+    def load_chunks(usecols=None, schema=None, filters=None):
+        return load_dataframe_chunks(
             file_path=states_path,
             chunk_size=chunk_size,
             first_col_is_index=True,
             column_names=columns,
-            dtype=str,
+            dtype=dtype,
             check_num_columns=True,
+            num_workers=num_workers,
+            usecols=usecols,
+            backend=backend,
+            memory_budget=memory_budget,
+            schema=schema,
+            start_row=start_row,
+            byte_range=byte_range,
+            filters=filters,
+            start_block=start_block,
+            tracker=tracker,
+            index_dir=index_dir,
         )
+
+    try:
+        if cache_dir is None:
+            chunks = load_chunks(usecols, schema, filters)
+        else:
+            chunks = cached_chunks(
+                states_path,
+                load_chunks,
+                cache_dir,
+                chunk_size,
+                variant=f"{columns}{dtype}",
+                columns=columns_to_read,
+                index_col="i",
+                filters=filters,
+                memory_budget=memory_budget,
+                schema=schema,
+            )
+        if cursor is None:
+            chunks = ((None, chunk) for chunk in chunks)
+        else:
+            # the tracker is advanced past each chunk by the time it is generated:
+            chunks = (((0, tracker.row, tracker.locate()), chunk) for chunk in chunks)
+        if schema is not None:
+            for position, batch in chunks:
+                if cache_dir is None:
+                    if usecols is not None:
+                        batch = select_columns(batch, ["i"] + columns_to_read)
+                yield position, batch
+            return
+        for position, chunk in chunks:
+            chunk.index = chunk.index.astype("int64").rename(None)
+            if cache_dir is None:
+                if usecols is not None and list(chunk.columns) != columns_to_read:
+                    chunk = chunk[columns_to_read]
+            if vocabulary is not None:
+                chunk = vocabulary.encode_chunk(chunk, as_codes=label_codes)
+            yield position, chunk
     except DataParseError as e:
         raise StatesParseError(str(e))
-    for chunk in chunks:
-        chunk.index = chunk.index.astype("int64")
-        yield chunk
+    except ValueError as e:
+        raise StatesParseError(f"{Path(states_path).name}: {e}")
+
 
+def _trans_file_chunks(
+    file_path,
+    columns,
+    chunk_size,
+    num_workers,
+    cache_dir,
+    filters=None,
+    backend="pandas",
+    memory_budget=None,
+    schema=None,
+    row_ranges=None,
+    track_rows=False,
+    byte_ranges=None,
+    dtypes=None,
+    start_blocks=None,
+    index_dir=None,
+):
+    """Get chunks of a single *.trans* file, either parsed, or from the cache.
 
-def trans_chunks(trans_paths, chunk_size=10_000_000):
+    Parameters
+    ----------
+    file_path : str or Path
+    columns : list of str
+    chunk_size : int
+    num_workers : int or None
+    cache_dir : str or Path or None
+    filters : list of tuple, optional
+        The validated filters.
+    backend : {"pandas", "numpy"}, optional
+    memory_budget : int or str, optional
+    schema : pyarrow.Schema, optional
+        If passed, `pyarrow.RecordBatch` chunks are returned instead.
+    row_ranges : dict, optional
+        If passed, only the ``(start_row, stop_row)`` rows keyed by the `file_path`
+        are read, bypassing the cache.
+    track_rows : bool, optional
+        If ``True``, the ``(file_path, row, start_block, chunk)`` tuples are returned
+        instead of the chunks, with the number of the `row` following each chunk,
+        and its location in the file (see `bz2_blocks.RowTracker.locate`). The
+        `row_ranges` are then required.
+    byte_ranges : dict, optional
+        If passed, only the rows starting within the ``(start_byte, stop_byte)`` byte
+        range keyed by the `file_path` are read (the whole file if ``None``),
+        bypassing the cache.
+    dtypes : dict, optional
+        The validated data types of any of the `columns`.
+    start_blocks : dict, optional
+        If passed, the locations of the start rows of the `row_ranges` (see
+        `bz2_blocks.open_data_file`) keyed by the `file_path`, if known.
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar files.
+
+    Returns
+    -------
+    iterable of pandas.DataFrame or pyarrow.RecordBatch, or of tuple
+    """
+    start_row, stop_row = (row_ranges or {}).get(file_path, (None, None))
+    byte_range = (byte_ranges or {}).get(file_path)
+    start_block = (start_blocks or {}).get(file_path)
+
+    def load_chunks(schema=None, filters=None, tracker=None):
+        return load_dataframe_chunks(
+            file_path=file_path,
+            chunk_size=chunk_size,
+            column_names=columns,
+            dtype=dtypes,
+            num_workers=num_workers,
+            backend=backend,
+            memory_budget=memory_budget,
+            schema=schema,
+            start_row=start_row,
+            stop_row=stop_row,
+            byte_range=byte_range,
+            filters=filters,
+            start_block=start_block,
+            tracker=tracker,
+            index_dir=index_dir,
+        )
+
+    if row_ranges is not None or byte_range is not None:
+        cache_dir = None
+    if track_rows:
+        tracker = RowTracker(start_row or 0)
+        # the tracker is advanced past each chunk by the time it is generated:
+        return (
+            (file_path, tracker.row, tracker.locate(), chunk)
+            for chunk in load_chunks(schema, filters, tracker)
+        )
+    if cache_dir is None:
+        return load_chunks(schema, filters)
+    return cached_chunks(
+        file_path,
+        load_chunks,
+        cache_dir,
+        chunk_size,
+        variant=f"{columns}{dtypes}" if dtypes else f"{columns}",
+        filters=filters,
+        memory_budget=memory_budget,
+        schema=schema,
+    )
+
+
+def trans_chunks(
+    trans_paths,
+    chunk_size=10_000_000,
+    num_workers=None,
+    num_file_workers=None,
+    ordered=True,
+    max_chunks_in_flight=None,
+    cache_dir=None,
+    wavenumber_range=None,
+    filters=None,
+    backend="pandas",
+    memory_budget=None,
+    prefetch=None,
+    prefetch_stats=None,
+    output="pandas",
+    start_row=None,
+    stop_row=None,
+    cursor=None,
+    shard=None,
+    num_shards=None,
+    dtypes=None,
+    num_states=None,
+    index_dir=None,
+):
     """
     Get a generator of chunks of the dataset *.trans.bz* files.
 
@@ -105,9 +512,9 @@ def trans_chunks(trans_paths, chunk_size=10_000_000):
     The columns are auto-named as ``"i", "f", "A_if" [, "v_if"]``.
     The ``"i"`` and ``"f"`` columns will correspond to the index of the `DataFrames`
     yielded by the `states_chunks` generator.
-    No explicit data type casting is performed and `pandas` is trusted to correctly
-    identify the ``"i"`` and ``"f"`` columns as ``"int64"`` and rest as ``"float64"``
-    data types.
+    Unless the `dtypes` are passed, no explicit data type casting is performed and
+    `pandas` is trusted to correctly identify the ``"i"`` and ``"f"`` columns as
+    ``"int64"`` and rest as ``"float64"`` data types.
 
     Parameters
     ----------
@@ -116,11 +523,126 @@ def trans_chunks(trans_paths, chunk_size=10_000_000):
         the same dataset, but no checks are made to assert that!
     chunk_size : int, optional
         Chunk size, should be chosen appropriately with regards to RAM size, roughly
-        10_000_000 per 1GB consumed.
+        10_000_000 per 1GB consumed. Ignored if the `memory_budget` is passed.
+    num_workers : int, optional
+        If passed, each *.bz2* compressed file is decompressed block by block in
+        parallel, over a pool of `num_workers` processes. Worth it only for large files.
+    num_file_workers : int, optional
+        If passed, up to `num_file_workers` *.trans* files are read concurrently,
+        over a pool of `num_file_workers` worker processes reused for all the files.
+    ordered : bool, optional
+        Only relevant with `num_file_workers`. If ``True`` (default), the chunks are
+        yielded in the same order as they would be without `num_file_workers`,
+        otherwise the chunks are yielded as soon as they are read, from any file.
+    max_chunks_in_flight : int, optional
+        Only relevant with `num_file_workers`. Maximum number of chunks read ahead
+        by the worker processes and waiting to be yielded, capping the memory used.
+        Defaults to twice the `num_file_workers`.
+    cache_dir : str or Path, optional
+        If passed, the parsed chunks of each *.trans* file are cached in a *Parquet*
+        file in the `cache_dir` the first time the file is read, and all the
+        subsequent calls read the cached data instead, with no decompression and
+        parsing involved (see the `exomole.cache` module). Requires the optional
+        `pyarrow` package.
+    wavenumber_range : tuple of float, optional
+        The ``(lower, upper)`` wavenumber bounds in cm-1. If passed, the files split
+        by wavenumber (named such as *...__00000-00100.trans.bz2*) lying outside the
+        range are skipped without being opened. The transitions in the files read are
+        not filtered (see `filters`).
+    filters : list of tuple, optional
+        If passed, only the transitions satisfying all the ``(column, operator,
+        value)`` filters are yielded, such as ``[("A_if", ">", 1e-10)]`` or
+        ``[("i", "in", upper_ids)]``, see the `exomole.filters` module. The filters
+        are evaluated inside the reader (in the worker processes with
+        `num_file_workers`). With the ``"numpy"`` `backend`, they are evaluated on
+        the parsed column arrays, before any chunk is built out of them, and with
+        `cache_dir`, on the *Arrow* data read from the cache. With the ``"pandas"``
+        `backend`, only the columns filtered on are parsed first, and only the lines
+        satisfying the filters are then parsed into the chunks. The chunks keep the
+        original row numbers as their index.
+    backend : {"pandas", "numpy"}, optional
+        The parser backend, see `utils.load_dataframe_chunks`. The ``"numpy"``
+        backend slices the fixed-width columns out of the raw bytes with vectorised
+        `numpy` operations, rather than splitting the lines into tokens.
+    memory_budget : int or str, optional
+        The memory available for reading the chunks, such as ``"2GB"``. If passed,
+        the number of rows of each chunk is derived from the budget and from the
+        memory per row measured on the chunks already read (starting with a small
+        probing chunk), instead of the fixed `chunk_size`. With `num_file_workers`,
+        the budget is shared evenly by all the chunks which can be held at once, by
+        the worker processes and in the queues, and with `prefetch`, further by the
+        chunk being processed and the `prefetch` chunks read ahead, so each chunk
+        gets ``1 / (prefetch + 1)`` of the share. See the `exomole.memory` module.
+    prefetch : int, optional
+        If passed, up to `prefetch` following chunks are read by a background
+        thread while the current chunk is being processed by the consumer (see
+        `parallel.prefetch_chunks`).
+    prefetch_stats : parallel.PrefetchStats, optional
+        Only relevant with `prefetch`. If passed, it gets updated with the number of
+        times the consumer found no chunk prefetched, and with the total time it
+        waited for the chunks.
+    output : {"pandas", "arrow"}, optional
+        With ``"arrow"``, `pyarrow.RecordBatch` chunks are yielded instead of the
+        `pandas.DataFrame` chunks, with no index, and with the schema given by the
+        `arrow.TRANS_DTYPES` (overridden by the `dtypes`). With the ``"numpy"``
+        `backend`, the record batches are built directly out of the parsed arrays,
+        and with `cache_dir`, out of the cached data, with no `pandas` involved.
+        Requires the optional `pyarrow` package.
+    start_row, stop_row : int, optional
+        If passed, only the rows ``start_row:stop_row`` (0-based, with the `stop_row`
+        excluded) of all the *.trans* files are read, counting the rows through the
+        sorted files (after the `wavenumber_range` applied), and with the `filters`
+        applied on the rows read. The *.bz2* compressed files are decompressed only
+        from the block holding the first row needed, located by their block index
+        built on the first access and kept in a sidecar file (see the `index_dir`
+        and the `exomole.bz2_blocks` module). The numbers of rows of the files preceding
+        the `start_row` are taken from their block indexes as well. The chunks keep
+        the row numbers within each file as their index. The `cache_dir` is
+        ignored.
+    cursor : cursor.ScanCursor, optional
+        If passed, the reading starts from the position of the `cursor` (the index
+        of the *.trans* file and the number of its rows already read), which is
+        updated with every chunk yielded, to point just past the chunk, and once all
+        the files are read, to point past the last file. The cursor can be saved at
+        any chunk boundary, and passed again with the same `trans_paths` to resume
+        the reading with no files re-read, and with a *.bz2* file decompressed
+        straight from the block holding the next row (see the `exomole.cursor`
+        module). Cannot be combined with the `start_row` and
+        `stop_row`, or with the unordered `num_file_workers`. The `cache_dir` is
+        ignored.
+    shard, num_shards : int, optional
+        If passed, only the `shard` (0-based) out of the `num_shards` balanced and
+        disjoint shards of all the *.trans* files (after the `wavenumber_range`
+        applied) is read, so the files can be split between `num_shards`
+        independent workers, possibly on different nodes, with no coordination.
+        The shards are balanced by the sizes of the (compressed) files, rather than
+        by their numbers, and split on the file, *bz2* block or byte-range
+        boundaries (see `parallel.get_shard_ranges`). The chunks of the files split
+        between the shards are indexed by the row numbers counted from the start of
+        the shard within each file, and never read from the `cache_dir`. Cannot be
+        combined with the `start_row`, the `stop_row` and the `cursor`.
+    dtypes : dict, optional
+        Data types keyed by any of the column names, such as returned by
+        `DefParser.get_trans_dtypes`, for example ``{"i": "int32", "f": "int32",
+        "A_if": "float32"}``. The columns are parsed directly into the data types,
+        with no inference, while the columns missing from `dtypes` are inferred.
+        The ``"v_if"`` data type is ignored for the *.trans* files with no
+        wavenumbers. The state IDs narrower than ``"int64"`` need the `num_states`
+        to be checked against, as the values overflowing the data type would not
+        be detected.
+    num_states : int, optional
+        Number of the states of the dataset, such as `DefParser.num_states`. Only
+        relevant with `dtypes`, checked to fit into the data types of the ``"i"``
+        and ``"f"`` columns.
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar files of the *.trans* files, needed
+        with the `start_row` or the `stop_row` (see `bz2_blocks.get_block_index`).
+        Next to the *.trans* files by default, or ``False`` for the block indexes
+        only kept in the memory.
 
     Yields
     ------
-    trans_chunk : pd.DataFrame
+    trans_chunk : pd.DataFrame or pyarrow.RecordBatch
         Generated chunks of all the *.trans* files, each is a `pandas.DataFrame` with
         auto-named columns.
 
@@ -128,6 +650,13 @@ def trans_chunks(trans_paths, chunk_size=10_000_000):
     ------
     TransParseError
         If the first *.trans* file has number of columns other than ``{3, 4}``.
+    DataParseError
+        With the ``"numpy"`` `backend`, if any of the *.trans* files is not
+        fixed-width.
+    ValueError
+        If any of the `filters`, the `memory_budget`, the `output`, the `start_row`,
+        the `stop_row`, the `cursor`, the `shard` or the `dtypes` is invalid, or if
+        the `num_states` do not fit into the data type of the state IDs.
 
     Examples
     --------
@@ -147,6 +676,94 @@ def trans_chunks(trans_paths, chunk_size=10_000_000):
     2  2  8  0.723996  0.426885
     """
     trans_paths = sorted(trans_paths)
+    if wavenumber_range is not None:
+        trans_paths = filter_trans_paths(trans_paths, wavenumber_range)
+    chunks = _trans_chunks(
+        trans_paths,
+        chunk_size=chunk_size,
+        num_workers=num_workers,
+        num_file_workers=num_file_workers,
+        ordered=ordered,
+        max_chunks_in_flight=max_chunks_in_flight,
+        cache_dir=cache_dir,
+        filters=filters,
+        backend=backend,
+        memory_budget=memory_budget,
+        prefetch=prefetch,
+        output=output,
+        start_row=start_row,
+        stop_row=stop_row,
+        cursor=cursor,
+        shard=shard,
+        num_shards=num_shards,
+        dtypes=dtypes,
+        num_states=num_states,
+        index_dir=index_dir,
+    )
+    if prefetch:
+        chunks = prefetch_chunks(chunks, prefetch, stats=prefetch_stats)
+    for position, chunk in chunks:
+        if cursor is not None:
+            cursor.advance(trans_paths, *position)
+        yield chunk
+    if cursor is not None:
+        # only known once the consumer asks for a chunk past the last one:
+        cursor.advance(trans_paths, len(trans_paths))
+
+
+def _trans_chunks(
+    trans_paths,
+    chunk_size,
+    num_workers,
+    num_file_workers,
+    ordered,
+    max_chunks_in_flight,
+    cache_dir,
+    filters,
+    backend,
+    memory_budget,
+    prefetch,
+    output,
+    start_row,
+    stop_row,
+    cursor,
+    shard,
+    num_shards,
+    dtypes,
+    num_states,
+    index_dir,
+):
+    """Generator of the ``(position, chunk)`` of the sorted `trans_paths`, with the
+    ``(file_index, row, start_block)`` cursor `position` following each chunk, or
+    ``None`` with no `cursor`. See `trans_chunks` for the parameters."""
+    check_output(output)
+    all_trans_paths = trans_paths
+    row_ranges, byte_ranges, start_blocks = None, None, None
+    if shard is not None or num_shards is not None:
+        if cursor is not None or start_row is not None or stop_row is not None:
+            raise ValueError(
+                "The shards cannot be combined with the cursor, or start or stop rows."
+            )
+        byte_ranges = get_shard_ranges(trans_paths, shard, num_shards)
+        trans_paths = list(byte_ranges)
+    elif cursor is not None:
+        if start_row is not None or stop_row is not None:
+            raise ValueError("The cursor cannot be combined with start or stop rows.")
+        if num_file_workers is not None and not ordered:
+            raise ValueError("The cursor requires the ordered num_file_workers.")
+        cursor.check(trans_paths)
+        trans_paths = trans_paths[cursor.file_index :]
+        row_ranges = {file_path: (None, None) for file_path in trans_paths}
+        if trans_paths and cursor.row:
+            row_ranges[trans_paths[0]] = (cursor.row, None)
+            start_blocks = {trans_paths[0]: cursor.start_block}
+    elif start_row is not None or stop_row is not None:
+        row_ranges = _get_row_ranges(
+            trans_paths, start_row, stop_row, num_workers, index_dir
+        )
+        trans_paths = list(row_ranges)
+    if not trans_paths:
+        return
 
     num_cols = get_num_columns(trans_paths[0])
     columns = ["i", "f", "A_if"]
@@ -157,10 +774,137 @@ def trans_chunks(trans_paths, chunk_size=10_000_000):
             f"Unexpected number of columns in {Path(trans_paths[0]).name}: {num_cols}"
         )
     assert num_cols in {3, 4}
-    # yield all the chunks from all the files:
-    for file_path in trans_paths:
-        chunks = load_dataframe_chunks(
-            file_path=file_path, chunk_size=chunk_size, column_names=columns
+    filters = validate_filters(filters or [], columns)
+    dtypes = _check_trans_dtypes(columns, dtypes, num_states)
+    if memory_budget is not None:
+        memory_budget = parse_memory_size(memory_budget)
+        if num_file_workers is not None:
+            if max_chunks_in_flight is None:
+                max_chunks_in_flight = 2 * num_file_workers
+            memory_budget //= num_file_workers + max_chunks_in_flight
+        memory_budget //= (prefetch or 0) + 1
+    load_file_chunks = partial(
+        _trans_file_chunks,
+        columns=columns,
+        chunk_size=chunk_size,
+        num_workers=num_workers,
+        cache_dir=cache_dir,
+        filters=filters,
+        backend=backend,
+        memory_budget=memory_budget,
+        schema=(
+            get_arrow_schema(columns, {**TRANS_DTYPES, **dtypes})
+            if output == "arrow"
+            else None
+        ),
+        row_ranges=row_ranges,
+        track_rows=cursor is not None,
+        byte_ranges=byte_ranges,
+        dtypes=dtypes or None,
+        start_blocks=start_blocks,
+        index_dir=index_dir,
+    )
+    if num_file_workers is not None:
+        chunks = file_chunks_in_parallel(
+            load_file_chunks,
+            trans_paths,
+            num_workers=num_file_workers,
+            ordered=ordered,
+            max_chunks_in_flight=max_chunks_in_flight,
+        )
+    else:
+        # all the chunks from all the files:
+        chunks = (
+            chunk for file_path in trans_paths for chunk in load_file_chunks(file_path)
         )
+    if cursor is None:
         for chunk in chunks:
-            yield chunk
+            yield None, chunk
+        return
+    file_indices = {file_path: n for n, file_path in enumerate(all_trans_paths)}
+    for file_path, row, start_block, chunk in chunks:
+        yield (file_indices[file_path], row, start_block), chunk
+
+
+def _get_row_ranges(trans_paths, start_row, stop_row, num_workers=None, index_dir=None):
+    """Split the rows ``start_row:stop_row`` counted through all the `trans_paths`
+    into the rows of the individual files.
+
+    The numbers of rows are only counted for the files preceding the `stop_row`
+    (or the `start_row`, if no `stop_row`).
+
+    Parameters
+    ----------
+    trans_paths : list of (str or Path)
+    start_row, stop_row : int or NoneType
+    num_workers : int, optional
+    index_dir : str or Path or bool, optional
+
+    Returns
+    -------
+    dict
+        The ``(start_row, stop_row)`` within each file keyed by the paths of only the
+        files holding any of the rows, in the order of the `trans_paths`. Either can
+        be ``None`` for the file start or end.
+
+    Raises
+    ------
+    ValueError
+        If the `start_row` or the `stop_row` is negative.
+    """
+    start_row = start_row or 0
+    for row in [start_row, stop_row]:
+        if row is not None and row < 0:
+            raise ValueError(f"Invalid row number: {row}")
+    row_ranges = {}
+    offset = 0
+    for file_path in trans_paths:
+        if stop_row is not None and offset >= stop_row:
+            break
+        if offset >= start_row and stop_row is None:
+            row_ranges[file_path] = (None, None)
+            continue
+        num_rows = get_num_rows(file_path, num_workers=num_workers, index_dir=index_dir)
+        file_start = max(start_row - offset, 0)
+        file_stop = None
+        if stop_row is not None and stop_row - offset < num_rows:
+            file_stop = stop_row - offset
+        if file_start < (num_rows if file_stop is None else file_stop):
+            row_ranges[file_path] = (file_start or None, file_stop)
+        offset += num_rows
+    return row_ranges
+
+
+def _check_trans_dtypes(columns, dtypes, num_states):
+    """Validate the `dtypes` of the *.trans* `columns` passed to `trans_chunks`.
+
+    Returns
+    -------
+    dict
+        The names of the data types of the `columns`, keyed by the column names.
+
+    Raises
+    ------
+    ValueError
+        If any of the `dtypes` is not among the `columns`, or does not suit the
+        column, or if the `num_states` are not passed or do not fit into the data
+        type of the state IDs.
+    """
+    checked = {}
+    for col, dtype in (dtypes or {}).items():
+        if col not in columns + ["v_if"]:
+            raise ValueError(f"Column {col} not among {columns}.")
+        dtype = np.dtype(dtype)
+        if col in {"i", "f"}:
+            if dtype.kind not in "iu":
+                raise ValueError(f"Invalid data type of the state IDs: {dtype}")
+            if dtype.itemsize < 8:
+                if num_states is None:
+                    raise ValueError(f"The num_states are required for {dtype} IDs.")
+                if num_states > np.iinfo(dtype).max:
+                    raise ValueError(f"{num_states} states do not fit into {dtype}.")
+        elif dtype.kind != "f":
+            raise ValueError(f"Invalid data type of the {col} column: {dtype}")
+        if col in columns:
+            checked[col] = dtype.name
+    return checked
@@ -4,8 +4,10 @@ ExoMol *.def* files.
 import warnings
 from pathlib import Path
 
+import numpy as np
 from pyvalem.formula import Formula, FormulaParseError
 
+from .arrow import get_arrow_schema
 from .exceptions import (
     LineValueError,
     LineCommentError,
@@ -17,8 +19,10 @@ from .utils import (
     get_file_raw_text_over_api,
     parse_exomol_line,
     get_num_columns,
+    filter_trans_paths,
     DataClass,
 )
+from .vocabulary import LabelVocabulary
 
 
 # noinspection PyUnresolvedReferences
@@ -93,6 +97,39 @@ class Quantum(DataClass):
     def __repr__(self):
         return f"Quantum({self.label})"
 
+    def get_dtype(self):
+        """Data type of the quantum column in the *.states* file, as implied by the
+        quantum format.
+
+        The format in the *.def* file is given both in the Fortran and in the C
+        notation (e.g. ``"I4 %4d"``), the C conversion character is used if present.
+        Integer quanta are mapped to ``"int32"``, real quanta to ``"float64"`` and any
+        other (string) quanta to ``"category"``.
+
+        Returns
+        -------
+        str
+
+        Examples
+        --------
+        >>> Quantum("v", "I4 %4d", "vibrational quantum number").get_dtype()
+        'int32'
+        >>> Quantum("par", "A1 %1s", "total parity: '+' or '-'").get_dtype()
+        'category'
+        """
+        fmt = self.format.split()[-1] if self.format.strip() else ""
+        if fmt.startswith("%"):
+            conversion = fmt[-1].lower()
+        else:
+            conversion = {"i": "d", "f": "f", "e": "e", "d": "e", "g": "g"}.get(
+                fmt[:1].lower(), "s"
+            )
+        if conversion in {"d", "i"}:
+            return "int32"
+        if conversion in {"f", "e", "g"}:
+            return "float64"
+        return "category"
+
 
 class DefParser:
     """Class handling parsing of any particular *.def* file.
@@ -180,6 +217,8 @@ class DefParser:
     >>> # with parser.lifetime_availability, we expect 9 columns in the .states file
     >>> parser.get_states_header()
     ['i', 'E', 'g_tot', 'J', 'tau', 'par', 'v', 'N', 'e/f']
+    >>> parser.get_states_dtypes()["v"]
+    'int32'
     """
 
     def __init__(
@@ -463,17 +502,7 @@ class DefParser:
         assert self.local, "check_consistency only available in the local mode!"
         if not self.parsed:
             self.parse(warn_on_comments=False)
-        file_name = self.path.name[:-4]
-        dataset_dir = self.path.parent
-        for states_suffix in ["states", "states.bz2"]:
-            # some .states files are not bz2-compressed!
-            states_path = dataset_dir / f"{file_name}.{states_suffix}"
-            if states_path.is_file():
-                break
-        else:
-            raise DefConsistencyError(
-                f"A '{file_name}.states(.bz2)' file needs to exist in {dataset_dir}!"
-            )
+        states_path = self.get_states_path()
         num_columns = get_num_columns(states_path)
         if num_columns != len(self.get_states_header()):
             raise DefConsistencyError(
@@ -481,8 +510,59 @@ class DefParser:
                 f"agree with the length of the expected .states header parsed from the "
                 f"{self.path.name} file ({len(self.get_states_header())})."
             )
-        if not list(dataset_dir.glob(f"{file_name}*.trans.bz2")):
-            raise DefConsistencyError(f"No trans files found in {dataset_dir}!")
+        if not self.get_trans_paths():
+            raise DefConsistencyError(f"No trans files found in {self.path.parent}!")
+
+    def get_states_path(self):
+        """Get the path to the *.states* file belonging to the *.def* file.
+
+        The *.states* file is expected in the same directory as the *.def* file, either
+        *.bz2*-compressed, or not.
+
+        Returns
+        -------
+        Path
+
+        Raises
+        ------
+        DefConsistencyError
+            If the *.states* file does not exist.
+        """
+        assert self.local, "get_states_path only available in the local mode!"
+        file_name = self.path.name[:-4]
+        dataset_dir = self.path.parent
+        for states_suffix in ["states", "states.bz2"]:
+            # some .states files are not bz2-compressed!
+            states_path = dataset_dir / f"{file_name}.{states_suffix}"
+            if states_path.is_file():
+                return states_path
+        raise DefConsistencyError(
+            f"A '{file_name}.states(.bz2)' file needs to exist in {dataset_dir}!"
+        )
+
+    def get_trans_paths(self, wavenumber_range=None):
+        """Get the sorted paths to all the *.trans.bz2* files belonging to the *.def*
+        file.
+
+        The *.trans.bz2* files are expected in the same directory as the *.def* file.
+
+        Parameters
+        ----------
+        wavenumber_range : tuple of float, optional
+            The ``(lower, upper)`` wavenumber bounds in cm-1. If passed, only the
+            files overlapping the range are returned, out of the files split by
+            wavenumber (see `utils.filter_trans_paths`).
+
+        Returns
+        -------
+        list of Path
+        """
+        assert self.local, "get_trans_paths only available in the local mode!"
+        file_name = self.path.name[:-4]
+        trans_paths = sorted(self.path.parent.glob(f"{file_name}*.trans.bz2"))
+        if wavenumber_range is not None:
+            trans_paths = filter_trans_paths(trans_paths, wavenumber_range)
+        return trans_paths
 
     def get_quanta_labels(self):
         """Quanta labels for all the quanta extracted from the parsed *.def* file.
@@ -514,6 +594,91 @@ class DefParser:
         states_header.extend(self.get_quanta_labels())
         return states_header
 
+    def get_states_dtypes(self):
+        """Get the data types of all the columns of the associated *.states* file.
+
+        The mandatory columns are mapped to ``"int64"`` (``"i"``), ``"float64"``
+        (``"E"``, ``"J"``, ``"tau"``, ``"g_J"``) and ``"int32"`` (``"g_tot"``), while
+        the data types of the quanta columns are derived from their formats (see
+        `Quantum.get_dtype`).
+        The `parse` method must have been called first and finished without errors.
+
+        Returns
+        -------
+        dict
+            Data types keyed by the column names in the order of `get_states_header`.
+            Can be passed as the `dtypes` argument to `read_data.states_chunks`.
+        """
+        mandatory_dtypes = {
+            "i": "int64",
+            "E": "float64",
+            "g_tot": "int32",
+            "J": "float64",
+            "tau": "float64",
+            "g_J": "float64",
+        }
+        quanta_dtypes = {q.label: q.get_dtype() for q in self.quanta}
+        return {
+            col: mandatory_dtypes[col]
+            if col in mandatory_dtypes
+            else quanta_dtypes[col]
+            for col in self.get_states_header()
+        }
+
+    def get_trans_dtypes(self, a_dtype="float32", v_dtype="float64"):
+        """Get compact data types of the columns of the associated *.trans* files.
+
+        The state IDs are mapped to ``"int32"`` if all the `num_states` fit into it,
+        and to ``"int64"`` otherwise.
+        The `parse` method must have been called first and finished without errors.
+
+        Parameters
+        ----------
+        a_dtype : str, optional
+            Data type of the Einstein A coefficients.
+        v_dtype : str, optional
+            Data type of the wavenumbers (if present in the *.trans* files).
+
+        Returns
+        -------
+        dict
+            Data types keyed by the column names. Can be passed as the `dtypes`
+            argument to `read_data.trans_chunks`, together with the `num_states`.
+        """
+        id_dtype = "int32" if self.num_states <= np.iinfo("int32").max else "int64"
+        return {"i": id_dtype, "f": id_dtype, "A_if": a_dtype, "v_if": v_dtype}
+
+    def get_label_vocabulary(self):
+        """Get an empty vocabulary of the labels of the string quanta columns.
+
+        The label columns are the quanta with the ``"category"`` data type (see
+        `Quantum.get_dtype`). The vocabulary can be passed to the
+        `read_data.states_chunks` to get the quantum labels encoded with the same
+        codes in all the chunks.
+        The `parse` method must have been called first and finished without errors.
+
+        Returns
+        -------
+        LabelVocabulary
+        """
+        return LabelVocabulary(
+            [q.label for q in self.quanta if q.get_dtype() == "category"]
+        )
+
+    def get_states_schema(self):
+        """Get the *Arrow* schema of the associated *.states* file.
+
+        The schema of the record batches yielded by the `read_data.states_chunks`
+        with ``output="arrow"``, with the data types given by `get_states_dtypes`.
+        The `parse` method must have been called first and finished without errors.
+        Requires the optional `pyarrow` package.
+
+        Returns
+        -------
+        pyarrow.Schema
+        """
+        return get_arrow_schema(self.get_states_header(), self.get_states_dtypes())
+
 
 def parse_def(isotopologue_slug, dataset_name=None, data_dir_path="."):
     """A top-level function for getting and parsing the exomol .def file
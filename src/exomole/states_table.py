@@ -0,0 +1,302 @@
+"""Module containing the in-memory table of states, addressed by the state ID.
+
+The states IDs in the ExoMol *.states* files are dense 1-based integers, so all the
+columns of the *.states* file can be stored as dense arrays with the state ID being
+the position in the array. Looking up the states belonging to any sequence of state
+IDs (such as the ``"i"`` and ``"f"`` columns of the *.trans* chunks) is then a plain
+vectorised array gather, instead of a `pandas` re-index or merge.
+"""
+
+import numpy as np
+import pandas
+
+from .exceptions import StatesLookupError
+
+
+class StatesTable:
+    """Table of states with each column stored as a dense array indexed by state ID.
+
+    Instances are built from the `read_data.states_chunks` generator by the
+    `from_chunks` class method. The numeric columns are stored as `numpy` arrays,
+    the categorical columns as integer codes with the categories shared across all
+    the chunks, and any other columns as arrays of objects. The array positions not
+    belonging to any state (at least the position 0) are padded with ``NaN`` for the
+    float columns and with zeros, or ``None``, otherwise.
+
+    Parameters
+    ----------
+    arrays : dict of numpy.ndarray
+        The dense arrays for all the columns, keyed by the column names.
+    present : numpy.ndarray of bool
+        Mask of the array positions belonging to the states read.
+    categories : dict of list, optional
+        Categories of the categorical columns (the arrays of which hold the codes).
+
+    Examples
+    --------
+    >>> from exomole.read_data import states_chunks
+    >>> sp = "tests/resources/dummy_states_10x5_int_float_int_str_int.states.bz2"
+    >>> table = StatesTable.from_chunks(
+    ...     states_chunks(
+    ...         sp,
+    ...         columns=["i", "a", "b", "c", "d"],
+    ...         chunk_size=3,
+    ...         dtypes={"a": "float64", "b": "int32", "c": "category"},
+    ...     )
+    ... )
+    >>> table.max_id, len(table)
+    (10, 10)
+    >>> table.take([3, 1, 3], columns=["b", "c"])
+        b  c
+    0  57  c
+    1  88  a
+    2  57  c
+    >>> table["b"][[3, 1, 3]]
+    array([57, 88, 57], dtype=int32)
+    """
+
+    def __init__(self, arrays, present, categories=None):
+        self.arrays = arrays
+        self.present = present
+        self.categories = categories or {}
+
+    @classmethod
+    def from_chunks(cls, states_chunks, columns=None, num_states=None):
+        """Build the table from the chunks of a *.states* file.
+
+        Parameters
+        ----------
+        states_chunks : iterable of pandas.DataFrame
+            Chunks indexed by the state ID, such as yielded by
+            `read_data.states_chunks`. Preferably with the data types passed, as
+            the ``str`` columns are stored as arrays of objects.
+        columns : list of str, optional
+            Only these columns are stored if passed.
+        num_states : int, optional
+            Expected number of states (such as `DefParser.num_states`), used to
+            allocate the arrays up front. The arrays are grown as needed otherwise.
+
+        Returns
+        -------
+        StatesTable
+        """
+        capacity = (num_states or 0) + 1
+        arrays, categories, code_maps = {}, {}, {}
+        present = np.zeros(capacity, dtype=bool)
+        max_id = 0
+        for chunk in states_chunks:
+            if columns is not None:
+                chunk = chunk[list(columns)]
+            ids = chunk.index.to_numpy()
+            if len(ids) and ids.min() < 1:
+                raise StatesLookupError(f"Invalid state ID {ids.min()} encountered.")
+            chunk_max_id = int(ids.max()) if len(ids) else 0
+            if chunk_max_id >= capacity:
+                capacity = max(chunk_max_id + 1, 2 * capacity)
+                present = _grown(present, capacity)
+                for col in arrays:
+                    fill = -1 if col in code_maps else None
+                    arrays[col] = _grown(arrays[col], capacity, fill)
+            max_id = max(max_id, chunk_max_id)
+            present[ids] = True
+            for col in chunk.columns:
+                values = chunk[col]
+                if isinstance(values.dtype, pandas.CategoricalDtype):
+                    code_map = code_maps.setdefault(col, {})
+                    chunk_codes = [
+                        code_map.setdefault(cat, len(code_map))
+                        for cat in values.cat.categories
+                    ]
+                    # the missing values (code -1) are mapped to -1:
+                    values = np.append(chunk_codes, -1)[values.cat.codes.to_numpy()]
+                    values = values.astype("int32")
+                else:
+                    values = values.to_numpy()
+                if col not in arrays:
+                    fill = -1 if col in code_maps else None
+                    empty = np.empty(0, dtype=values.dtype)
+                    arrays[col] = _grown(empty, capacity, fill)
+                elif arrays[col].dtype != values.dtype:
+                    common = np.result_type(arrays[col].dtype, values.dtype)
+                    arrays[col] = arrays[col].astype(common)
+                arrays[col][ids] = values
+        for col, code_map in code_maps.items():
+            categories[col] = list(code_map)
+        arrays = {col: array[: max_id + 1] for col, array in arrays.items()}
+        return cls(arrays, present[: max_id + 1], categories)
+
+    @property
+    def max_id(self):
+        """The highest state ID in the table."""
+        return len(self.present) - 1
+
+    @property
+    def columns(self):
+        """Names of all the columns in the table."""
+        return list(self.arrays)
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    def __getitem__(self, column):
+        """Dense array of a column (codes for the categorical columns)."""
+        return self.arrays[column]
+
+    def validate_ids(self, ids):
+        """Check that all the `ids` belong to the states in the table.
+
+        Parameters
+        ----------
+        ids : array-like of int
+
+        Returns
+        -------
+        numpy.ndarray
+
+        Raises
+        ------
+        StatesLookupError
+            If any of the `ids` is not a state ID in the table.
+        """
+        ids = np.asarray(ids)
+        if not len(ids):
+            return ids
+        if ids.min() < 0 or ids.max() > self.max_id or not self.present[ids].all():
+            in_bounds = (ids >= 0) & (ids <= self.max_id)
+            missing = ids[~in_bounds]
+            if not len(missing):
+                missing = ids[~self.present[ids]]
+            raise StatesLookupError(f"State ID {missing[0]} not found in the table.")
+        return ids
+
+    def take(self, ids, columns=None):
+        """Look up the states for any sequence of state IDs.
+
+        Parameters
+        ----------
+        ids : array-like of int
+            The state IDs, such as the ``"i"`` or ``"f"`` column of a *.trans* chunk.
+        columns : list of str, optional
+            Columns to look up, defaults to all the columns.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The looked up states, with rows in the order of the `ids` passed.
+
+        Raises
+        ------
+        StatesLookupError
+            If any of the `ids` is not a state ID in the table.
+        """
+        ids = self.validate_ids(ids)
+        if columns is None:
+            columns = self.columns
+        data = {}
+        for col in columns:
+            values = self.arrays[col][ids]
+            if col in self.categories:
+                values = pandas.Categorical.from_codes(values, self.categories[col])
+            data[col] = values
+        return pandas.DataFrame(data, columns=list(columns))
+
+
+def _grown(array, size, fill=None):
+    """Copy of the 1-D `array` padded to the `size` with the `fill` value, which
+    defaults to the missing value appropriate for the array data type."""
+    grown = np.empty(size, dtype=array.dtype)
+    grown[: len(array)] = array
+    if fill is not None:
+        grown[len(array) :] = fill
+    elif array.dtype.kind == "f":
+        grown[len(array) :] = np.nan
+    elif array.dtype.kind == "O":
+        grown[len(array) :] = None
+    else:
+        grown[len(array) :] = 0
+    return grown
+
+
+def join_states(trans_chunks, states_table, columns=None, dtype="float64"):
+    """Join the states data onto the chunks of transitions.
+
+    For each of the transitions chunks, the columns of the upper (``"i"``) and lower
+    (``"f"``) states are looked up in the `states_table` by array gathers, and
+    yielded under the ``"<column>_i"`` and ``"<column>_f"`` names, such as ``"E_f"``
+    for the lower-state energy, or ``"g_tot_i"`` for the upper-state degeneracy.
+    If the ``"v_if"`` wavenumber is requested but missing from the transitions chunk,
+    it is calculated as ``E_i - E_f``.
+
+    Parameters
+    ----------
+    trans_chunks : iterable of pandas.DataFrame
+        Such as yielded by `read_data.trans_chunks`.
+    states_table : StatesTable
+    columns : list of str, optional
+        Columns of the yielded chunks, any of the transitions columns, or of the
+        states table columns suffixed with ``"_i"`` or ``"_f"``.
+        Defaults to ``["i", "f", "A_if", "v_if", "E_f", "g_tot_i"]``.
+    dtype : str or numpy.dtype, optional
+        Data type of all the floating-point columns yielded.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Chunks with the `columns` requested, indexed the same as the transitions
+        chunks.
+
+    Raises
+    ------
+    ValueError
+        If any of the `columns` requested is not available.
+    StatesLookupError
+        If any of the transitions refers to a state missing from the `states_table`.
+
+    Examples
+    --------
+    >>> from exomole.read_data import states_chunks, trans_chunks
+    >>> sp = "tests/resources/dummy_states_10x5_int_float_int_str_int.states.bz2"
+    >>> table = StatesTable.from_chunks(
+    ...     states_chunks(
+    ...         sp, ["i", "E", "g_tot", "c", "d"], dtypes={"E": float, "g_tot": int}
+    ...     )
+    ... )
+    >>> tp = "tests/resources/dummy_trans_5x3_int_int_float.trans.bz2"
+    >>> for chunk in join_states(trans_chunks([tp]), table, dtype="float32"):
+    ...     print(chunk)
+       i  f      A_if      v_if       E_f  g_tot_i
+    0  8  2  0.957667 -0.012213  0.477299       99
+    1  2  3  0.657848  0.153374  0.323925       90
+    2  8  5  0.164547 -0.351778  0.816864       99
+    3  7  9  0.468594  0.469866  0.368801        4
+    4  7  9  0.854796  0.469866  0.368801        4
+    """
+    if columns is None:
+        columns = ["i", "f", "A_if", "v_if", "E_f", "g_tot_i"]
+    for chunk in trans_chunks:
+        ids = {}
+
+        def state_values(state_col, side):
+            if side not in ids:
+                ids[side] = states_table.validate_ids(chunk[side].to_numpy())
+            values = states_table[state_col][ids[side]]
+            if state_col in states_table.categories:
+                categories = states_table.categories[state_col]
+                values = pandas.Categorical.from_codes(values, categories)
+            return values
+
+        data = {}
+        for col in columns:
+            state_col, _, side = col.rpartition("_")
+            if col in chunk.columns:
+                values = chunk[col].to_numpy()
+            elif col == "v_if" and "E" in states_table.columns:
+                values = state_values("E", "i") - state_values("E", "f")
+            elif side in {"i", "f"} and state_col in states_table.columns:
+                values = state_values(state_col, side)
+            else:
+                raise ValueError(f"Column {col} not available for the join!")
+            if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+                values = values.astype(dtype, copy=False)
+            data[col] = values
+        yield pandas.DataFrame(data, index=chunk.index, columns=list(columns))
@@ -0,0 +1,398 @@
+"""Module containing functionality for converting the ExoMol *.trans* data into a
+fixed-width binary file, which can be memory-mapped.
+
+The binary *trans store* consists of a small fixed-size header, followed by the
+packed little-endian ``(i, f, A_if[, v_if])`` records, with ``int32`` state indices,
+``float32`` or ``float64`` Einstein coefficients and (optionally) ``float64``
+wavenumbers.
+Memory-mapping the store gives a `numpy` structured array, which is sliced with no
+copying, and the pages of which are shared by all the processes reading the same
+store through the operating system page cache.
+
+The *.trans* files are ordered by the states, while the line-by-line radiative
+transfer codes need the transitions ordered by the wavenumber. The store can
+therefore also be written sorted by the ``v_if`` wavenumbers (see
+`write_sorted_trans_store`), by an external merge sort within a memory budget: the
+transitions are sorted in runs fitting the budget, spilled to the disk, and the runs
+are then merged block by block.
+"""
+
+import itertools
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from .exceptions import TransParseError
+from .memory import parse_memory_size
+
+_MAGIC = b"EXOMOLTR"
+_VERSION = 1
+# magic, version, A_if item size, v_if flag, number of records:
+_HEADER_FORMAT = "<8sHB?Q"
+HEADER_SIZE = 64
+
+
+def get_store_dtype(a_dtype="float32", with_v_if=True):
+    """Get the `numpy` structured data type of the trans store records.
+
+    Parameters
+    ----------
+    a_dtype : {"float32", "float64"}, optional
+        Data type of the Einstein A coefficients.
+    with_v_if : bool, optional
+        If ``True``, the records include the ``"v_if"`` wavenumbers.
+
+    Returns
+    -------
+    numpy.dtype
+
+    Examples
+    --------
+    >>> get_store_dtype().itemsize
+    20
+    >>> get_store_dtype("float64", with_v_if=False).names
+    ('i', 'f', 'A_if')
+    """
+    a_dtype = np.dtype(a_dtype)
+    if a_dtype not in {np.dtype("float32"), np.dtype("float64")}:
+        raise ValueError(f"Unsupported A_if data type: {a_dtype}")
+    fields = [("i", "<i4"), ("f", "<i4"), ("A_if", a_dtype.newbyteorder("<"))]
+    if with_v_if:
+        fields.append(("v_if", "<f8"))
+    return np.dtype(fields)
+
+
+def _pack_header(dtype, num_records):
+    header = struct.pack(
+        _HEADER_FORMAT,
+        _MAGIC,
+        _VERSION,
+        dtype["A_if"].itemsize,
+        "v_if" in dtype.names,
+        num_records,
+    )
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def _unpack_header(raw, file_name):
+    magic, version, a_itemsize, with_v_if, num_records = struct.unpack(
+        _HEADER_FORMAT, raw[: struct.calcsize(_HEADER_FORMAT)]
+    )
+    if magic != _MAGIC or version != _VERSION:
+        raise TransParseError(f"{file_name} is not a valid trans store file.")
+    dtype = get_store_dtype(a_dtype=f"float{8 * a_itemsize}", with_v_if=with_v_if)
+    return dtype, num_records
+
+
+def _to_records(chunk, dtype):
+    """Convert the chunk of transitions into the trans store records.
+
+    Raises
+    ------
+    TransParseError
+        If any of the state indices does not fit into ``int32``, or if the
+        ``"v_if"`` column is required but missing.
+    """
+    if "v_if" in dtype.names and "v_if" not in chunk.columns:
+        raise TransParseError("The v_if column is missing in the chunk.")
+    records = np.empty(len(chunk), dtype=dtype)
+    max_index = np.iinfo("int32").max
+    for col in dtype.names:
+        values = chunk[col].to_numpy()
+        if col in {"i", "f"} and len(values) and values.max() > max_index:
+            raise TransParseError(
+                f"State index {values.max()} does not fit into int32."
+            )
+        records[col] = values
+    return records
+
+
+def _write_store(store_path, dtype, record_blocks):
+    """Write the blocks of records into the trans store file, moved in place only
+    after all the blocks have been written, and return the number of records."""
+    store_path = Path(store_path)
+    tmp_path = store_path.with_name(f"{store_path.name}.{os.getpid()}.tmp")
+    num_records = 0
+    try:
+        with open(tmp_path, "wb") as fp:
+            fp.write(b"\0" * HEADER_SIZE)
+            for records in record_blocks:
+                records.tofile(fp)
+                num_records += len(records)
+            fp.seek(0)
+            fp.write(_pack_header(dtype, num_records))
+        os.replace(tmp_path, store_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return num_records
+
+
+def write_trans_store(trans_chunks, store_path, a_dtype="float32", with_v_if=None):
+    """Write the transitions data into the binary trans store file.
+
+    Parameters
+    ----------
+    trans_chunks : iterable of pandas.DataFrame
+        Chunks with the ``"i"``, ``"f"``, ``"A_if"`` (and optionally ``"v_if"``)
+        columns, such as generated by `read_data.trans_chunks`.
+    store_path : str or Path
+        Path of the binary file to write. The file is only moved in place after all
+        the chunks have been written.
+    a_dtype : {"float32", "float64"}, optional
+        Data type of the stored Einstein A coefficients.
+    with_v_if : bool, optional
+        If ``True``, the ``"v_if"`` column is stored. By default, it is stored if
+        present in the first chunk.
+
+    Returns
+    -------
+    num_records : int
+        Number of transitions written.
+
+    Raises
+    ------
+    TransParseError
+        If any of the state indices does not fit into ``int32``, or if the
+        ``"v_if"`` column is required but missing.
+    """
+    trans_chunks = iter(trans_chunks)
+    first_chunk = next(trans_chunks, None)
+    if first_chunk is not None:
+        trans_chunks = itertools.chain([first_chunk], trans_chunks)
+        if with_v_if is None:
+            with_v_if = "v_if" in first_chunk.columns
+    dtype = get_store_dtype(a_dtype, with_v_if=bool(with_v_if))
+    record_blocks = (_to_records(chunk, dtype) for chunk in trans_chunks)
+    return _write_store(store_path, dtype, record_blocks)
+
+
+def _sorted(records):
+    """Copy of the `records` stably sorted by the wavenumbers."""
+    return records[np.argsort(records["v_if"], kind="stable")]
+
+
+def _spill(records, runs_dir, num_runs):
+    """Write the sorted run of `records` into the `runs_dir` and return its path."""
+    run_path = Path(runs_dir) / f"run_{num_runs:06d}.bin"
+    records.tofile(run_path)
+    return run_path
+
+
+def _sorted_runs(trans_chunks, dtype, run_size, runs_dir):
+    """Sort the transitions in runs of `run_size` records, spilling all the full
+    runs into the `runs_dir`.
+
+    Returns
+    -------
+    run_paths : list of Path
+        The runs spilled.
+    records : numpy.ndarray
+        The (sorted) records of the last run, not spilled yet.
+    """
+    run_paths = []
+    buffer, size = None, 0
+    for chunk in trans_chunks:
+        records = _to_records(chunk, dtype)
+        del chunk
+        if buffer is None:
+            buffer = np.empty(run_size, dtype=dtype)
+        while len(records):
+            num_copied = min(run_size - size, len(records))
+            buffer[size : size + num_copied] = records[:num_copied]
+            records = records[num_copied:]
+            size += num_copied
+            if size == run_size:
+                run_paths.append(_spill(_sorted(buffer), runs_dir, len(run_paths)))
+                size = 0
+    if buffer is None:
+        return run_paths, np.empty(0, dtype=dtype)
+    return run_paths, _sorted(buffer[:size])
+
+
+def _merged_blocks(run_paths, dtype, memory_budget):
+    """Generator of the blocks of records of all the sorted runs, merged by the
+    wavenumbers.
+
+    Each run is read in blocks, and all the records up to the smallest of the last
+    records of the blocks (of the runs not yet read to their end) are merged at once.
+    The records with equal wavenumbers keep the order of the runs, so the records
+    are compared by their wavenumbers (with the NaNs last) and then by their runs.
+    """
+    runs = [np.memmap(path, dtype=dtype, mode="r") for path in run_paths]
+    # the blocks of all the runs, the merged block and its sorting permutation:
+    block_size = max(memory_budget // ((2 * dtype.itemsize + 8) * len(runs)), 1)
+    positions = [0] * len(runs)
+    blocks = [np.empty(0, dtype=dtype)] * len(runs)
+    while True:
+        for n, run in enumerate(runs):
+            if not len(blocks[n]) and positions[n] < len(run):
+                blocks[n] = np.array(run[positions[n] : positions[n] + block_size])
+                positions[n] += len(blocks[n])
+        if not any(len(block) for block in blocks):
+            return
+        # with all the runs read to their end, all the records are merged at once:
+        bound = (True, 0.0, len(runs))
+        for n, (block, position) in enumerate(zip(blocks, positions)):
+            if len(block) and position < len(runs[n]):
+                last = block["v_if"][-1]
+                bound = min(bound, (bool(np.isnan(last)), np.nan_to_num(last), n))
+        bound_v = np.nan if bound[0] else bound[1]
+        parts = []
+        for n, block in enumerate(blocks):
+            side = "right" if n <= bound[2] else "left"
+            num_merged = np.searchsorted(block["v_if"], bound_v, side=side)
+            parts.append(block[:num_merged])
+            blocks[n] = block[num_merged:]
+        yield _sorted(np.concatenate(parts))
+
+
+def write_sorted_trans_store(
+    trans_chunks,
+    store_path,
+    memory_budget="1GB",
+    a_dtype="float32",
+    tmp_dir=None,
+    max_runs=64,
+):
+    """Write the transitions into the binary trans store file, sorted by the
+    wavenumbers.
+
+    The transitions are sorted by an external merge sort: they are sorted in runs
+    fitting the `memory_budget`, which are spilled to the disk, and then merged, at
+    most `max_runs` runs at a time. Transitions with equal wavenumbers keep their
+    original order. The memory taken by the chunks passed is not included in the
+    budget, pass a budget to the reader generating them as well.
+
+    Parameters
+    ----------
+    trans_chunks : iterable of pandas.DataFrame
+        Chunks with the ``"i"``, ``"f"``, ``"A_if"`` and ``"v_if"`` columns, such as
+        generated by `read_data.trans_chunks`, or by `states_table.join_states` for
+        the datasets with no wavenumbers in the *.trans* files.
+    store_path : str or Path
+        Path of the binary file to write (see `write_trans_store`).
+    memory_budget : int or str, optional
+        The memory available for sorting, such as ``"2GB"``, see
+        `memory.parse_memory_size`. If all the transitions fit into the budget,
+        nothing is spilled to the disk.
+    a_dtype : {"float32", "float64"}, optional
+        Data type of the stored Einstein A coefficients.
+    tmp_dir : str or Path, optional
+        Directory for the sorted runs, which need as much disk space as the store
+        itself (twice as much with more than `max_runs` runs). The runs are removed
+        when done. Defaults to the directory of the `store_path`.
+    max_runs : int, optional
+        Maximum number of runs merged at once. With more runs, the runs are first
+        merged in groups into longer runs.
+
+    Returns
+    -------
+    num_records : int
+        Number of transitions written.
+
+    Raises
+    ------
+    TransParseError
+        If any of the state indices does not fit into ``int32``, or if the
+        ``"v_if"`` column is missing.
+    ValueError
+        If the `memory_budget` or the `max_runs` is invalid.
+
+    Examples
+    --------
+    >>> from exomole.read_data import trans_chunks
+    >>> tr_paths = sorted(Path("tests/resources").glob("*.trans*0*.bz2"))
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     store_path = Path(tmp_dir) / "dummy.trans.bin"
+    ...     # a tiny budget, to spill the transitions in runs of 2 records:
+    ...     write_sorted_trans_store(
+    ...         trans_chunks(tr_paths, 5), store_path, memory_budget=100
+    ...     )
+    ...     transitions = read_trans_store(store_path)
+    ...     print(transitions["i"], (np.diff(transitions["v_if"]) >= 0).all())
+    15
+    [5 7 8 4 2 6 2 2 8 5 6 8 7 1 1] True
+    """
+    memory_budget = parse_memory_size(memory_budget)
+    if max_runs < 2:
+        raise ValueError(f"Invalid maximum number of runs merged at once: {max_runs}")
+    dtype = get_store_dtype(a_dtype, with_v_if=True)
+    # the run, its sorting permutation and its sorted copy:
+    run_size = max(memory_budget // (2 * dtype.itemsize + 8), 1)
+    store_path = Path(store_path)
+    with tempfile.TemporaryDirectory(
+        prefix=f"{store_path.name}.runs.", dir=tmp_dir or store_path.parent
+    ) as runs_dir:
+        run_paths, records = _sorted_runs(trans_chunks, dtype, run_size, runs_dir)
+        if not run_paths:
+            # all the transitions fit into the memory:
+            return _write_store(store_path, dtype, [records])
+        if len(records):
+            run_paths.append(_spill(records, runs_dir, len(run_paths)))
+        del records
+        num_merges = 0
+        while len(run_paths) > max_runs:
+            merged_paths = []
+            for n in range(0, len(run_paths), max_runs):
+                merged_path = Path(runs_dir) / f"merged_{num_merges:06d}.bin"
+                num_merges += 1
+                with open(merged_path, "wb") as fp:
+                    for block in _merged_blocks(
+                        run_paths[n : n + max_runs], dtype, memory_budget
+                    ):
+                        block.tofile(fp)
+                for run_path in run_paths[n : n + max_runs]:
+                    os.remove(run_path)
+                merged_paths.append(merged_path)
+            run_paths = merged_paths
+        return _write_store(
+            store_path, dtype, _merged_blocks(run_paths, dtype, memory_budget)
+        )
+
+
+def read_trans_store(store_path):
+    """Memory-map the binary trans store file as a read-only structured array.
+
+    No data are read upon calling this function, the data pages are only loaded
+    (and cached by the operating system) when accessed.
+
+    Parameters
+    ----------
+    store_path : str or Path
+
+    Returns
+    -------
+    numpy.memmap
+        Structured array with the ``"i"``, ``"f"``, ``"A_if"`` (and possibly
+        ``"v_if"``) fields.
+
+    Raises
+    ------
+    TransParseError
+        If the file is not a valid trans store file.
+
+    Examples
+    --------
+    >>> from exomole.read_data import trans_chunks
+    >>> trans_path = "tests/resources/dummy_trans_5x4_int_int_float_float.trans01.bz2"
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     store_path = Path(tmp_dir) / "dummy.trans.bin"
+    ...     write_trans_store(trans_chunks([trans_path], 2), store_path)
+    ...     transitions = read_trans_store(store_path)
+    ...     print(transitions[:2]["i"], transitions["A_if"].dtype)
+    5
+    [7 6] float32
+    """
+    with open(store_path, "rb") as fp:
+        dtype, num_records = _unpack_header(fp.read(HEADER_SIZE), Path(store_path).name)
+    if not num_records:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(
+        store_path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(num_records,)
+    )
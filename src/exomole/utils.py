@@ -5,12 +5,21 @@ This module only groups *helper* functions and classes, which are not designed t
 used by the end-users of the `exomole` package.
 """
 
+import io
+import itertools
+import os
+import re
 import warnings
 from pathlib import Path
 
 import pandas
 import requests
 
+from .arrow import dataframe_to_record_batch
+from .bz2_blocks import get_block_index, open_data_file
+from .filters import filter_dataframe, filter_mask
+from .fixed_width import fixed_width_chunks
+from .memory import ChunkSizer
 from .exceptions import (
     APIError,
     LineWarning,
@@ -172,6 +181,18 @@ def load_dataframe_chunks(
     column_names=None,
     dtype=None,
     check_num_columns=True,
+    num_workers=None,
+    usecols=None,
+    backend="pandas",
+    memory_budget=None,
+    schema=None,
+    start_row=None,
+    stop_row=None,
+    byte_range=None,
+    filters=None,
+    start_block=None,
+    tracker=None,
+    index_dir=None,
 ):
     """Generates chunks of a compressed ExoMol data file.
 
@@ -203,12 +224,85 @@ def load_dataframe_chunks(
     check_num_columns : bool, optional
         If ``True`` and `column_names` passed, check is performed to verify that the
         `column_names` are consistent with the number of columns in the data file.
-        This check will likely result in some slowdown as the file will be decompressed
-        twice.
+        The columns are counted in the first line, peeked from the same stream which
+        is then parsed, and remembered for any later reads of the same file (see
+        `get_num_columns`).
+    num_workers : int, optional
+        If passed, the blocks of a *.bz2* compressed file are decompressed in parallel
+        over a pool of `num_workers` processes (see
+        `exomole.bz2_blocks.ParallelBZ2Reader`), instead of by a single core.
+        Ignored for uncompressed files.
+    usecols : list of str, optional
+        Names of the only columns (out of the `column_names`, which are then required)
+        to be loaded. The values of the other columns are skipped by the `pandas`
+        tokeniser, rather than being converted and dropped afterwards. If
+        `first_col_is_index`, the index column is always loaded, and the chunk index
+        is named after it.
+    backend : {"pandas", "numpy"}, optional
+        With ``"pandas"`` (default), the file is parsed by `pandas.read_csv`, splitting
+        the lines on any whitespace. With ``"numpy"``, the file needs to be
+        fixed-width (as are all the ExoMol data files), and the columns are sliced
+        out of the chunks of bytes and converted by vectorised `numpy` operations
+        (see the `exomole.fixed_width` module), with no splitting of the lines into
+        tokens. The `column_names` are required, and checked against the file with
+        no extra decompression.
+    memory_budget : int or str, optional
+        If passed, such as ``"2GB"`` (see `memory.parse_memory_size`), the
+        `chunk_size` is ignored, and the number of rows of each chunk is derived from
+        the budget and the memory per row measured on the chunks already read (see
+        `memory.ChunkSizer`), starting with a small probing chunk.
+    schema : pyarrow.Schema, optional
+        If passed, `pyarrow.RecordBatch` chunks with the data types of the `schema`
+        are generated instead of the `pandas.DataFrame` chunks (see the
+        `exomole.arrow` module). The `column_names` are then required, and if
+        `first_col_is_index`, the index is the first column of the record batches.
+        With the ``"numpy"`` `backend`, the record batches are built directly out of
+        the parsed arrays, with no `pandas` involved.
+    start_row, stop_row : int, optional
+        If passed, only the rows ``start_row:stop_row`` (0-based, with the
+        `stop_row` excluded) are loaded. A *.bz2* compressed file is then only
+        decompressed from the block holding the `start_row`, found in the block
+        index of the file, which is built and saved in a sidecar file (in the
+        `index_dir`) on the first access (see `bz2_blocks.get_block_index`). Unless
+        `first_col_is_index`, the chunks are indexed by the row numbers in the whole
+        file.
+    byte_range : tuple of int, optional
+        If passed, only the rows starting within the ``(start_byte, stop_byte)``
+        range of the bytes of the (compressed) file are loaded (see
+        `bz2_blocks.ByteRangeReader`), so that any adjoining ranges split the rows of
+        the file with no overlaps. Unless `first_col_is_index`, the chunks are then
+        indexed by the row numbers counted from the start of the range. Cannot be
+        combined with the `start_row`, and the `num_workers` are ignored.
+    filters : list of tuple, optional
+        The validated ``(column, operator, value)`` filters (see the
+        `exomole.filters` module), which the rows loaded need to satisfy, referring
+        to the index by the first of the `column_names` if `first_col_is_index`.
+        With the ``"numpy"`` `backend`, the filters are evaluated on the parsed
+        column arrays, and the rows rejected never make it into any chunk. With the
+        ``"pandas"`` `backend`, only the columns filtered on are parsed first out of
+        each chunk of lines, and only the lines satisfying the filters are then
+        parsed into the chunk. Without the `column_names`, the ``"pandas"`` backend
+        falls back to filtering each chunk after it has been parsed. Either way, the
+        columns filtered on are loaded even if not among the `usecols`, and the
+        chunks keep the original row numbers as their index (unless
+        `first_col_is_index`).
+    start_block : tuple of int, optional
+        The ``(start_bit, num_lines)`` location of the `start_row` in the file, such
+        as returned by `bz2_blocks.RowTracker.locate` for an earlier read, so that a
+        *.bz2* compressed file is decompressed straight from the block holding the
+        `start_row`, with no block index needed.
+    tracker : bz2_blocks.RowTracker, optional
+        If passed, it gets updated with the pieces of the file read, and advanced
+        past the rows of every chunk loaded (before the `filters` are applied), so
+        the row following each chunk can be located in the file.
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar file of a *.bz2* compressed file
+        (see `bz2_blocks.get_block_index`), next to the file by default, or
+        ``False`` for the block index only kept in the memory.
 
     Returns
     -------
-    df_chunks : pandas.io.parsers.TextFileReader
+    df_chunks : pandas.io.parsers.TextFileReader or generator
         Generator of `pandas.DataFrame` chunks. Access by
         ``for chunk in df_chunks: ...``, where each chunk is a `pandas.DataFrame`.
 
@@ -217,31 +311,262 @@ def load_dataframe_chunks(
     DataParseError
         When ``check_num_columns is True`` and `column_names` are inconsistent with the
         number of columns in the data file being read.
+    ValueError
+        If `usecols` are passed without the `column_names`, or are not among them,
+        if the `backend` is not known or has no `column_names`, or if the
+        `start_row` or `stop_row` is negative, or if the `start_row` is combined with
+        the `byte_range`.
     """
-    if check_num_columns and column_names:
-        file_name = Path(file_path).name
-        num_cols = get_num_columns(file_path)
-        if num_cols != len(column_names):
-            raise DataParseError(
-                f"{file_name} has {num_cols} columns, but column names "
-                f"{column_names} were passed."
-            )
-
-    df_chunks = pandas.read_csv(
-        file_path,
-        compression=_get_compression(file_path),
+    for row in [start_row, stop_row]:
+        if row is not None and row < 0:
+            raise ValueError(f"Invalid row number: {row}")
+    if start_row and byte_range is not None:
+        raise ValueError("The start_row cannot be combined with the byte_range.")
+    sizer = None if memory_budget is None else ChunkSizer(memory_budget)
+    if sizer is not None:
+        chunk_size = sizer.size
+    if backend == "numpy":
+        if not column_names:
+            raise ValueError("The numpy backend requires the column_names.")
+        if usecols is not None and not set(usecols).issubset(column_names):
+            raise ValueError(f"Columns {usecols} not among {column_names}.")
+        return fixed_width_chunks(
+            file_path,
+            chunk_size,
+            column_names,
+            first_col_is_index=first_col_is_index,
+            dtype=dtype,
+            usecols=usecols,
+            num_workers=num_workers,
+            sizer=sizer,
+            schema=schema,
+            start_row=start_row,
+            stop_row=stop_row,
+            byte_range=byte_range,
+            filters=filters,
+            start_block=start_block,
+            tracker=tracker,
+            index_dir=index_dir,
+        )
+    if backend != "pandas":
+        raise ValueError(f"Unknown backend '{backend}', choose 'pandas' or 'numpy'.")
+    names = column_names
+    index_col = None if not first_col_is_index else 0
+    if usecols is not None:
+        if not column_names or not set(usecols).issubset(column_names):
+            raise ValueError(f"Columns {usecols} not among {column_names}.")
+        usecols = list(usecols)
+        usecols += [
+            col for col, _, _ in filters or [] if col not in usecols + column_names[:1]
+        ]
+        if first_col_is_index:
+            index_col = column_names[0]
+            if index_col not in usecols:
+                usecols.insert(0, index_col)
+    elif column_names and first_col_is_index:
+        names = column_names[1:]
+
+    read_csv_kwargs = dict(
         sep=r"\s+",
         header=None,
-        index_col=None if not first_col_is_index else 0,
-        names=column_names
-        if not (column_names and first_col_is_index)
-        else column_names[1:],
+        index_col=index_col,
+        names=names,
+        usecols=usecols,
         chunksize=chunk_size,
         iterator=True,
         low_memory=False,
         dtype=dtype,
     )
-    return df_chunks
+    if stop_row is not None:
+        read_csv_kwargs["nrows"] = max(stop_row - (start_row or 0), 0)
+        if not read_csv_kwargs["nrows"]:
+            return iter(())
+    check_num_columns = check_num_columns and bool(column_names)
+    peek_num_columns = check_num_columns and not _is_num_columns_known(file_path)
+    compression = _get_compression(file_path)
+    # the filters are evaluated before the chunks are built, if the columns are known:
+    pushdown = bool(filters) and bool(column_names)
+    if (
+        not start_row
+        and byte_range is None
+        and tracker is None
+        and not pushdown
+        and not peek_num_columns
+        and (num_workers is None or compression != "bz2")
+    ):
+        if check_num_columns:
+            _check_num_columns(file_path, column_names)
+        df_chunks = pandas.read_csv(
+            file_path, compression=compression, **read_csv_kwargs
+        )
+        if sizer is not None:
+            df_chunks = _sized_chunks(df_chunks, sizer)
+    else:
+        # the stream opened here is shared by the column count and by the parser:
+        stream = open_data_file(
+            file_path,
+            num_workers=num_workers,
+            start_row=start_row,
+            byte_range=byte_range,
+            start_block=start_block,
+            tracker=tracker,
+            index_dir=index_dir,
+        )
+        try:
+            if peek_num_columns:
+                first_line = stream.readline()
+                if first_line:
+                    _remember_num_columns(file_path, len(first_line.split()))
+                stream = io.BufferedReader(
+                    _PeekedStream(first_line, stream), buffer_size=2**20
+                )
+            if check_num_columns:
+                _check_num_columns(file_path, column_names)
+        except BaseException:
+            stream.close()
+            raise
+        if (start_row or byte_range is not None) and not stream.peek(1):
+            # no rows past the start_row, or starting within the range:
+            stream.close()
+            return iter(())
+        if pushdown:
+            df_chunks = _filtered_stream_chunks(
+                stream, read_csv_kwargs, column_names, filters, sizer, tracker
+            )
+        else:
+            df_chunks = _stream_chunks(stream, read_csv_kwargs, sizer)
+    if start_row and not first_col_is_index:
+        df_chunks = _shifted_chunks(df_chunks, start_row)
+    if tracker is not None and not pushdown:
+        df_chunks = _tracked_chunks(df_chunks, tracker)
+    index_col = column_names[0] if column_names and first_col_is_index else None
+    if filters and not pushdown:
+        df_chunks = (filter_dataframe(chunk, filters, index_col) for chunk in df_chunks)
+    if schema is None:
+        return df_chunks
+    return (dataframe_to_record_batch(chunk, schema, index_col) for chunk in df_chunks)
+
+
+class _PeekedStream(io.RawIOBase):
+    """Binary stream of the `peeked` bytes, followed by the rest of the `stream`."""
+
+    def __init__(self, peeked, stream):
+        super().__init__()
+        self._peeked = memoryview(peeked)
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._peeked:
+            return self._stream.readinto(b)
+        size = min(len(b), len(self._peeked))
+        b[:size] = self._peeked[:size]
+        self._peeked = self._peeked[size:]
+        return size
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+def _stream_chunks(stream, read_csv_kwargs, sizer=None):
+    """Generator of the chunks parsed from the `stream`, closing it when done."""
+    with stream:
+        df_chunks = pandas.read_csv(stream, **read_csv_kwargs)
+        yield from df_chunks if sizer is None else _sized_chunks(df_chunks, sizer)
+
+
+def _filtered_stream_chunks(
+    stream, read_csv_kwargs, column_names, filters, sizer=None, tracker=None
+):
+    """Generator of the chunks parsed from the `stream`, closing it when done, with
+    the `filters` evaluated on the columns filtered on, parsed first out of each
+    chunk of lines, and only the lines satisfying them parsed into the chunk."""
+    filter_cols = {col for col, _, _ in filters}
+    filter_kwargs = dict(
+        sep=read_csv_kwargs["sep"],
+        header=None,
+        names=column_names,
+        usecols=[col for col in column_names if col in filter_cols],
+        low_memory=False,
+        dtype=read_csv_kwargs["dtype"],
+    )
+    chunk_kwargs = {
+        key: value
+        for key, value in read_csv_kwargs.items()
+        if key not in {"chunksize", "iterator", "nrows"}
+    }
+    num_rows_left = read_csv_kwargs.get("nrows")
+    first_row = 0
+    with stream:
+        while num_rows_left is None or num_rows_left > 0:
+            size = read_csv_kwargs["chunksize"] if sizer is None else sizer.size
+            if num_rows_left is not None:
+                size = min(size, num_rows_left)
+            lines = list(itertools.islice(stream, size))
+            if not lines:
+                return
+            if tracker is not None:
+                tracker.row += len(lines)
+            # the blank lines are skipped by pandas:
+            lines = [line for line in lines if not line.isspace()]
+            if not lines:
+                continue
+            values = pandas.read_csv(io.BytesIO(b"".join(lines)), **filter_kwargs)
+            mask = filter_mask(lambda col: values[col].to_numpy(), filters, len(lines))
+            kept = [line for line, keep in zip(lines, mask) if keep]
+            # with no lines kept, the empty chunk is sliced out of the first line:
+            chunk = pandas.read_csv(
+                io.BytesIO(b"".join(kept or lines[:1])), **chunk_kwargs
+            )
+            if not kept:
+                chunk = chunk.iloc[:0]
+            if chunk_kwargs["index_col"] is None:
+                index = pandas.RangeIndex(first_row, first_row + len(lines))
+                chunk.index = index if mask.all() else index[mask]
+            first_row += len(lines)
+            if num_rows_left is not None:
+                num_rows_left -= len(lines)
+            if sizer is not None:
+                sizer.update(chunk)
+            yield chunk
+
+
+def _sized_chunks(df_chunks, sizer):
+    """Generator of the chunks of the `df_chunks` reader, sized by the `sizer`."""
+    with df_chunks:
+        while True:
+            try:
+                chunk = df_chunks.get_chunk(sizer.size)
+            except StopIteration:
+                return
+            sizer.update(chunk)
+            yield chunk
+
+
+def _shifted_chunks(df_chunks, num_rows):
+    """Generator of the `df_chunks` with their row numbers shifted by `num_rows`."""
+    for chunk in df_chunks:
+        chunk.index += num_rows
+        yield chunk
+
+
+def _tracked_chunks(df_chunks, tracker):
+    """Generator of the `df_chunks`, with the `tracker` advanced past each chunk."""
+    for chunk in df_chunks:
+        tracker.row += len(chunk)
+        yield chunk
+
+
+def _check_num_columns(file_path, column_names):
+    num_cols = get_num_columns(file_path)
+    if num_cols != len(column_names):
+        raise DataParseError(
+            f"{Path(file_path).name} has {num_cols} columns, but column names "
+            f"{column_names} were passed."
+        )
 
 
 def _get_compression(file_path):
@@ -261,10 +586,31 @@ def _get_compression(file_path):
         return None
 
 
+# the numbers of columns of the data files, keyed by the path, modification time and
+# size:
+_NUM_COLUMNS = {}
+
+
+def _num_columns_key(file_path):
+    stat = os.stat(file_path)
+    return str(Path(file_path).resolve()), stat.st_mtime_ns, stat.st_size
+
+
+def _is_num_columns_known(file_path):
+    return _num_columns_key(file_path) in _NUM_COLUMNS
+
+
+def _remember_num_columns(file_path, num_cols):
+    _NUM_COLUMNS[_num_columns_key(file_path)] = num_cols
+
+
 def get_num_columns(file_path):
     """Gets the number of columns in the *.bz2* compressed either *.states*, or
     *.trans* file under the `file_path`.
 
+    Only the first line is decompressed (and only the first *bz2* block with it),
+    and the number of columns is remembered for as long as the file is not modified.
+
     Parameters
     ----------
     file_path : str or Path
@@ -272,10 +618,119 @@ def get_num_columns(file_path):
     Returns
     -------
     int
+
+    Examples
+    --------
+    >>> get_num_columns("tests/resources/dummy_data_5x5_int.bz2")
+    5
+    """
+    if not _is_num_columns_known(file_path):
+        with open_data_file(file_path) as stream:
+            _remember_num_columns(file_path, len(stream.readline().split()))
+    return _NUM_COLUMNS[_num_columns_key(file_path)]
+
+
+def get_num_rows(file_path, num_workers=None, index_dir=None):
+    """Gets the number of rows in the (either *.bz2* compressed or not) data file
+    under the `file_path`.
+
+    The number of rows of a *.bz2* compressed file is taken from its block index
+    (see `bz2_blocks.get_block_index`), which is built by decompressing the whole
+    file on the first access only. An uncompressed file is counted through.
+
+    Parameters
+    ----------
+    file_path : str or Path
+    num_workers : int, optional
+        If passed, and the *.bz2* compressed file needs indexing, its blocks are
+        decompressed in parallel over a pool of `num_workers` processes.
+    index_dir : str or Path or bool, optional
+        The directory of the block index sidecar file, see
+        `bz2_blocks.get_block_index`.
+
+    Returns
+    -------
+    int
+
+    Examples
+    --------
+    >>> get_num_rows("tests/resources/dummy_data_5x5_int.no_compression")
+    5
+    """
+    if _get_compression(file_path) == "bz2":
+        return get_block_index(
+            file_path, num_workers=num_workers, index_dir=index_dir
+        ).num_rows
+    num_rows, last_byte = 0, b"\n"
+    with open(file_path, "rb") as fp:
+        for piece in iter(lambda: fp.read(2**24), b""):
+            num_rows += piece.count(b"\n")
+            last_byte = piece[-1:]
+    # the last line with no line end still counts:
+    return num_rows + (last_byte != b"\n")
+
+
+_WAVENUMBER_RANGE_PATTERN = re.compile(r"__(\d+)-(\d+)\.trans(?:\.bz2)?$")
+
+
+def get_wavenumber_range(file_path):
+    """Gets the wavenumber range covered by a *.trans* file from its name.
+
+    The *.trans* files of large ExoMol datasets are split by wavenumber, with the
+    range (in cm-1) encoded in the file names, such as
+    *1H2-16O__POKAZATEL__00000-00100.trans.bz2*.
+
+    Parameters
+    ----------
+    file_path : str or Path
+
+    Returns
+    -------
+    tuple of float or NoneType
+        The ``(lower, upper)`` wavenumber bounds, or ``None`` if the file name does not
+        encode the range.
+
+    Examples
+    --------
+    >>> get_wavenumber_range("1H2-16O__POKAZATEL__00100-00200.trans.bz2")
+    (100.0, 200.0)
+    >>> get_wavenumber_range("12C-16O__Li2015.trans.bz2") is None
+    True
+    """
+    match = _WAVENUMBER_RANGE_PATTERN.search(Path(file_path).name)
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+
+def filter_trans_paths(trans_paths, wavenumber_range):
+    """Filters out the *.trans* files lying outside the `wavenumber_range`.
+
+    The wavenumber range covered by each file is parsed from its name (see
+    `get_wavenumber_range`), and the files not overlapping the `wavenumber_range` are
+    dropped. The files with no range encoded in their names are always kept.
+
+    Parameters
+    ----------
+    trans_paths : iterable of (str or Path)
+    wavenumber_range : tuple of float
+        The ``(lower, upper)`` wavenumber bounds in cm-1, either can be ``None`` for
+        no bound.
+
+    Returns
+    -------
+    list of (str or Path)
     """
-    for chunk in load_dataframe_chunks(file_path, chunk_size=1):
-        _, num_cols = chunk.shape
-        return int(num_cols)
+    lower, upper = wavenumber_range
+    lower = -float("inf") if lower is None else lower
+    upper = float("inf") if upper is None else upper
+    filtered = []
+    for path in trans_paths:
+        file_range = get_wavenumber_range(path)
+        # the file ranges are inclusive of the lower bounds only:
+        if file_range is None or (file_range[0] <= upper and file_range[1] > lower):
+            filtered.append(path)
+    return filtered
 
 
 class DataClass:
@@ -0,0 +1,166 @@
+"""Module containing the vocabulary of the quantum labels of the ExoMol states.
+
+The string quanta columns of the *.states* files (such as the parity, the symmetry
+or the electronic state labels) hold only a handful of distinct labels, repeated
+over millions of states. Rather than as `str` objects, or as `pandas.Categorical`
+columns with categories inferred independently for each chunk, such columns can be
+yielded by the `read_data.states_chunks` reader encoded through a `LabelVocabulary`,
+which assigns each label an integer code once, and keeps the same codes for all the
+chunks read.
+"""
+
+import numpy as np
+import pandas
+
+
+class LabelVocabulary:
+    """Integer codes of the labels of the string quanta columns.
+
+    The codes are assigned in the order in which the labels are encountered, and are
+    never re-assigned, so the vocabulary can be shared by all the chunks of a
+    *.states* file, or saved (see `to_dict`) and re-used for later reads. The
+    vocabulary of a dataset is best obtained by `DefParser.get_label_vocabulary`.
+
+    Parameters
+    ----------
+    columns : list of str
+        Names of the label columns.
+    labels : dict of list, optional
+        The labels already known for any of the `columns`, the code of each label
+        being its position in the list.
+
+    Examples
+    --------
+    >>> from exomole.read_data import states_chunks
+    >>> sp = "tests/resources/dummy_states_10x5_int_float_int_str_int.states.bz2"
+    >>> vocabulary = LabelVocabulary(["c"], labels={"c": ["e", "f"]})
+    >>> for chunk in states_chunks(
+    ...     sp, ["i", "a", "b", "c", "d"], chunk_size=4, vocabulary=vocabulary
+    ... ):
+    ...     print(chunk["c"].cat.codes.tolist())
+    [2, 3, 4, 5]
+    [0, 1, 6, 7]
+    [8, 9]
+    >>> vocabulary["c"]
+    ['e', 'f', 'a', 'b', 'c', 'd', 'g', 'h', 'i', 'j']
+    """
+
+    def __init__(self, columns, labels=None):
+        self.columns = list(columns)
+        labels = labels or {}
+        self._code_maps = {
+            col: {label: code for code, label in enumerate(labels.get(col, []))}
+            for col in self.columns
+        }
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.columns!r})"
+
+    def __getitem__(self, column):
+        """All the labels of the `column` known so far, in the order of their codes."""
+        return list(self._code_maps[column])
+
+    def to_dict(self):
+        """The vocabulary as a JSON-serialisable dictionary.
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "columns": self.columns,
+            "labels": {col: self[col] for col in self.columns},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Re-create the vocabulary from the dictionary returned by `to_dict`.
+
+        Parameters
+        ----------
+        data : dict
+
+        Returns
+        -------
+        LabelVocabulary
+        """
+        return cls(**data)
+
+    def get_dtype(self, column):
+        """The categorical data type of the `column`, with all the labels known so
+        far as its categories.
+
+        The chunks encoded earlier have only a part of the categories, and can be
+        cast to this data type (with their codes intact) before being concatenated.
+
+        Parameters
+        ----------
+        column : str
+
+        Returns
+        -------
+        pandas.CategoricalDtype
+        """
+        return pandas.CategoricalDtype(self[column])
+
+    def encode(self, column, values):
+        """Get the codes of the `values` of the label `column`.
+
+        The labels not in the vocabulary yet get the next free codes.
+
+        Parameters
+        ----------
+        column : str
+        values : pandas.Series or pandas.Categorical or numpy.ndarray
+            The labels, preferably categorical, as only the categories are then
+            looked up. The missing values are encoded as ``-1``.
+
+        Returns
+        -------
+        numpy.ndarray
+            The ``"int32"`` codes.
+        """
+        values = pandas.Categorical(values).remove_unused_categories()
+        code_map = self._code_maps[column]
+        category_codes = [
+            code_map.setdefault(label, len(code_map)) for label in values.categories
+        ]
+        # the missing values (code -1) are mapped to -1:
+        category_codes = np.array(category_codes + [-1], dtype="int32")
+        return category_codes[values.codes]
+
+    def decode(self, column, codes):
+        """Get the labels of the `codes` of the label `column`.
+
+        Parameters
+        ----------
+        column : str
+        codes : array-like of int
+
+        Returns
+        -------
+        pandas.Categorical
+        """
+        return pandas.Categorical.from_codes(codes, dtype=self.get_dtype(column))
+
+    def encode_chunk(self, chunk, as_codes=False):
+        """Encode all the label columns present in the states `chunk`.
+
+        Parameters
+        ----------
+        chunk : pandas.DataFrame
+        as_codes : bool, optional
+            If ``True``, the label columns are replaced by their ``"int32"`` codes,
+            otherwise by `pandas.Categorical` columns with all the labels known so
+            far as their categories.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        encoded = {}
+        for col in self.columns:
+            if col in chunk.columns:
+                codes = self.encode(col, chunk[col])
+                encoded[col] = codes if as_codes else self.decode(col, codes)
+        return chunk.assign(**encoded) if encoded else chunk
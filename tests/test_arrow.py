@@ -0,0 +1,119 @@
+import shutil
+
+import numpy as np
+import pandas
+import pytest
+
+from exomole.arrow import get_arrow_schema, to_record_batch
+from exomole.read_data import states_chunks, trans_chunks
+from exomole.read_def import DefParser
+from . import resources_path
+
+pyarrow = pytest.importorskip("pyarrow")
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+def_parser = DefParser(dataset_dir / "12C-16O__Li2015.def")
+def_parser.parse(warn_on_comments=False)
+states_kwargs = dict(
+    columns=def_parser.get_states_header(),
+    dtypes=def_parser.get_states_dtypes(),
+    chunk_size=2000,
+)
+
+
+def test_get_arrow_schema():
+    schema = get_arrow_schema(
+        ["i", "E", "v", "kp", "lab"],
+        {"i": "int64", "E": "float64", "v": "int32", "kp": "category"},
+    )
+    assert schema.types == [
+        pyarrow.int64(),
+        pyarrow.float64(),
+        pyarrow.int32(),
+        pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+        pyarrow.string(),
+    ]
+    assert def_parser.get_states_schema().names == def_parser.get_states_header()
+
+
+def test_to_record_batch():
+    schema = get_arrow_schema(["i", "E", "kp"], {"i": "int64", "E": "float64"})
+    energies = np.array([0.0, 1.5])
+    batch = to_record_batch(
+        {"E": energies, "kp": pandas.Categorical(["e", "f"])}, schema
+    )
+    assert batch.schema.names == ["E", "kp"]
+    assert batch.column("kp").to_pylist() == ["e", "f"]
+    # no copies of the numeric arrays:
+    assert np.shares_memory(batch.column("E").to_numpy(), energies)
+
+
+@pytest.mark.parametrize("backend", ("pandas", "numpy"))
+@pytest.mark.parametrize("columns_to_read", (None, ["kp", "E"]))
+def test_states_output(backend, columns_to_read):
+    kwargs = dict(
+        filters=[("v", "<", 3)], columns_to_read=columns_to_read, **states_kwargs
+    )
+    expected = pandas.concat(
+        states_chunks(dataset_dir / "12C-16O__Li2015.states.bz2", **kwargs)
+    )
+    batches = list(
+        states_chunks(
+            dataset_dir / "12C-16O__Li2015.states.bz2",
+            backend=backend,
+            output="arrow",
+            **kwargs,
+        )
+    )
+    assert all(isinstance(batch, pyarrow.RecordBatch) for batch in batches)
+    table = pyarrow.Table.from_batches(batches)
+    schema = def_parser.get_states_schema()
+    if columns_to_read is None:
+        assert table.schema == schema
+    else:
+        assert table.schema.names == ["i", "kp", "E"]
+    states = table.to_pandas().set_index("i").rename_axis(None)
+    assert states.equals(expected)
+
+
+@pytest.mark.parametrize("backend", ("pandas", "numpy"))
+def test_trans_output(backend):
+    trans_paths = [dataset_dir / "12C-16O__Li2015.trans.bz2"]
+    expected = pandas.concat(
+        trans_chunks(trans_paths, 50_000, filters=[("f", "<", 99)])
+    )
+    batches = list(
+        trans_chunks(
+            trans_paths,
+            50_000,
+            filters=[("f", "<", 99)],
+            backend=backend,
+            output="arrow",
+        )
+    )
+    assert len(batches) == 3
+    table = pyarrow.Table.from_batches(batches)
+    assert table.schema.names == ["i", "f", "A_if", "v_if"]
+    assert table.to_pandas().equals(expected.reset_index(drop=True))
+
+
+def test_cached_output(tmp_path):
+    states_path = tmp_path / "12C-16O__Li2015.states.bz2"
+    shutil.copy(dataset_dir / states_path.name, states_path)
+    kwargs = dict(cache_dir=tmp_path / "cache", output="arrow", **states_kwargs)
+    expected = pyarrow.Table.from_batches(
+        states_chunks(states_path, **states_kwargs, output="arrow")
+    )
+    for _ in range(2):  # written and then read from the cache
+        batches = list(states_chunks(states_path, **kwargs))
+        assert pyarrow.Table.from_batches(batches).equals(expected)
+        projected = pyarrow.Table.from_batches(
+            states_chunks(states_path, columns_to_read=["J"], **kwargs)
+        )
+        assert projected.schema.names == ["i", "J"]
+        assert projected.column("J").equals(expected.column("J"))
+
+
+def test_invalid_output():
+    with pytest.raises(ValueError):
+        list(trans_chunks([dataset_dir / "12C-16O__Li2015.trans.bz2"], output="numpy"))
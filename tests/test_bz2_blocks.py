@@ -0,0 +1,253 @@
+import bz2
+import os
+
+import pandas
+import pytest
+
+import exomole
+from exomole.bz2_blocks import (
+    find_blocks,
+    decompress_block,
+    BZ2BlocksReader,
+    ParallelBZ2Reader,
+    ByteRangeReader,
+    DataParseError,
+    build_block_index,
+    get_block_index,
+    get_index_path,
+    index_blocks,
+    load_block_index,
+    open_data_file,
+)
+from exomole.exceptions import BlockIndexWarning
+from exomole.read_data import trans_chunks
+from exomole.utils import load_dataframe_chunks, get_num_rows
+from . import resources_path
+
+co_trans_path = resources_path.joinpath(
+    "exomol_data", "CO", "12C-16O", "Li2015", "12C-16O__Li2015.trans.bz2"
+)
+assert co_trans_path.is_file()
+
+
+@pytest.fixture
+def multi_block_path(tmp_path):
+    """Multi-stream bz2 file with many small (100k) blocks."""
+    lines = [f"{n:12d} {n ** 2:12d} {n / 7:.6e}\n" for n in range(30_000)]
+    data = "".join(lines).encode()
+    path = tmp_path / "multi_block.trans.bz2"
+    path.write_bytes(
+        bz2.compress(data[:500_000], compresslevel=1)
+        + bz2.compress(data[500_000:], compresslevel=1)
+    )
+    return path
+
+
+def test_find_blocks(multi_block_path):
+    blocks = find_blocks(multi_block_path, scan_size=1000)
+    assert len(blocks) > 5
+    assert blocks[0][0] == 32  # just after the "BZh1" stream header
+    for (_, end), (start, _) in zip(blocks[:-1], blocks[1:]):
+        assert end <= start
+
+
+def test_decompress_block(multi_block_path):
+    data = b"".join(
+        decompress_block(multi_block_path, start, end)
+        for start, end in find_blocks(multi_block_path)
+    )
+    assert data == bz2.decompress(multi_block_path.read_bytes())
+
+
+@pytest.mark.parametrize("num_workers", (1, 2, 3))
+def test_parallel_reader(multi_block_path, num_workers):
+    with ParallelBZ2Reader(multi_block_path, num_workers=num_workers) as reader:
+        assert reader.read() == bz2.decompress(multi_block_path.read_bytes())
+
+
+def test_parallel_reader_spurious_boundary(multi_block_path):
+    blocks = find_blocks(multi_block_path)
+    start, end = blocks[1]
+    blocks[1:2] = [(start, start + 1000), (start + 1000, end)]
+    with ParallelBZ2Reader(multi_block_path, num_workers=2, blocks=blocks) as reader:
+        assert reader.read() == bz2.decompress(multi_block_path.read_bytes())
+
+
+def test_parallel_reader_corrupted(multi_block_path):
+    blocks = find_blocks(multi_block_path)
+    start, end = blocks[-1]
+    blocks[-1] = (start, end - 100)
+    with pytest.raises(DataParseError):
+        ParallelBZ2Reader(multi_block_path, num_workers=2, blocks=blocks).read()
+
+
+def test_load_dataframe_chunks_parallel():
+    serial = list(load_dataframe_chunks(co_trans_path, 50_000))
+    parallel = list(load_dataframe_chunks(co_trans_path, 50_000, num_workers=2))
+    assert len(serial) == len(parallel) == 3
+    for chunk_serial, chunk_parallel in zip(serial, parallel):
+        assert chunk_serial.equals(chunk_parallel)
+
+
+def test_trans_chunks_parallel():
+    serial = list(trans_chunks([co_trans_path], 100_000))
+    parallel = list(trans_chunks([co_trans_path], 100_000, num_workers=2))
+    assert len(parallel) == 2
+    for chunk_serial, chunk_parallel in zip(serial, parallel):
+        assert chunk_serial.equals(chunk_parallel)
+
+
+def test_blocks_reader(multi_block_path):
+    blocks = find_blocks(multi_block_path)
+    with BZ2BlocksReader(multi_block_path, blocks=blocks[3:]) as reader:
+        data = reader.read()
+    assert data == b"".join(decompress_block(multi_block_path, *b) for b in blocks[3:])
+
+
+@pytest.mark.parametrize("num_workers", (None, 2))
+def test_block_index(multi_block_path, num_workers, monkeypatch):
+    lines = bz2.decompress(multi_block_path.read_bytes()).splitlines(keepends=True)
+    blocks = find_blocks(multi_block_path)
+    # a spurious block boundary gets merged:
+    start, end = blocks[1]
+    blocks[1:2] = [(start, start + 1000), (start + 1000, end)]
+    monkeypatch.setattr(exomole.bz2_blocks, "find_blocks", lambda path: blocks)
+    index = build_block_index(multi_block_path, num_workers=num_workers)
+    assert index.num_rows == len(lines) == 30_000
+    assert index.blocks == blocks[:1] + [(start, end)] + blocks[3:]
+    assert index.rows_before[0] == 0
+    for row in [0, 1, 9_999, 12_345, 29_999]:
+        position, num_lines = index.locate(row)
+        data = decompress_block(multi_block_path, *index.blocks[position])
+        if position:
+            data = data[data.index(b"\n") + 1 :]  # the line started before
+            num_lines -= 1
+        assert data.splitlines(keepends=True)[num_lines] == lines[row]
+
+
+def test_block_index_sidecar(multi_block_path, monkeypatch):
+    assert load_block_index(multi_block_path) is None
+    index = index_blocks(multi_block_path)
+    assert get_index_path(multi_block_path).is_file()
+    loaded = load_block_index(multi_block_path)
+    assert vars(loaded) == vars(index)
+    monkeypatch.setattr(exomole.bz2_blocks, "_BLOCK_INDEXES", {})
+    monkeypatch.setattr(exomole.bz2_blocks, "build_block_index", None)
+    assert vars(get_block_index(multi_block_path)) == vars(index)
+    # a modified file invalidates the index:
+    stat = os.stat(multi_block_path)
+    os.utime(multi_block_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert load_block_index(multi_block_path) is None
+
+
+def test_block_index_dir(multi_block_path, tmp_path, monkeypatch):
+    index_dir = tmp_path / "indexes"
+    index_dir.mkdir()
+    assert get_num_rows(multi_block_path, index_dir=index_dir) == 30_000
+    assert list(index_dir.iterdir()) == [get_index_path(multi_block_path, index_dir)]
+    assert not get_index_path(multi_block_path).exists()
+    assert load_block_index(multi_block_path, index_dir).num_rows == 30_000
+
+    monkeypatch.setattr(exomole.bz2_blocks, "_BLOCK_INDEXES", {})
+    with open_data_file(multi_block_path, start_row=7, index_dir=False) as stream:
+        assert stream.readline() == b"%12d %12d %.6e\n" % (7, 49, 1)
+    assert get_index_path(multi_block_path, index_dir=False) is None
+    assert not get_index_path(multi_block_path).exists()
+
+    # an index which cannot be saved is still used, with a warning:
+    monkeypatch.setattr(exomole.bz2_blocks, "_BLOCK_INDEXES", {})
+    with pytest.warns(BlockIndexWarning):
+        index = get_block_index(multi_block_path, index_dir=tmp_path / "missing")
+    assert index.num_rows == 30_000
+
+
+def test_block_index_built_once(multi_block_path, monkeypatch):
+    built = []
+    original = exomole.bz2_blocks.build_block_index
+
+    def spy(*args, **kwargs):
+        built.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(exomole.bz2_blocks, "build_block_index", spy)
+    assert get_num_rows(multi_block_path) == 30_000
+    assert get_index_path(multi_block_path).is_file()
+    assert get_num_rows(multi_block_path) == 30_000
+    assert len(built) == 1
+
+
+@pytest.mark.parametrize("num_workers", (None, 2))
+@pytest.mark.parametrize("start_row", (0, 1, 7_777, 29_999, 30_000))
+def test_open_data_file_start_row(multi_block_path, num_workers, start_row):
+    lines = bz2.decompress(multi_block_path.read_bytes()).splitlines(keepends=True)
+    with open_data_file(multi_block_path, num_workers, start_row=start_row) as stream:
+        assert stream.read() == b"".join(lines[start_row:])
+
+
+@pytest.mark.parametrize("backend", ("pandas", "numpy"))
+@pytest.mark.parametrize("start_row, stop_row", ((12_345, 23_456), (100, None)))
+def test_load_dataframe_chunks_rows(multi_block_path, backend, start_row, stop_row):
+    columns = ["i", "f", "A_if"]
+    kwargs = dict(chunk_size=5_000, column_names=columns, backend=backend)
+    expected = pandas.concat(load_dataframe_chunks(multi_block_path, **kwargs))
+    chunks = list(
+        load_dataframe_chunks(
+            multi_block_path, start_row=start_row, stop_row=stop_row, **kwargs
+        )
+    )
+    assert len(chunks[0]) == 5_000
+    assert pandas.concat(chunks).equals(expected.iloc[start_row:stop_row])
+    for first_col_is_index in [True, False]:
+        assert not list(
+            load_dataframe_chunks(
+                multi_block_path,
+                start_row=start_row,
+                stop_row=start_row,
+                first_col_is_index=first_col_is_index,
+                **kwargs,
+            )
+        )
+    with pytest.raises(ValueError):
+        load_dataframe_chunks(multi_block_path, start_row=-1, **kwargs)
+
+
+@pytest.mark.parametrize("compressed", (True, False))
+@pytest.mark.parametrize("indexed", (True, False))
+def test_byte_range_reader(multi_block_path, compressed, indexed):
+    data = bz2.decompress(multi_block_path.read_bytes())
+    path = multi_block_path
+    if not compressed:
+        path = multi_block_path.with_suffix("")
+        path.write_bytes(data)
+    if indexed and compressed:
+        index_blocks(path)
+    size = path.stat().st_size
+    blocks = find_blocks(multi_block_path)
+    # cuts mid-line, mid-block, at the block starts and beyond the file end:
+    cuts = [1, 3, 1_000, blocks[3][0] // 8, blocks[3][0] // 8 + 1, size // 2, size]
+    ranges = [(0, 0)] + list(zip([0] + cuts, cuts + [size + 10]))
+    read = []
+    for start_byte, stop_byte in ranges:
+        with ByteRangeReader(path, start_byte, stop_byte) as reader:
+            read.append(reader.read())
+    assert b"".join(read) == data
+    # the ranges are split into whole rows:
+    assert all(not part or part.endswith(b"\n") for part in read)
+    with pytest.raises(ValueError):
+        open_data_file(path, start_row=10, byte_range=(0, size))
+
+
+@pytest.mark.parametrize("backend", ("pandas", "numpy"))
+def test_load_dataframe_chunks_byte_range(multi_block_path, backend):
+    columns = ["i", "f", "A_if"]
+    kwargs = dict(chunk_size=5_000, column_names=columns, backend=backend)
+    expected = pandas.concat(load_dataframe_chunks(multi_block_path, **kwargs))
+    size = multi_block_path.stat().st_size
+    chunks = []
+    for byte_range in [(0, size // 3), (size // 3, size // 3), (size // 3, size)]:
+        chunks.extend(
+            load_dataframe_chunks(multi_block_path, byte_range=byte_range, **kwargs)
+        )
+    assert pandas.concat(chunks, ignore_index=True).equals(
+        expected.reset_index(drop=True)
+    )
@@ -0,0 +1,164 @@
+import os
+import shutil
+
+import pandas
+import pytest
+
+import exomole
+from exomole.cache import cached_chunks, get_cache_path, is_cached
+from exomole.read_data import states_chunks, trans_chunks
+from exomole.utils import load_dataframe_chunks
+from . import resources_path
+
+pytest.importorskip("pyarrow")
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+states_columns = ["i", "E", "g_tot", "J", "v", "kp"]
+states_dtypes = {"E": "float64", "g_tot": "int32", "J": "float64", "v": "int32"}
+
+
+@pytest.fixture
+def states_path(tmp_path):
+    path = tmp_path / "12C-16O__Li2015.states.bz2"
+    shutil.copy(dataset_dir / path.name, path)
+    return path
+
+
+@pytest.fixture
+def trans_path(tmp_path):
+    path = tmp_path / "12C-16O__Li2015.trans.bz2"
+    shutil.copy(dataset_dir / path.name, path)
+    return path
+
+
+def _no_parsing(*_, **__):
+    raise AssertionError("Data should be served from the cache!")
+
+
+@pytest.mark.parametrize("dtypes", (None, states_dtypes))
+def test_states_cache(states_path, tmp_path, monkeypatch, dtypes):
+    cache_dir = tmp_path / "cache"
+    kwargs = dict(columns=states_columns, chunk_size=2000, dtypes=dtypes)
+    parsed = list(states_chunks(states_path, **kwargs))
+    written = list(states_chunks(states_path, cache_dir=cache_dir, **kwargs))
+    assert len(list(cache_dir.iterdir())) == 1
+
+    monkeypatch.setattr(exomole.read_data, "load_dataframe_chunks", _no_parsing)
+    cached = list(states_chunks(states_path, cache_dir=cache_dir, **kwargs))
+    assert len(parsed) == len(written) == len(cached) == 4
+    for chunk_parsed, chunk_written, chunk_cached in zip(parsed, written, cached):
+        assert chunk_parsed.equals(chunk_written)
+        assert chunk_parsed.equals(chunk_cached)
+        assert chunk_parsed.index.equals(chunk_cached.index)
+
+
+def test_states_cache_variants(states_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+    list(states_chunks(states_path, states_columns, cache_dir=cache_dir))
+    (chunk,) = states_chunks(
+        states_path, states_columns, dtypes=states_dtypes, cache_dir=cache_dir
+    )
+    assert chunk["E"].dtype == "float64"
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_trans_cache(trans_path, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    parsed = list(trans_chunks([trans_path], 50_000))
+    list(trans_chunks([trans_path], 50_000, cache_dir=cache_dir))
+
+    monkeypatch.setattr(exomole.read_data, "load_dataframe_chunks", _no_parsing)
+    cached = list(trans_chunks([trans_path], 50_000, cache_dir=cache_dir))
+    assert len(parsed) == len(cached) == 3
+    for chunk_parsed, chunk_cached in zip(parsed, cached):
+        assert chunk_parsed.equals(chunk_cached)
+
+
+def test_stale_cache(trans_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+    list(trans_chunks([trans_path], 50_000, cache_dir=cache_dir))
+    assert is_cached(trans_path, cache_dir, variant="['i', 'f', 'A_if', 'v_if']")
+
+    stat = os.stat(trans_path)
+    os.utime(trans_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not is_cached(trans_path, cache_dir, variant="['i', 'f', 'A_if', 'v_if']")
+    list(trans_chunks([trans_path], 50_000, cache_dir=cache_dir))
+    assert is_cached(trans_path, cache_dir, variant="['i', 'f', 'A_if', 'v_if']")
+
+
+def test_interrupted_write(trans_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+    chunks = trans_chunks([trans_path], 50_000, cache_dir=cache_dir)
+    next(chunks)
+    chunks.close()
+    assert not list(cache_dir.iterdir())
+
+
+def test_column_projection(trans_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+
+    def load_chunks():
+        return load_dataframe_chunks(
+            trans_path, 100_000, column_names=["i", "f", "A_if", "v_if"]
+        )
+
+    for _ in range(2):  # written and then read from the cache
+        chunks = list(
+            cached_chunks(
+                trans_path, load_chunks, cache_dir, 100_000, columns=["A_if", "i"]
+            )
+        )
+        assert [list(chunk.columns) for chunk in chunks] == [["A_if", "i"]] * 2
+    assert get_cache_path(trans_path, cache_dir).is_file()
+
+
+def test_filters(states_path, trans_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+    states_filters = [("E", "<", 5000), ("kp", "==", "e"), ("i", ">", 10)]
+    trans_filters = [("A_if", ">", 1e-2), ("v_if", "<", 2200)]
+    for dtypes in (None, states_dtypes):
+        kwargs = dict(columns=states_columns, dtypes=dtypes, filters=states_filters)
+        expected = pandas.concat(states_chunks(states_path, **kwargs))
+        assert 0 < len(expected) < 1000
+        for _ in range(2):  # written and then read from the cache
+            cached = pandas.concat(
+                states_chunks(states_path, cache_dir=cache_dir, **kwargs)
+            )
+            assert cached.equals(expected)
+    expected = pandas.concat(trans_chunks([trans_path], 50_000, filters=trans_filters))
+    assert 0 < len(expected) < 50_000
+    for _ in range(2):
+        cached = pandas.concat(
+            trans_chunks(
+                [trans_path], 50_000, cache_dir=cache_dir, filters=trans_filters
+            )
+        )
+        assert cached.equals(expected)
+
+
+def test_states_columns_to_read(states_path, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    kwargs = dict(columns=states_columns, dtypes=states_dtypes, cache_dir=cache_dir)
+    full = pandas.concat(states_chunks(states_path, **kwargs))
+    monkeypatch.setattr(exomole.read_data, "load_dataframe_chunks", _no_parsing)
+    projected = pandas.concat(
+        states_chunks(
+            states_path, columns_to_read=["J", "E"], filters=[("v", "==", 1)], **kwargs
+        )
+    )
+    assert projected.equals(full.loc[full["v"] == 1, ["J", "E"]])
+
+
+@pytest.mark.parametrize("filters", (None, [("A_if", ">", 1e-2)]))
+def test_memory_budget(trans_path, tmp_path, monkeypatch, filters):
+    cache_dir = tmp_path / "cache"
+    kwargs = dict(cache_dir=cache_dir, filters=filters, memory_budget="1MB")
+    expected = pandas.concat(trans_chunks([trans_path], filters=filters))
+    parsed = list(trans_chunks([trans_path], **kwargs))
+    monkeypatch.setattr(exomole.read_data, "load_dataframe_chunks", _no_parsing)
+    cached = list(trans_chunks([trans_path], **kwargs))
+    for chunks in parsed, cached:
+        assert pandas.concat(chunks).equals(expected)
+    if filters is None:
+        assert len(cached) == len(parsed) > 10
+        assert max(len(chunk) for chunk in cached) < 1_000_000 // 96 + 10_000
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas
+import pytest
+
+from exomole.cross_sections import accumulate_lines, cross_section, doppler_hwhm
+from exomole.intensities import get_states_table, line_intensities
+from exomole.read_def import DefParser
+from . import resources_path
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+def_parser = DefParser(dataset_dir / "12C-16O__Li2015.def")
+def_parser.parse(warn_on_comments=False)
+
+
+@pytest.mark.parametrize("profile", ["gaussian", "voigt"])
+def test_accumulate_lines_normalised(profile):
+    grid = np.arange(0, 10, 0.001)
+    sigma = np.zeros(len(grid))
+    accumulate_lines(
+        sigma,
+        grid[0],
+        0.001,
+        np.array([3.0, 5.5]),
+        np.array([1.0, 2.0]),
+        profile=profile,
+        gauss_hwhm=np.array([0.05, 0.02]),
+        lorentz_hwhm=0.01,
+        num_widths=50,
+    )
+    assert sigma.sum() * 0.001 == pytest.approx(3.0, rel=1e-2)
+    assert grid[sigma.argmax()] == pytest.approx(5.5)
+    # the line profiles are cut off beyond the windows:
+    assert sigma[grid > 9].max() == 0
+
+
+def test_accumulate_lines_batches():
+    grid = np.arange(0, 10, 0.01)
+    centres = np.random.default_rng(0).uniform(-1, 11, 500)
+    hwhm = np.linspace(0.01, 0.1, 500)
+    kwargs = dict(profile="gaussian", gauss_hwhm=hwhm, num_widths=10)
+    sigma_1, sigma_2 = np.zeros(len(grid)), np.zeros(len(grid))
+    accumulate_lines(sigma_1, 0, 0.01, centres, np.ones(500), **kwargs)
+    accumulate_lines(
+        sigma_2, 0, 0.01, centres, np.ones(500), max_batch_size=100, **kwargs
+    )
+    assert np.allclose(sigma_1, sigma_2)
+
+
+def test_accumulate_lines_histogram():
+    sigma = np.zeros(5)
+    accumulate_lines(sigma, 1.0, 0.5, np.array([0.7, 1.1, 1.2, 2.9, 3.3]), np.ones(5))
+    assert list(sigma) == [4.0, 0.0, 0.0, 0.0, 2.0]
+
+
+def test_accumulate_lines_invalid():
+    with pytest.raises(ValueError):
+        accumulate_lines(np.zeros(3), 0, 1, np.ones(1), np.ones(1), profile="foo")
+    with pytest.raises(ValueError):
+        accumulate_lines(np.zeros(3), 0, 1, np.ones(1), np.ones(1), profile="voigt")
+
+
+def test_doppler_hwhm():
+    assert doppler_hwhm([1000.0, 2000.0], 1000, 28.0)[1] == pytest.approx(
+        2 * doppler_hwhm([1000.0], 1000, 28.0)[0]
+    )
+
+
+def test_cross_section_integral():
+    states_table = get_states_table(def_parser)
+    grid = np.arange(2000, 2300, 0.002)
+    intensities = pandas.concat(
+        line_intensities(def_parser, [1000], states_table=states_table)
+    )
+    in_grid = intensities["v_if"].between(grid[0] + 1, grid[-1] - 1)
+    expected = intensities.loc[in_grid, "S_1000"].sum()
+    for profile in ["histogram", "gaussian", "voigt"]:
+        sigma = cross_section(
+            def_parser,
+            1000,
+            grid,
+            profile=profile,
+            lorentz_hwhm=0.005,
+            states_table=states_table,
+            chunk_size=30_000,
+        )
+        # only lines near the grid edges can contribute partially
+        assert sigma.sum() * 0.002 == pytest.approx(expected, rel=2e-2)
+
+
+def test_cross_section_invalid_grid():
+    with pytest.raises(ValueError):
+        cross_section(def_parser, 296, [1.0, 2.0, 4.0])
+    with pytest.raises(ValueError):
+        cross_section(def_parser, 296, [1.0, 2.0], profile="lorentz")
@@ -0,0 +1,206 @@
+import bz2
+import itertools
+
+import pandas
+import pytest
+
+import exomole
+from exomole.cursor import ScanCursor
+from exomole.read_data import states_chunks, trans_chunks
+from . import resources_path
+
+states_path = resources_path / "dummy_states_10x5_int_float_int_str_int.states.bz2"
+states_columns = ["i", "a", "b", "c", "d"]
+dummy_trans_paths = sorted(
+    resources_path.glob("dummy_trans_5x4_int_int_float_float.trans*.bz2")
+)
+
+
+@pytest.fixture
+def trans_paths(tmp_path):
+    """Copies of the dummy trans files, so no block indexes end up in resources."""
+    paths = []
+    for path in dummy_trans_paths:
+        paths.append(tmp_path / path.name)
+        paths[-1].write_bytes(path.read_bytes())
+    return paths
+
+
+def _resumed(read_chunks, num_chunks):
+    """All the chunks read in two goes, interrupted after `num_chunks` chunks and
+    resumed from the cursor saved."""
+    cursor = ScanCursor()
+    first = list(itertools.islice(read_chunks(cursor), num_chunks))
+    saved = cursor.to_json()
+    rest = list(read_chunks(ScanCursor.from_json(saved)))
+    return first + rest
+
+
+def test_serialisation(tmp_path):
+    cursor = ScanCursor(2, 1000, "foo.trans.bz2")
+    assert ScanCursor.from_json(cursor.to_json()) == cursor
+    assert ScanCursor.from_dict(cursor.to_dict()) == cursor
+    cursor.save(tmp_path / "cursor.json")
+    assert ScanCursor.load(tmp_path / "cursor.json") == cursor
+    assert list(tmp_path.iterdir()) == [tmp_path / "cursor.json"]
+
+
+def test_check():
+    paths = ["a.trans.bz2", "b.trans.bz2"]
+    ScanCursor(1, 10, "b.trans.bz2").check(paths)
+    ScanCursor(2, 0).check(paths)
+    for cursor in [ScanCursor(1, 10, "a.trans.bz2"), ScanCursor(3), ScanCursor(0, -1)]:
+        with pytest.raises(ValueError):
+            cursor.check(paths)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"filters": [("A_if", ">", 0.5)]},
+        {"num_file_workers": 2},
+        {"prefetch": 2},
+        {"output": "arrow"},
+    ],
+)
+def test_trans_resumed(trans_paths, kwargs):
+    expected = list(trans_chunks(trans_paths, 2, **kwargs))
+    assert len(expected) == 9
+    for num_chunks in range(len(expected) + 1):
+
+        def read_chunks(cursor):
+            return trans_chunks(trans_paths, 2, cursor=cursor, **kwargs)
+
+        resumed = _resumed(read_chunks, num_chunks)
+        assert len(resumed) == len(expected)
+        for chunk, expected_chunk in zip(resumed, expected):
+            assert chunk.equals(expected_chunk)
+
+
+def test_trans_cursor_positions(trans_paths, monkeypatch):
+    cursor = ScanCursor()
+    positions = [
+        (cursor.file_index, cursor.row)
+        for _ in trans_chunks(trans_paths, 2, cursor=cursor)
+    ]
+    assert positions == [(0, 2), (0, 4), (0, 5), (1, 2), (1, 4), (1, 5)] + [
+        (2, 2),
+        (2, 4),
+        (2, 5),
+    ]
+    # moved past the last file once the consumer asks for more chunks:
+    assert (cursor.file_index, cursor.row) == (3, 0)
+    assert cursor.file_name is None
+    assert not list(trans_chunks(trans_paths, 2, cursor=cursor))
+
+    opened = []
+    original = exomole.read_data._trans_file_chunks
+
+    def spy(file_path, *args, **kwargs):
+        opened.append(file_path)
+        return original(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(exomole.read_data, "_trans_file_chunks", spy)
+    cursor = ScanCursor(1, 4, trans_paths[1].name)
+    chunks = list(trans_chunks(trans_paths, 2, cursor=cursor))
+    assert opened == trans_paths[1:]
+    assert [len(chunk) for chunk in chunks] == [1, 2, 2, 1]
+    assert chunks[0].index[0] == 4
+
+
+def test_trans_cursor_invalid(trans_paths):
+    for kwargs in [
+        {"start_row": 3},
+        {"num_file_workers": 2, "ordered": False},
+        {"cursor": ScanCursor(1, 0, "other.trans.bz2")},
+    ]:
+        kwargs = {"cursor": ScanCursor(), **kwargs}
+        with pytest.raises(ValueError):
+            list(trans_chunks(trans_paths, **kwargs))
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"filters": [("b", ">", 50)], "columns_to_read": ["c"]}, {"prefetch": 1}],
+)
+def test_states_resumed(tmp_path, kwargs):
+    path = tmp_path / states_path.name
+    path.write_bytes(states_path.read_bytes())
+    expected = pandas.concat(states_chunks(path, states_columns, 3, **kwargs))
+    for num_chunks in range(5):
+
+        def read_chunks(cursor):
+            return states_chunks(path, states_columns, 3, cursor=cursor, **kwargs)
+
+        assert pandas.concat(_resumed(read_chunks, num_chunks)).equals(expected)
+
+
+@pytest.fixture
+def multi_block_path(tmp_path):
+    """Multi-stream bz2 *.trans* file with many small (100k) blocks."""
+    lines = [f"{n:12d} {n ** 2:12d} {n / 7:.6e}\n" for n in range(30_000)]
+    data = "".join(lines).encode()
+    path = tmp_path / "multi_block.trans.bz2"
+    path.write_bytes(
+        bz2.compress(data[:500_000], compresslevel=1)
+        + bz2.compress(data[500_000:], compresslevel=1)
+    )
+    return path
+
+
+@pytest.mark.parametrize("num_workers", [None, 2])
+@pytest.mark.parametrize("backend", ["pandas", "numpy"])
+def test_trans_resumed_from_block(multi_block_path, backend, num_workers, monkeypatch):
+    kwargs = dict(backend=backend, num_workers=num_workers)
+    expected = pandas.concat(trans_chunks([multi_block_path], 7000, **kwargs))
+
+    def no_index(*args, **kwargs):
+        raise AssertionError("No block index should be needed to resume.")
+
+    monkeypatch.setattr(exomole.bz2_blocks, "get_block_index", no_index)
+    cursor = ScanCursor()
+    chunks = trans_chunks([multi_block_path], 7000, cursor=cursor, **kwargs)
+    first = list(itertools.islice(chunks, 3))
+    assert cursor.row == 21_000
+    assert cursor.block_start_bit is not None and cursor.block_start_bit > 0
+    assert 0 <= cursor.block_lines < cursor.row
+
+    scans, readers = [], []
+    find_blocks = exomole.bz2_blocks.find_blocks
+    parallel_reader = exomole.bz2_blocks.ParallelBZ2Reader
+
+    def find_blocks_spy(*args, **kwargs):
+        scans.append(kwargs.get("stop_byte"))
+        return find_blocks(*args, **kwargs)
+
+    def parallel_reader_spy(*args, **kwargs):
+        readers.append(args)
+        return parallel_reader(*args, **kwargs)
+
+    monkeypatch.setattr(exomole.bz2_blocks, "find_blocks", find_blocks_spy)
+    monkeypatch.setattr(exomole.bz2_blocks, "ParallelBZ2Reader", parallel_reader_spy)
+    cursor = ScanCursor.from_json(cursor.to_json())
+    rest = list(trans_chunks([multi_block_path], 7000, cursor=cursor, **kwargs))
+    assert pandas.concat(first + rest).equals(expected)
+    # the blocks are only located forward from the block saved, window by window:
+    assert scans and None not in scans
+    assert len(readers) == (num_workers is not None)
+    assert list(multi_block_path.parent.iterdir()) == [multi_block_path]
+
+
+def test_trans_no_lookahead(trans_paths, monkeypatch):
+    parsed = []
+    original = exomole.read_data.load_dataframe_chunks
+
+    def spy(*args, **kwargs):
+        for chunk in original(*args, **kwargs):
+            parsed.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(exomole.read_data, "load_dataframe_chunks", spy)
+    cursor = ScanCursor()
+    chunks = trans_chunks(trans_paths, 2, cursor=cursor)
+    next(chunks)
+    assert parsed == [2]
+    assert (cursor.file_index, cursor.row) == (0, 2)
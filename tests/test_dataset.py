@@ -0,0 +1,187 @@
+import bz2
+import shutil
+
+import numpy as np
+import pandas
+import pytest
+
+import exomole
+from exomole import Dataset
+from exomole.read_data import states_chunks, trans_chunks
+from exomole.read_def import DefParser
+from . import resources_path
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+def_parser = DefParser(dataset_dir / "12C-16O__Li2015.def")
+def_parser.parse(warn_on_comments=False)
+states = pandas.concat(
+    states_chunks(
+        def_parser.get_states_path(),
+        def_parser.get_states_header(),
+        dtypes=def_parser.get_states_dtypes(),
+    )
+)
+trans = pandas.concat(trans_chunks(def_parser.get_trans_paths()), ignore_index=True)
+
+
+def _joined(trans_frame):
+    """Straightforward pandas join of the transitions with the states, for
+    comparison."""
+    joined = trans_frame.copy()
+    for col in ["E", "J", "kp"]:
+        for side in ["i", "f"]:
+            joined[f"{col}_{side}"] = states.loc[trans_frame[side], col].to_numpy()
+    return joined
+
+
+@pytest.fixture
+def split_def_parser(tmp_path):
+    """The CO dataset with the transitions split into two files by wavenumber, and
+    with the wavenumbers dropped."""
+    for path in [def_parser.path, def_parser.get_states_path()]:
+        shutil.copy(path, tmp_path / path.name)
+    for file_range, mask in [
+        ("00000-02000", trans["v_if"] < 2000),
+        ("02000-20000", trans["v_if"] >= 2000),
+    ]:
+        text = trans.loc[mask, ["i", "f", "A_if"]].to_string(header=False, index=False)
+        split_path = tmp_path / f"12C-16O__Li2015__{file_range}.trans.bz2"
+        split_path.write_bytes(bz2.compress(text.encode() + b"\n"))
+    parser = DefParser(tmp_path / def_parser.file_name)
+    parser.parse(warn_on_comments=False)
+    return parser
+
+
+def test_dataset():
+    ds = Dataset(DefParser(def_parser.path))
+    assert ds.def_parser.parsed
+    assert repr(ds) == "Dataset(12C-16O__Li2015)"
+    assert ds.trans_columns == ["i", "f", "A_if", "v_if"]
+    assert ds.states_columns == def_parser.get_states_header()
+    assert exomole.Dataset is Dataset
+
+
+@pytest.mark.parametrize("backend", ["pandas", "numpy"])
+def test_states(backend):
+    query = Dataset(def_parser, backend=backend).states()
+    assert query.collect().equals(states.drop(columns="i", errors="ignore"))
+    query = query.filter("E", "<", 5000).filter("kp", "==", "f").select(["J", "E"])
+    expected = states.loc[(states["E"] < 5000) & (states["kp"] == "f"), ["J", "E"]]
+    assert query.collect().equals(expected)
+    # the queries are immutable:
+    assert query.filter("J", ">", 1e3).collect().empty
+    assert len(query.collect()) == len(expected)
+
+
+def test_transitions():
+    ds = Dataset(def_parser)
+    assert ds.transitions().collect().equals(trans)
+    query = (
+        ds.transitions()
+        .filter("A_if", ">", 1e-3)
+        .join_states(["E", "J", "kp"])
+        .filter("J_f", "<", 10)
+        .filter("kp_i", "==", "e")
+        .filter("E_i", ">=", 2000)
+    )
+    joined = _joined(trans)
+    mask = (
+        (joined["A_if"] > 1e-3)
+        & (joined["J_f"] < 10)
+        & (joined["kp_i"] == "e")
+        & (joined["E_i"] >= 2000)
+    )
+    expected = joined[mask].reset_index(drop=True)
+    result = query.collect()
+    assert 0 < len(result) < len(trans)
+    assert list(result.columns) == list(expected.columns)
+    pandas.testing.assert_frame_equal(
+        result, expected, check_categorical=False, check_dtype=False
+    )
+    plan = query.plan()
+    assert plan["trans filters"] == [("A_if", ">", 1e-3)]
+    assert plan["state ID filters"] == {
+        "i": [("kp", "==", "e"), ("E", ">=", 2000)],
+        "f": [("J", "<", 10)],
+    }
+    assert plan["post-join filters"] == []
+    selected = query.select(["E_i", "v_if"]).collect()
+    assert selected.equals(result[["E_i", "v_if"]])
+
+
+def test_states_table_reused(monkeypatch):
+    ds = Dataset(def_parser)
+    read = []
+    original = exomole.dataset.get_states_table
+
+    def spy(parser, columns, **kwargs):
+        read.append(columns)
+        return original(parser, columns, **kwargs)
+
+    monkeypatch.setattr(exomole.dataset, "get_states_table", spy)
+    ds.transitions().select(["i"]).collect()
+    assert read == []  # no join needed
+    ds.transitions().join_states(["E"]).collect()
+    ds.transitions().filter("E_f", "<", 100).collect()
+    assert read == [["E"]]
+    ds.transitions().select(["J_i"]).collect()
+    assert read == [["E"], ["J", "E"]]
+
+
+@pytest.mark.parametrize("num_workers", [None, 2])
+def test_pruned_trans_files(split_def_parser, num_workers, monkeypatch):
+    ds = Dataset(split_def_parser, num_workers=num_workers)
+    assert ds.trans_columns == ["i", "f", "A_if"]
+    opened = []
+    original = exomole.read_data._trans_file_chunks
+
+    def spy(file_path, *args, **kwargs):
+        opened.append(file_path.name)
+        return original(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(exomole.read_data, "_trans_file_chunks", spy)
+    query = (
+        ds.transitions()
+        .filter("v_if", "<", 1000)
+        .filter("v_if", ">", 100)
+        .select(["i", "f", "A_if", "v_if"])
+    )
+    plan = query.plan()
+    assert plan["trans files"] == "1 of 2 in (100, 1000)"
+    assert plan["post-join filters"] == [("v_if", "<", 1000), ("v_if", ">", 100)]
+    assert plan["states columns"] == ["E"]
+    result = query.collect()
+    assert opened == ["12C-16O__Li2015__00000-02000.trans.bz2"]
+    expected = trans[(trans["v_if"] < 1000) & (trans["v_if"] > 100)]
+    assert len(result) == len(expected)
+    assert np.allclose(result["v_if"], expected["v_if"], atol=1e-4)
+
+    # both files needed:
+    query = ds.transitions().select(["i", "f", "v_if"]).filter("i", "<=", 100)
+    expected_parallel = "2 files read at once" if num_workers else "none"
+    assert query.plan()["parallel"] == expected_parallel
+    assert len(query.collect()) == (trans["i"] <= 100).sum()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        lambda ds: ds.states().select(["i", "E"]),
+        lambda ds: ds.states().filter("E_i", "<", 0),
+        lambda ds: ds.transitions().select(["E"]),
+        lambda ds: ds.transitions().join_states(["foo"]),
+        lambda ds: ds.transitions().filter("v_if", "~", 0),
+    ],
+)
+def test_invalid_query(query):
+    with pytest.raises(ValueError):
+        query(Dataset(def_parser)).collect()
+
+
+def test_incomplete_query():
+    class PlanOnlyQuery(exomole.dataset._Query):
+        def plan(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        PlanOnlyQuery(Dataset(def_parser))
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas
+import pytest
+
+from exomole.filters import (
+    filter_dataframe,
+    filter_mask,
+    filter_record_batch,
+    validate_filters,
+)
+
+data = pandas.DataFrame(
+    {
+        "E": [0.0, 1500.5, 30000.0, 41.2],
+        "J": ["0", "1", "2", "3"],
+        "kp": pandas.Categorical(["e", "f", "e", "f"]),
+    },
+    index=[1, 2, 3, 5],
+)
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        [("E", "<")],
+        [("E", "~", 1)],
+        [("v", "<", 1)],
+        ["E < 2"],
+    ],
+)
+def test_validate_filters_invalid(filters):
+    with pytest.raises(ValueError):
+        validate_filters(filters, data.columns)
+
+
+def test_validate_filters_sets():
+    assert validate_filters([("J", "in", {1})], data.columns) == [("J", "in", [1])]
+
+
+@pytest.mark.parametrize(
+    "filters, expected_index",
+    [
+        ([], [1, 2, 3, 5]),
+        ([("E", "<", 20000)], [1, 2, 5]),
+        ([("E", ">=", 41.2), ("E", "<=", 1500.5)], [2, 5]),
+        ([("J", "in", {1, 2})], [2, 3]),
+        ([("J", "!=", 2)], [1, 2, 5]),
+        ([("J", "==", "3")], [5]),
+        ([("kp", "==", "e"), ("E", ">", 0)], [3]),
+        ([("kp", "not in", ["e"])], [2, 5]),
+        ([("i", "in", [1, 5]), ("i", ">", 2)], [5]),
+        ([("E", ">", 1e6), ("J", "==", 1)], []),
+    ],
+)
+def test_filter_dataframe(filters, expected_index):
+    filters = validate_filters(filters, list(data.columns) + ["i"])
+    filtered = filter_dataframe(data, filters, index_col="i")
+    assert list(filtered.index) == expected_index
+    assert list(filtered.columns) == list(data.columns)
+
+
+def test_filter_mask_short_circuit():
+    def get_values(column):
+        if column == "J":
+            raise AssertionError("No rows left to filter!")
+        return np.array([1.0, 2.0])
+
+    mask = filter_mask(get_values, [("E", ">", 5), ("J", "==", 1)], 2)
+    assert not mask.any()
+
+
+@pytest.mark.parametrize(
+    "filters, expected_index",
+    [
+        ([("E", "<", 20000)], [1, 2, 5]),
+        ([("J", "in", {1, 2})], [2, 3]),
+        ([("kp", "==", "e"), ("E", ">", 0)], [3]),
+        ([("kp", "not in", ["e"])], [2, 5]),
+        ([("i", ">", 2)], [3, 5]),
+    ],
+)
+def test_filter_record_batch(filters, expected_index):
+    pyarrow = pytest.importorskip("pyarrow")
+    batch = pyarrow.RecordBatch.from_pandas(data.rename_axis("i").reset_index())
+    filters = validate_filters(filters, batch.schema.names)
+    assert filter_record_batch(batch, filters).column("i").to_pylist() == (
+        expected_index
+    )
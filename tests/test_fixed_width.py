@@ -0,0 +1,128 @@
+import numpy as np
+import pandas
+import pytest
+
+from exomole.exceptions import DataParseError
+from exomole.fixed_width import (
+    fixed_width_chunks,
+    get_field_bounds,
+    parse_floats,
+    parse_ints,
+    parse_strings,
+)
+from exomole.utils import load_dataframe_chunks
+from . import resources_path
+
+
+def to_chars(*lines):
+    return np.frombuffer("".join(lines).encode(), dtype="uint8").reshape(len(lines), -1)
+
+
+def test_parse_ints():
+    chars = to_chars("     0", "    -7", "+12345", "   999")
+    assert list(parse_ints(chars)) == [0, -7, 12345, 999]
+    # not right-aligned, but still parsed:
+    assert list(parse_ints(to_chars(" 12 ", "  3 "))) == [12, 3]
+    with pytest.raises(ValueError):
+        parse_ints(to_chars("  1.0", "  2.0"))
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [" 1.1550E-06", "-2.0000E+00", " 3.0000e+03", " 9.9999E-99"],
+        ["  0.000001", "-12.500000", "  1.100000"],
+        ["  1.5D+300", " -2.0D-300"],
+        [" 1", "-2", "30"],
+        ["  .5", "-1.0", "  2."],
+        ["1.2345678901234567890", "2.0000000000000000000"],
+    ],
+)
+def test_parse_floats(values):
+    expected = [float(value.replace("D", "E")) for value in values]
+    assert list(parse_floats(to_chars(*values))) == expected
+
+
+def test_parse_floats_invalid():
+    with pytest.raises(ValueError):
+        parse_floats(to_chars(" 1.0", " abc"))
+
+
+@pytest.mark.parametrize("categorical", [False, True])
+def test_parse_strings(categorical):
+    parsed = parse_strings(to_chars("  e", " ff", "  e"), categorical=categorical)
+    assert list(parsed) == ["e", "ff", "e"]
+
+
+def test_get_field_bounds():
+    chars = to_chars("  1   e  -1.0", " 12  ff   2.5")
+    assert get_field_bounds(chars) == [(0, 3), (3, 7), (7, 13)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_fixed_width_chunks(tmp_path, chunk_size):
+    file_path = tmp_path / "dummy.states"
+    file_path.write_text("  1  0.5 a\n  2  1.5 b\n 10 -2.0 a\n")
+    chunks = list(fixed_width_chunks(file_path, chunk_size, ["i", "E", "lab"], True))
+    states = pandas.concat(chunks)
+    assert len(chunks) == -(-3 // chunk_size)
+    assert list(states.index) == [1, 2, 10]
+    assert list(states["E"]) == [0.5, 1.5, -2.0]
+    assert list(states["lab"]) == ["a", "b", "a"]
+
+
+def test_fixed_width_chunks_not_fixed_width(tmp_path):
+    file_path = tmp_path / "dummy.trans"
+    file_path.write_text("1 2 0.5\n10 2 0.5\n")
+    with pytest.raises(DataParseError):
+        list(fixed_width_chunks(file_path, 10, ["i", "f", "A_if"]))
+    file_path.write_text("1 2 0.5\n1 2 1e5\n1 2 1e-10\n")
+    with pytest.raises(DataParseError):
+        list(fixed_width_chunks(file_path, 2, ["i", "f", "A_if"]))
+    with pytest.raises(DataParseError):
+        list(fixed_width_chunks(file_path, 2, ["i", "f"]))
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 10**6])
+def test_same_as_pandas(chunk_size):
+    trans_path = resources_path.joinpath(
+        "exomol_data", "CO", "12C-16O", "Li2015", "12C-16O__Li2015.trans.bz2"
+    )
+    kwargs = dict(chunk_size=chunk_size, column_names=["i", "f", "A_if", "v_if"])
+    expected = pandas.concat(load_dataframe_chunks(trans_path, **kwargs))
+    parsed = pandas.concat(load_dataframe_chunks(trans_path, backend="numpy", **kwargs))
+    pandas.testing.assert_frame_equal(parsed, expected)
+
+
+@pytest.mark.parametrize("backend", ["pandas", "numpy"])
+@pytest.mark.parametrize("chunk_size", [1000, 10**6])
+def test_filters(backend, chunk_size):
+    trans_path = resources_path.joinpath(
+        "exomol_data", "CO", "12C-16O", "Li2015", "12C-16O__Li2015.trans.bz2"
+    )
+    kwargs = dict(chunk_size=chunk_size, column_names=["i", "f", "A_if", "v_if"])
+    filters = [("v_if", "<", 3000.0), ("i", "in", [10, 11, 12])]
+    expected = pandas.concat(load_dataframe_chunks(trans_path, **kwargs))
+    expected = expected[(expected["v_if"] < 3000) & expected["i"].isin([10, 11, 12])]
+    filtered = pandas.concat(
+        load_dataframe_chunks(trans_path, backend=backend, filters=filters, **kwargs)
+    )
+    pandas.testing.assert_frame_equal(filtered, expected)
+
+
+def test_fixed_width_chunks_filters(tmp_path):
+    file_path = tmp_path / "dummy.states"
+    file_path.write_text("  1  0.5 a\n  2  1.5 b\n 10 -2.0 a\n")
+    chunks = fixed_width_chunks(
+        file_path,
+        2,
+        ["i", "E", "lab"],
+        True,
+        usecols=["E"],
+        filters=[("lab", "==", "a"), ("i", ">", 1)],
+    )
+    states = pandas.concat(list(chunks))
+    assert list(states.index) == [10]
+    assert list(states["E"]) == [-2.0]
+    # the column filtered on is parsed too:
+    assert list(states["lab"]) == ["a"]
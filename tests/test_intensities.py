@@ -0,0 +1,71 @@
+import numpy as np
+import pandas
+import pytest
+
+from exomole.intensities import line_intensities, get_states_table, C, C2
+from exomole.read_data import states_chunks, trans_chunks
+from exomole.read_def import DefParser
+from . import resources_path
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+def_parser = DefParser(dataset_dir / "12C-16O__Li2015.def")
+def_parser.parse(warn_on_comments=False)
+
+
+def _expected_intensities(temperature):
+    """Straightforward pandas implementation, for comparison."""
+    states = pandas.concat(
+        states_chunks(
+            def_parser.get_states_path(),
+            def_parser.get_states_header(),
+            dtypes=def_parser.get_states_dtypes(),
+        )
+    )
+    trans = pandas.concat(trans_chunks(def_parser.get_trans_paths()))
+    q = (states["g_tot"] * np.exp(-C2 * states["E"] / temperature)).sum()
+    g_i = states.loc[trans["i"], "g_tot"].values
+    e_f = states.loc[trans["f"], "E"].values
+    v = trans["v_if"].values
+    return (
+        g_i
+        * trans["A_if"].values
+        / (8 * np.pi * C * v**2)
+        * np.exp(-C2 * e_f / temperature)
+        * (1 - np.exp(-C2 * v / temperature))
+        / q
+    )
+
+
+def test_line_intensities():
+    temperatures = [296, 1000, 2500.5]
+    chunks = list(line_intensities(def_parser, temperatures, chunk_size=50_000))
+    assert len(chunks) == 3
+    intensities = pandas.concat(chunks)
+    assert list(intensities.columns) == [
+        "i",
+        "f",
+        "v_if",
+        "S_296",
+        "S_1000",
+        "S_2500.5",
+    ]
+    assert len(intensities) == 125_496
+    for temperature in temperatures:
+        assert np.allclose(
+            intensities[f"S_{temperature:g}"], _expected_intensities(temperature)
+        )
+
+
+def test_line_intensities_states_table(monkeypatch):
+    states_table = get_states_table(def_parser)
+    assert states_table.columns == ["E", "g_tot"]
+    monkeypatch.setattr(
+        "exomole.intensities.get_states_table", pytest.fail, raising=True
+    )
+    chunks = line_intensities(def_parser, [296], states_table=states_table)
+    assert len(next(chunks)) == 125_496
+
+
+def test_states_and_trans_paths():
+    assert def_parser.get_states_path() == dataset_dir / "12C-16O__Li2015.states.bz2"
+    assert def_parser.get_trans_paths() == [dataset_dir / "12C-16O__Li2015.trans.bz2"]
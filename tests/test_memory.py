@@ -0,0 +1,60 @@
+import pandas
+import pytest
+
+from exomole.memory import _RESAMPLE_EVERY, ChunkSizer, parse_memory_size
+
+
+@pytest.mark.parametrize(
+    "memory_size, num_bytes",
+    (
+        (1024, 1024),
+        ("1024", 1024),
+        ("2GB", 2 * 10**9),
+        ("2 gb", 2 * 10**9),
+        ("0.5MiB", 2**19),
+        ("10kB", 10_000),
+    ),
+)
+def test_parse_memory_size(memory_size, num_bytes):
+    assert parse_memory_size(memory_size) == num_bytes
+
+
+@pytest.mark.parametrize("memory_size", ("", "GB", "2 XB", "-1GB", 0, "1.2.3MB"))
+def test_parse_memory_size_invalid(memory_size):
+    with pytest.raises(ValueError):
+        parse_memory_size(memory_size)
+
+
+def test_chunk_sizer():
+    sizer = ChunkSizer(48_000)
+    first_size = sizer.size
+    sizer.update(pandas.DataFrame())
+    assert sizer.size == first_size
+    index = list(range(100))
+    # 16 bytes per row, including the int64 index:
+    sizer.update(pandas.DataFrame({"a": [1.0] * 100}, index=index))
+    assert sizer.size == 16_000 // 16
+    # the largest memory per row is kept:
+    sizer.update(pandas.DataFrame({"a": [1.0] * 100, "b": [1.0] * 100}, index=index))
+    assert sizer.size == 16_000 // 24
+    sizer.update(pandas.DataFrame({"a": [1.0] * 100}, index=index))
+    assert sizer.size == 16_000 // 24
+    sizer = ChunkSizer(1)
+    sizer.update(pandas.DataFrame({"a": [1.0] * 100}, index=index))
+    assert sizer.size == 1
+
+
+def test_chunk_sizer_sampling():
+    sizer = ChunkSizer(48_000)
+    index = list(range(100))
+    narrow = pandas.DataFrame({"a": [1.0] * 100}, index=index)
+    wide = pandas.DataFrame({"a": [1.0] * 100, "b": [1.0] * 100}, index=index)
+    sizer.update(narrow)
+    sizer.update(narrow)
+    assert sizer.size == 16_000 // 16
+    # only every few chunks are measured after the first two:
+    for _ in range(_RESAMPLE_EVERY - 1):
+        sizer.update(wide)
+        assert sizer.size == 16_000 // 16
+    sizer.update(wide)
+    assert sizer.size == 16_000 // 24
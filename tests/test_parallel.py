@@ -0,0 +1,101 @@
+import os
+import time
+
+import pandas
+import pytest
+
+from exomole.parallel import PrefetchStats, file_chunks_in_parallel, prefetch_chunks
+from exomole.read_data import states_chunks, trans_chunks
+from . import resources_path
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+
+
+def pid_chunks(file_path):
+    for n in range(3):
+        yield file_path, n, os.getpid()
+
+
+def slow_chunks(num_chunks, delay):
+    for chunk in range(num_chunks):
+        time.sleep(delay)
+        yield chunk
+
+
+def test_prefetch_chunks_stats():
+    stats = PrefetchStats()
+    assert list(prefetch_chunks(slow_chunks(5, 0.02), 2, stats)) == list(range(5))
+    assert stats.num_chunks == 5
+    # the consumer doing no work waits for every single chunk:
+    assert stats.num_stalls == 5
+    assert stats.stall_time > 0.05
+
+    stats = PrefetchStats()
+    for _ in prefetch_chunks(slow_chunks(5, 0.001), 5, stats):
+        time.sleep(0.05)
+    assert stats.num_stalls <= 1
+
+
+def test_prefetch_chunks_error():
+    def failing_chunks():
+        yield 1
+        raise ValueError("Corrupted chunk!")
+
+    chunks = prefetch_chunks(failing_chunks(), 2)
+    assert next(chunks) == 1
+    with pytest.raises(ValueError, match="Corrupted chunk!"):
+        next(chunks)
+    with pytest.raises(ValueError):
+        list(prefetch_chunks([], 0))
+
+
+def test_prefetch_chunks_closed():
+    closed = []
+
+    def endless_chunks():
+        try:
+            while True:
+                yield 1
+        finally:
+            closed.append(True)
+
+    chunks = prefetch_chunks(endless_chunks(), 2)
+    assert next(chunks) == 1
+    chunks.close()
+    assert closed == [True]
+
+
+def test_prefetch_readers():
+    states_path = dataset_dir / "12C-16O__Li2015.states.bz2"
+    columns = ["i", "E", "g_tot", "J", "v", "kp"]
+    expected = pandas.concat(states_chunks(states_path, columns, chunk_size=1000))
+    stats = PrefetchStats()
+    chunks = list(
+        states_chunks(
+            states_path, columns, chunk_size=1000, prefetch=2, prefetch_stats=stats
+        )
+    )
+    assert pandas.concat(chunks).equals(expected)
+    assert stats.num_chunks == len(chunks) == 7
+
+    trans_paths = [dataset_dir / "12C-16O__Li2015.trans.bz2"]
+    expected = pandas.concat(trans_chunks(trans_paths, 50_000))
+    prefetched = pandas.concat(trans_chunks(trans_paths, 50_000, prefetch=1))
+    assert prefetched.equals(expected)
+
+
+@pytest.mark.parametrize("ordered", (True, False))
+def test_file_chunks_in_parallel_pool(ordered):
+    file_paths = [f"file{n}" for n in range(12)]
+    chunks = list(
+        file_chunks_in_parallel(
+            pid_chunks, file_paths, 3, ordered=ordered, max_chunks_in_flight=3
+        )
+    )
+    expected = [(path, n) for path in file_paths for n in range(3)]
+    if ordered:
+        assert [chunk[:2] for chunk in chunks] == expected
+    else:
+        assert sorted(chunk[:2] for chunk in chunks) == sorted(expected)
+    # the worker processes are reused for all the files:
+    assert len({pid for _, _, pid in chunks}) <= 3
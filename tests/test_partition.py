@@ -0,0 +1,118 @@
+import shutil
+import warnings
+
+import numpy as np
+import pandas
+import pytest
+
+import exomole
+from exomole.exceptions import TemperatureWarning
+from exomole.partition import (
+    partition_sums,
+    compute_partition_function,
+    get_partition_function,
+    get_cache_path,
+    check_temperatures,
+    C2,
+)
+from exomole.read_data import states_chunks
+from exomole.read_def import DefParser
+from . import resources_path
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+
+
+@pytest.fixture
+def def_parser(tmp_path):
+    """Parser of a copy of the CO dataset, so the cache does not pollute resources."""
+    for path in dataset_dir.glob("*.[ds]*"):
+        shutil.copy(path, tmp_path / path.name)
+    parser = DefParser(tmp_path / "12C-16O__Li2015.def")
+    parser.parse(warn_on_comments=False)
+    return parser
+
+
+@pytest.fixture(scope="module")
+def states():
+    return pandas.concat(
+        states_chunks(
+            dataset_dir / "12C-16O__Li2015.states.bz2",
+            ["i", "E", "g_tot", "J", "v", "kp"],
+            dtypes={"E": "float64", "g_tot": "int32"},
+        )
+    )
+
+
+def _direct(states, temperature):
+    return (states["g_tot"] * np.exp(-C2 * states["E"] / temperature)).sum()
+
+
+@pytest.mark.parametrize("max_batch_size", (1, 10, 2**24))
+def test_partition_sums(states, max_batch_size):
+    temperatures = [10, 296, 5000]
+    q = partition_sums(
+        states["E"], states["g_tot"], temperatures, max_batch_size=max_batch_size
+    )
+    assert np.allclose(q, [_direct(states, t) for t in temperatures])
+
+
+def test_compute_partition_function(states):
+    chunks = (states.iloc[n : n + 1000] for n in range(0, len(states), 1000))
+    q = compute_partition_function(chunks, [296, 1000])
+    assert np.allclose(q, [_direct(states, 296), _direct(states, 1000)])
+
+
+def test_get_partition_function(def_parser, states, monkeypatch):
+    temperatures = [1.5, 296, 1234.5, 9000]
+    cache_path = get_cache_path(def_parser)
+    assert not cache_path.exists()
+    q = get_partition_function(def_parser, temperatures)
+    assert cache_path.is_file()
+    expected = [_direct(states, t) for t in temperatures]
+    assert np.allclose(q, expected, rtol=1e-4)
+
+    # now without any rescan of the states file:
+    monkeypatch.setattr(exomole.partition, "states_chunks", pytest.fail)
+    assert np.allclose(get_partition_function(def_parser, temperatures), q)
+
+
+def test_stale_cache(def_parser, monkeypatch):
+    get_partition_function(def_parser, [296])
+    def_parser.get_states_path().touch()
+    calls = []
+    monkeypatch.setattr(
+        exomole.partition,
+        "compute_partition_function",
+        lambda chunks, grid: calls.append(grid) or np.ones(len(grid)),
+    )
+    assert get_partition_function(def_parser, [296]) == pytest.approx(1)
+    assert len(calls) == 1
+
+
+def test_temperature_out_of_cached_grid(def_parser, states):
+    get_partition_function(def_parser, [296])
+    with pytest.warns(TemperatureWarning):
+        q = get_partition_function(def_parser, [0.5, 10_000])
+    assert np.allclose(q, [_direct(states, 0.5), _direct(states, 10_000)], rtol=1e-4)
+
+
+def test_check_temperatures(def_parser):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        check_temperatures(def_parser, [1, 9000])
+    with pytest.warns(TemperatureWarning):
+        check_temperatures(def_parser, [9000.1])
+    with pytest.raises(ValueError):
+        check_temperatures(def_parser, [0, 296])
+
+
+def test_row_selecting_kwargs(def_parser, states):
+    filters = [("E", "<", 5000)]
+    for kwargs in [{"filters": filters}, {"shard": 0, "num_shards": 2}]:
+        with pytest.raises(ValueError):
+            get_partition_function(def_parser, [296], **kwargs)
+    assert not get_cache_path(def_parser).exists()
+
+    q = get_partition_function(def_parser, [296], use_cache=False, filters=filters)
+    assert q == pytest.approx(_direct(states[states["E"] < 5000], 296), rel=1e-4)
+    assert not get_cache_path(def_parser).exists()
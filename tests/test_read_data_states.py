@@ -6,10 +6,14 @@ Most of the functionality tested is handled by functions in `utils` and is also
 tested there more properly.
 """
 
+import bz2
+
+import pandas
 import pytest
 
 from exomole.exceptions import StatesParseError
 from exomole.read_data import states_chunks
+from exomole.read_def import DefParser
 from . import resources_path
 
 dummy_states_path = resources_path.joinpath(
@@ -76,3 +80,157 @@ def test_no_compression():
     for chunk in states_chunks(states_path, chunk_size=5, columns=columns):
         assert list(chunk.columns) == "a b c d".split()
         assert chunk.at[5, "c"] == "8"
+
+
+def test_dtypes():
+    columns = "i a b c d".split()
+    dtypes = {"i": "int64", "a": "float64", "b": "int32", "c": "category"}
+    for chunk in states_chunks(dummy_states_path, columns, 4, dtypes=dtypes):
+        assert chunk.index.dtype == "int64"
+        assert chunk["a"].dtype == "float64"
+        assert chunk["b"].dtype == "int32"
+        assert chunk["c"].dtype == "category"
+        assert chunk["d"].dtype == "O"  # missing from dtypes
+
+
+def test_dtypes_inconsistent():
+    columns = "i a b c d".split()
+    with pytest.raises(StatesParseError):
+        list(states_chunks(dummy_states_path, columns, 4, dtypes={"c": "int32"}))
+
+
+def test_dtypes_from_def():
+    dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+    def_parser = DefParser(dataset_dir / "12C-16O__Li2015.def")
+    def_parser.parse(warn_on_comments=False)
+    dtypes = def_parser.get_states_dtypes()
+    chunks = list(
+        states_chunks(
+            dataset_dir / "12C-16O__Li2015.states.bz2",
+            columns=def_parser.get_states_header(),
+            dtypes=dtypes,
+        )
+    )
+    assert len(chunks) == 1
+    assert dict(chunks[0].dtypes) == {
+        "E": "float64",
+        "g_tot": "int32",
+        "J": "float64",
+        "v": "int32",
+        "kp": "category",
+    }
+    assert chunks[0].at[3, "E"] == 4260.0622
+
+
+@pytest.mark.parametrize("chunk_size", [3, 100])
+def test_filters(chunk_size):
+    chunks = states_chunks(
+        dummy_states_path,
+        columns=["i", "a", "b", "c", "d"],
+        chunk_size=chunk_size,
+        filters=[("a", ">", 0.45), ("b", ">=", 88), ("i", "!=", 2)],
+    )
+    states = pandas.concat(chunks)
+    assert list(states.index) == [1, 4, 6, 8]
+    assert states["b"].dtype == object
+
+
+def test_filters_invalid():
+    with pytest.raises(ValueError):
+        list(
+            states_chunks(
+                dummy_states_path, ["i", "a", "b", "c", "d"], filters=[("E", "<", 1)]
+            )
+        )
+
+
+@pytest.mark.parametrize("columns_to_read", [["c"], ["d", "a"], ["i", "b"], []])
+def test_columns_to_read(columns_to_read):
+    columns = ["i", "a", "b", "c", "d"]
+    dtypes = {"a": "float64", "b": "int32"}
+    full = pandas.concat(states_chunks(dummy_states_path, columns, dtypes=dtypes))
+    chunks = list(
+        states_chunks(
+            dummy_states_path,
+            columns,
+            chunk_size=4,
+            dtypes=dtypes,
+            columns_to_read=columns_to_read,
+        )
+    )
+    assert len(chunks) == 3
+    expected = full[[col for col in columns_to_read if col != "i"]]
+    assert pandas.concat(chunks).equals(expected)
+    assert chunks[0].index.name is None
+
+
+def test_columns_to_read_filters():
+    states = pandas.concat(
+        states_chunks(
+            dummy_states_path,
+            ["i", "a", "b", "c", "d"],
+            columns_to_read=["c"],
+            filters=[("b", "<", 50), ("i", ">", 5)],
+        )
+    )
+    assert list(states.columns) == ["c"]
+    assert list(states["c"]) == ["g", "j"]
+
+
+def test_columns_to_read_invalid():
+    with pytest.raises(ValueError):
+        list(states_chunks(dummy_states_path, ["i", "a"], columns_to_read=["E"]))
+
+
+def test_backend_numpy():
+    dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+    def_parser = DefParser(dataset_dir / "12C-16O__Li2015.def")
+    def_parser.parse(warn_on_comments=False)
+    kwargs = dict(
+        columns=def_parser.get_states_header(),
+        dtypes=def_parser.get_states_dtypes(),
+        chunk_size=500,
+        filters=[("v", "<", 10)],
+    )
+    states_path = dataset_dir / "12C-16O__Li2015.states.bz2"
+    expected = pandas.concat(states_chunks(states_path, **kwargs))
+    states = pandas.concat(states_chunks(states_path, backend="numpy", **kwargs))
+    pandas.testing.assert_frame_equal(states, expected)
+
+
+def test_backend_numpy_not_fixed_width():
+    with pytest.raises(StatesParseError):
+        list(states_chunks(dummy_states_path, ["i", "a", "b", "c", "d"], backend="np"))
+    with pytest.raises(StatesParseError):
+        list(
+            states_chunks(dummy_states_path, ["i", "a", "b", "c", "d"], backend="numpy")
+        )
+
+
+def test_memory_budget():
+    columns = ["i", "a", "b", "c", "d"]
+    chunks = list(states_chunks(dummy_states_path, columns, memory_budget="1GB"))
+    # all the rows fit into the first (probing) chunk:
+    assert len(chunks) == 1
+    assert chunks[0].equals(pandas.concat(states_chunks(dummy_states_path, columns)))
+    with pytest.raises(ValueError):
+        list(states_chunks(dummy_states_path, ["i", "a"], memory_budget="1 XB"))
+
+
+@pytest.mark.parametrize("num_shards", (1, 2, 4))
+def test_shards(tmp_path, num_shards):
+    columns = ["i", "a", "b", "c", "d"]
+    # uncompressed copy, to be split on the byte ranges:
+    states_path = tmp_path / dummy_states_path.stem
+    states_path.write_bytes(bz2.decompress(dummy_states_path.read_bytes()))
+    expected = pandas.concat(states_chunks(states_path, columns))
+    chunks = []
+    for shard in range(num_shards):
+        chunks.extend(
+            states_chunks(states_path, columns, shard=shard, num_shards=num_shards)
+        )
+    assert pandas.concat(chunks).equals(expected)
+    with pytest.raises(ValueError):
+        list(
+            states_chunks(states_path, columns, shard=num_shards, num_shards=num_shards)
+        )
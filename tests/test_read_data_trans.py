@@ -6,10 +6,13 @@ Most of the functionality tested is handled by functions in `utils` and is also
 tested there more properly.
 """
 
+import bz2
+
+import pandas
 import pytest
 
 import exomole
-from exomole.exceptions import TransParseError
+from exomole.exceptions import DataParseError, TransParseError
 from exomole.read_data import trans_chunks
 from . import resources_path
 
@@ -59,3 +62,247 @@ def test_dtype_cast(col, dtype):
     """Hopefully the types are correctly cast as int, int, float, float"""
     for chunk in trans_chunks(dummy_trans_paths, 5):
         assert chunk[col].dtype == dtype
+
+
+@pytest.mark.parametrize("num_file_workers", (1, 2, 3, 5))
+def test_num_file_workers_ordered(num_file_workers):
+    serial = list(trans_chunks(dummy_trans_paths, 2))
+    parallel = list(
+        trans_chunks(dummy_trans_paths, 2, num_file_workers=num_file_workers)
+    )
+    assert len(serial) == len(parallel)
+    for chunk_serial, chunk_parallel in zip(serial, parallel):
+        assert chunk_serial.equals(chunk_parallel)
+
+
+@pytest.mark.parametrize("max_chunks_in_flight", (1, 2, 10))
+def test_num_file_workers_unordered(max_chunks_in_flight):
+    serial = pandas.concat(trans_chunks(dummy_trans_paths, 2))
+    parallel = pandas.concat(
+        trans_chunks(
+            dummy_trans_paths,
+            2,
+            num_file_workers=2,
+            ordered=False,
+            max_chunks_in_flight=max_chunks_in_flight,
+        )
+    )
+    columns = list(serial.columns)
+    assert serial.sort_values(columns).values.tolist() == (
+        parallel.sort_values(columns).values.tolist()
+    )
+
+
+def test_num_file_workers_error(tmp_path):
+    broken_path = tmp_path / "broken.trans.bz2"
+    broken_path.write_bytes(b"this is not bz2 data")
+    with pytest.raises(OSError):
+        list(trans_chunks(dummy_trans_paths + [broken_path], 2, num_file_workers=2))
+
+
+def test_wavenumber_range(tmp_path, monkeypatch):
+    split_paths = []
+    file_ranges = ["0-100", "100-200", "300-400"]
+    for path, file_range in zip(sorted(dummy_trans_paths), file_ranges):
+        split_path = tmp_path / f"dummy__{file_range}.trans.bz2"
+        split_path.write_bytes(path.read_bytes())
+        split_paths.append(split_path)
+    opened = []
+    original = exomole.read_data._trans_file_chunks
+
+    def spy(file_path, *args, **kwargs):
+        opened.append(file_path)
+        return original(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(exomole.read_data, "_trans_file_chunks", spy)
+    chunks = list(trans_chunks(split_paths, wavenumber_range=(150, 250)))
+    assert opened == [split_paths[1]]
+    assert len(pandas.concat(chunks)) == 5
+    opened.clear()
+    list(trans_chunks(split_paths, wavenumber_range=(None, 100)))
+    assert opened == split_paths[:2]
+    assert list(trans_chunks(split_paths, wavenumber_range=(200, 299))) == []
+    opened.clear()
+    # files without the range in their names are never skipped
+    list(trans_chunks(dummy_trans_paths, wavenumber_range=(1e5, 1e6)))
+    assert len(opened) == 3
+
+
+@pytest.mark.parametrize("num_file_workers", [None, 2])
+def test_filters(num_file_workers):
+    kwargs = dict(chunk_size=2, num_file_workers=num_file_workers)
+    all_trans = pandas.concat(trans_chunks(dummy_trans_paths, **kwargs))
+    filters = [("A_if", ">", 0.3), ("i", "in", {1, 2, 7})]
+    filtered = pandas.concat(trans_chunks(dummy_trans_paths, filters=filters, **kwargs))
+    expected = all_trans[(all_trans["A_if"] > 0.3) & all_trans["i"].isin([1, 2, 7])]
+    assert filtered.equals(expected)
+    with pytest.raises(ValueError):
+        list(trans_chunks(dummy_trans_paths, filters=[("E", "<", 1)]))
+
+
+def test_backend_numpy_not_fixed_width():
+    with pytest.raises(DataParseError):
+        list(trans_chunks(dummy_trans_paths, backend="numpy"))
+
+
+@pytest.mark.parametrize("backend", ("pandas", "numpy"))
+def test_memory_budget(backend):
+    trans_path = resources_path.joinpath(
+        "exomol_data", "CO", "12C-16O", "Li2015", "12C-16O__Li2015.trans.bz2"
+    )
+    chunks = list(trans_chunks([trans_path], memory_budget="1MB", backend=backend))
+    # the probing chunk, then 32 bytes per row with a third of the budget per chunk:
+    assert len(chunks[0]) == 10_000
+    assert all(10_000 < len(chunk) <= 1_000_000 // 96 for chunk in chunks[1:-1])
+    assert pandas.concat(chunks).equals(pandas.concat(trans_chunks([trans_path])))
+
+
+def test_memory_budget_prefetch():
+    trans_path = resources_path.joinpath(
+        "exomol_data", "CO", "12C-16O", "Li2015", "12C-16O__Li2015.trans.bz2"
+    )
+    chunks = list(trans_chunks([trans_path], memory_budget="1MB", prefetch=3))
+    # the budget shared by the chunk processed and the 3 chunks read ahead:
+    assert all(len(chunk) <= 1_000_000 // 96 // 4 for chunk in chunks[1:])
+    assert pandas.concat(chunks).equals(pandas.concat(trans_chunks([trans_path])))
+
+
+@pytest.mark.parametrize("num_file_workers", [None, 2])
+@pytest.mark.parametrize("start_row, stop_row", [(3, 12), (7, None), (None, 6)])
+def test_start_stop_row(tmp_path, num_file_workers, start_row, stop_row):
+    trans_paths = []
+    for path in sorted(dummy_trans_paths):
+        trans_paths.append(tmp_path / path.name)
+        trans_paths[-1].write_bytes(path.read_bytes())
+    expected = pandas.concat(trans_chunks(trans_paths))
+    chunks = list(
+        trans_chunks(
+            trans_paths,
+            chunk_size=2,
+            num_file_workers=num_file_workers,
+            start_row=start_row,
+            stop_row=stop_row,
+        )
+    )
+    assert pandas.concat(chunks).equals(expected.iloc[start_row:stop_row])
+    # the rows are only counted in the files before the start or stop row:
+    assert (tmp_path / f"{trans_paths[0].name}.idx").is_file()
+    assert (tmp_path / f"{trans_paths[-1].name}.idx").is_file() == (stop_row == 12)
+    assert not list(trans_chunks(trans_paths, start_row=15))
+    with pytest.raises(ValueError):
+        list(trans_chunks(trans_paths, stop_row=-1))
+
+
+def test_start_row_index_dir(tmp_path):
+    trans_paths = sorted(dummy_trans_paths)
+    chunks = list(trans_chunks(trans_paths, start_row=7, index_dir=tmp_path))
+    assert pandas.concat(chunks).equals(
+        pandas.concat(trans_chunks(trans_paths)).iloc[7:]
+    )
+    assert (tmp_path / f"{trans_paths[0].name}.idx").is_file()
+    assert not any(path.with_name(f"{path.name}.idx").exists() for path in trans_paths)
+
+
+@pytest.mark.parametrize("num_shards", (1, 2, 3, 10))
+@pytest.mark.parametrize("num_file_workers", (None, 2))
+def test_shards(tmp_path, num_shards, num_file_workers):
+    trans_paths = []
+    for path in sorted(dummy_trans_paths):
+        # uncompressed copies, to be split on the byte ranges:
+        trans_paths.append(tmp_path / path.name.replace(".bz2", ""))
+        trans_paths[-1].write_bytes(bz2.decompress(path.read_bytes()))
+    expected = pandas.concat(trans_chunks(trans_paths), ignore_index=True)
+    shards = [
+        list(
+            trans_chunks(
+                trans_paths,
+                chunk_size=2,
+                num_file_workers=num_file_workers,
+                shard=shard,
+                num_shards=num_shards,
+            )
+        )
+        for shard in range(num_shards)
+    ]
+    chunks = [chunk for shard_chunks in shards for chunk in shard_chunks]
+    assert pandas.concat(chunks, ignore_index=True).equals(expected)
+    if num_shards == 3:
+        # the shards are balanced:
+        assert [sum(len(chunk) for chunk in chunks) for chunks in shards] == [5, 5, 5]
+
+
+def test_shards_invalid():
+    for shard, num_shards in [(2, 2), (-1, 2), (0, 0), (None, 2), (0, None)]:
+        with pytest.raises(ValueError):
+            list(trans_chunks(dummy_trans_paths, shard=shard, num_shards=num_shards))
+    with pytest.raises(ValueError):
+        list(trans_chunks(dummy_trans_paths, start_row=1, shard=0, num_shards=2))
+
+
+@pytest.mark.parametrize("backend", ("pandas", "numpy"))
+def test_dtypes(tmp_path, backend):
+    # the numpy backend needs fixed-width files:
+    trans_path = resources_path.joinpath(
+        "exomol_data", "CO", "12C-16O", "Li2015", "12C-16O__Li2015.trans.bz2"
+    )
+    dtypes = {"i": "int32", "f": "uint16", "A_if": "float32"}
+    expected = pandas.concat(trans_chunks([trans_path]))
+    for cache_dir in [None, tmp_path, tmp_path]:
+        chunks = list(
+            trans_chunks(
+                [trans_path],
+                chunk_size=50_000,
+                backend=backend,
+                cache_dir=cache_dir,
+                dtypes=dtypes,
+                num_states=6383,
+            )
+        )
+        assert all(
+            chunk.dtypes.astype(str).tolist()
+            == ["int32", "uint16", "float32", "float64"]
+            for chunk in chunks
+        )
+        chunks = pandas.concat(chunks)
+        assert chunks.astype(expected.dtypes).iloc[:, :2].equals(expected.iloc[:, :2])
+        assert chunks["A_if"].equals(expected["A_if"].astype("float32"))
+    # the 3-column files have no wavenumbers:
+    chunk = next(
+        trans_chunks(
+            [resources_path / "dummy_trans_5x3_int_int_float.trans.bz2"],
+            dtypes={"i": "int64", "v_if": "float32"},
+        )
+    )
+    assert chunk.dtypes.astype(str).tolist() == ["int64", "int64", "float64"]
+
+
+def test_dtypes_arrow():
+    batch = next(
+        trans_chunks(
+            dummy_trans_paths,
+            output="arrow",
+            dtypes={"i": "int32", "v_if": "float32"},
+            num_states=10,
+        )
+    )
+    assert [str(field.type) for field in batch.schema] == [
+        "int32",
+        "int64",
+        "double",
+        "float",
+    ]
+
+
+@pytest.mark.parametrize(
+    "dtypes, num_states",
+    (
+        ({"i": "int32"}, None),
+        ({"f": "int16"}, 2**15),
+        ({"i": "float64"}, 10),
+        ({"A_if": "int64"}, 10),
+        ({"E": "float64"}, 10),
+    ),
+)
+def test_dtypes_invalid(dtypes, num_states):
+    with pytest.raises(ValueError):
+        list(trans_chunks(dummy_trans_paths, dtypes=dtypes, num_states=num_states))
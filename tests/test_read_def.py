@@ -113,6 +113,62 @@ def test_states_header(
     )
 
 
+@pytest.mark.parametrize(
+    "q_format, dtype",
+    (
+        ("I4 %4d", "int32"),
+        ("I4 %4i", "int32"),
+        ("A1 %1s", "category"),
+        ("A10 %-10s", "category"),
+        ("F7.1 %7.1f", "float64"),
+        ("ES12.4 %12.4E", "float64"),
+        ("I3", "int32"),
+        ("F5.1", "float64"),
+        ("A4", "category"),
+        ("", "category"),
+    ),
+)
+def test_quantum_dtype(q_format, dtype):
+    assert Quantum("foo", q_format, "description").get_dtype() == dtype
+
+
+def test_states_dtypes():
+    def_parser = DefParser(example_def_path)
+    def_parser.parse(warn_on_comments=False)
+    assert def_parser.get_states_dtypes() == {
+        "i": "int64",
+        "E": "float64",
+        "g_tot": "int32",
+        "J": "float64",
+        "tau": "float64",
+        "par": "category",
+        "v": "int32",
+        "N": "int32",
+        "e/f": "category",
+    }
+
+
+def test_trans_dtypes():
+    def_parser = DefParser(example_def_path)
+    def_parser.parse(warn_on_comments=False)
+    assert def_parser.get_trans_dtypes() == {
+        "i": "int32",
+        "f": "int32",
+        "A_if": "float32",
+        "v_if": "float64",
+    }
+    def_parser.num_states = 2**31
+    assert def_parser.get_trans_dtypes("float64")["i"] == "int64"
+
+
+def test_label_vocabulary():
+    def_parser = DefParser(example_def_path)
+    def_parser.parse(warn_on_comments=False)
+    vocabulary = def_parser.get_label_vocabulary()
+    assert vocabulary.columns == ["par", "e/f"]
+    assert vocabulary["par"] == vocabulary["e/f"] == []
+
+
 def test_invalid_iso_formula(monkeypatch):
     monkeypatch.setattr(
         exomole.read_def,
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas
+import pytest
+
+from exomole.exceptions import StatesLookupError
+from exomole.read_data import states_chunks, trans_chunks
+from exomole.read_def import DefParser
+from exomole.states_table import StatesTable, join_states
+from . import resources_path
+
+dataset_dir = resources_path.joinpath("exomol_data", "CO", "12C-16O", "Li2015")
+def_parser = DefParser(dataset_dir / "12C-16O__Li2015.def")
+def_parser.parse(warn_on_comments=False)
+states_path = dataset_dir / "12C-16O__Li2015.states.bz2"
+trans_path = dataset_dir / "12C-16O__Li2015.trans.bz2"
+states_kwargs = dict(
+    columns=def_parser.get_states_header(), dtypes=def_parser.get_states_dtypes()
+)
+
+
+@pytest.fixture(scope="module")
+def states():
+    return pandas.concat(states_chunks(states_path, **states_kwargs))
+
+
+@pytest.mark.parametrize("num_states", (None, 1, 6383, 10_000))
+def test_from_chunks(states, num_states):
+    table = StatesTable.from_chunks(
+        states_chunks(states_path, chunk_size=1000, **states_kwargs),
+        num_states=num_states,
+    )
+    assert table.max_id == len(table) == 6383
+    assert table.columns == ["E", "g_tot", "J", "v", "kp"]
+    assert table["E"].dtype == "float64"
+    assert np.isnan(table["E"][0])
+    assert (table["E"][1:] == states["E"].values).all()
+    assert table.categories == {"kp": ["e"]}
+
+
+def test_take(states):
+    table = StatesTable.from_chunks(
+        states_chunks(states_path, chunk_size=1000, **states_kwargs)
+    )
+    ids = np.random.default_rng(42).integers(1, 6384, size=10_000)
+    taken = table.take(ids)
+    expected = states.loc[ids].reset_index(drop=True)
+    assert taken.equals(expected.astype(taken.dtypes))
+    assert list(taken["kp"]) == list(expected["kp"])
+    assert list(table.take(ids, columns=["J"]).columns) == ["J"]
+
+
+def test_columns_subset():
+    table = StatesTable.from_chunks(
+        states_chunks(states_path, **states_kwargs), columns=["E", "g_tot"]
+    )
+    assert table.columns == ["E", "g_tot"]
+
+
+def test_gaps_and_missing_ids():
+    chunks = [
+        pandas.DataFrame({"E": [1.0, 2.0]}, index=[1, 2]),
+        pandas.DataFrame({"E": [5.0]}, index=[5]),
+    ]
+    table = StatesTable.from_chunks(chunks)
+    assert table.max_id == 5
+    assert len(table) == 3
+    assert list(table.take([5, 1])["E"]) == [5.0, 1.0]
+    for ids in ([3], [0], [6], [-1], [1, 2, 42]):
+        with pytest.raises(StatesLookupError):
+            table.take(ids)
+    with pytest.raises(StatesLookupError):
+        StatesTable.from_chunks([pandas.DataFrame({"E": [0.0]}, index=[0])])
+
+
+def test_categories_across_chunks():
+    chunks = [
+        pandas.DataFrame({"c": pandas.Categorical(["a", "b"])}, index=[1, 2]),
+        pandas.DataFrame({"c": pandas.Categorical(["c", "a"])}, index=[3, 4]),
+    ]
+    table = StatesTable.from_chunks(chunks)
+    assert table.categories == {"c": ["a", "b", "c"]}
+    assert list(table.take([4, 3, 2, 1])["c"]) == ["a", "c", "b", "a"]
+
+
+@pytest.fixture(scope="module")
+def table():
+    return StatesTable.from_chunks(states_chunks(states_path, **states_kwargs))
+
+
+def test_join_states(states, table):
+    chunks = list(join_states(trans_chunks([trans_path], 50_000), table))
+    assert len(chunks) == 3
+    joined = pandas.concat(chunks)
+    assert list(joined.columns) == ["i", "f", "A_if", "v_if", "E_f", "g_tot_i"]
+    assert len(joined) == 125_496
+    assert (joined["E_f"].values == states.loc[joined["f"], "E"].values).all()
+    assert (joined["g_tot_i"].values == states.loc[joined["i"], "g_tot"].values).all()
+    assert joined["g_tot_i"].dtype == "int32"
+
+
+def test_join_states_v_if_derived(table):
+    trans = pandas.concat(trans_chunks([trans_path], 50_000))
+    (joined,) = join_states([trans[["i", "f", "A_if"]]], table)
+    assert np.allclose(joined["v_if"], trans["v_if"], atol=1e-3)
+
+
+def test_join_states_projection_and_dtype(table):
+    columns = ["v_if", "J_i", "J_f", "kp_f", "A_if"]
+    for chunk in join_states(trans_chunks([trans_path], 50_000), table, columns, "f4"):
+        assert list(chunk.columns) == columns
+        assert chunk["v_if"].dtype == chunk["J_i"].dtype == "float32"
+        assert chunk["A_if"].dtype == "float32"
+        assert chunk["kp_f"].dtype == "category"
+        assert (np.abs(chunk["J_i"] - chunk["J_f"]) == 1).all()
+
+
+@pytest.mark.parametrize("column", ("foo", "E", "E_x", "foo_i"))
+def test_join_states_unknown_column(table, column):
+    with pytest.raises(ValueError):
+        next(join_states(trans_chunks([trans_path], 10), table, ["i", column]))
+
+
+def test_join_states_missing_state():
+    table = StatesTable.from_chunks([pandas.DataFrame({"E": [1.0]}, index=[1])])
+    trans = pandas.DataFrame({"i": [1], "f": [2], "A_if": [1.0]})
+    with pytest.raises(StatesLookupError):
+        next(join_states([trans], table))
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas
+import pytest
+
+from exomole.exceptions import TransParseError
+from exomole.read_data import trans_chunks
+from exomole.trans_store import (
+    get_store_dtype,
+    write_trans_store,
+    write_sorted_trans_store,
+    read_trans_store,
+    HEADER_SIZE,
+)
+from . import resources_path
+
+co_trans_path = resources_path.joinpath(
+    "exomol_data", "CO", "12C-16O", "Li2015", "12C-16O__Li2015.trans.bz2"
+)
+dummy_trans_path = resources_path / "dummy_trans_5x3_int_int_float.trans.bz2"
+
+
+@pytest.mark.parametrize("a_dtype", ("float32", "float64"))
+def test_round_trip(tmp_path, a_dtype):
+    store_path = tmp_path / "co.trans.bin"
+    num_records = write_trans_store(
+        trans_chunks([co_trans_path], 50_000), store_path, a_dtype=a_dtype
+    )
+    transitions = read_trans_store(store_path)
+    expected = pandas.concat(trans_chunks([co_trans_path], 50_000))
+    assert num_records == len(transitions) == len(expected) == 125_496
+    assert isinstance(transitions, np.memmap)
+    assert transitions.dtype == get_store_dtype(a_dtype)
+    assert store_path.stat().st_size == HEADER_SIZE + 125_496 * transitions.itemsize
+    assert (transitions["i"] == expected["i"].values).all()
+    assert (transitions["f"] == expected["f"].values).all()
+    assert (transitions["v_if"] == expected["v_if"].values).all()
+    assert np.allclose(transitions["A_if"], expected["A_if"].values, rtol=1e-7)
+
+
+def test_without_v_if(tmp_path):
+    store_path = tmp_path / "dummy.trans.bin"
+    write_trans_store(trans_chunks([dummy_trans_path], 2), store_path)
+    transitions = read_trans_store(store_path)
+    assert transitions.dtype.names == ("i", "f", "A_if")
+    assert len(transitions) == 5
+
+    with pytest.raises(TransParseError):
+        write_trans_store(
+            trans_chunks([dummy_trans_path], 2), store_path, with_v_if=True
+        )
+
+
+def test_empty(tmp_path):
+    store_path = tmp_path / "empty.trans.bin"
+    assert write_trans_store([], store_path) == 0
+    assert len(read_trans_store(store_path)) == 0
+
+
+def test_index_overflow(tmp_path):
+    chunk = pandas.DataFrame({"i": [2**31], "f": [1], "A_if": [1.0]})
+    with pytest.raises(TransParseError):
+        write_trans_store([chunk], tmp_path / "overflow.trans.bin")
+    assert not list(tmp_path.iterdir())
+
+
+def test_invalid_file(tmp_path):
+    store_path = tmp_path / "foo.bin"
+    store_path.write_bytes(b"\0" * 100)
+    with pytest.raises(TransParseError):
+        read_trans_store(store_path)
+
+
+def test_unsupported_dtype():
+    with pytest.raises(ValueError):
+        get_store_dtype("int32")
+
+
+def random_chunks(num_chunks, chunk_size, with_nan=False):
+    rng = np.random.default_rng(42)
+    for n in range(num_chunks):
+        chunk = pandas.DataFrame(
+            {
+                "i": rng.integers(1, 1000, chunk_size),
+                "f": rng.integers(1, 1000, chunk_size),
+                "A_if": rng.random(chunk_size),
+                # with plenty of equal wavenumbers:
+                "v_if": rng.integers(0, 500, chunk_size) / 10,
+            },
+            index=range(n * chunk_size, (n + 1) * chunk_size),
+        )
+        if with_nan:
+            chunk.loc[chunk.index[::7], "v_if"] = np.nan
+        yield chunk
+
+
+@pytest.mark.parametrize(
+    "memory_budget, max_runs", (("1GB", 64), (20_000, 64), (2_000, 3), (500, 2))
+)
+@pytest.mark.parametrize("with_nan", (False, True))
+def test_sorted(tmp_path, memory_budget, max_runs, with_nan):
+    store_path = tmp_path / "sorted.trans.bin"
+    num_records = write_sorted_trans_store(
+        random_chunks(7, 300, with_nan),
+        store_path,
+        memory_budget=memory_budget,
+        a_dtype="float64",
+        max_runs=max_runs,
+    )
+    transitions = read_trans_store(store_path)
+    expected = pandas.concat(random_chunks(7, 300, with_nan))
+    expected = expected.sort_values("v_if", kind="stable")
+    assert num_records == len(transitions) == 2100
+    for col in ["i", "f", "A_if", "v_if"]:
+        assert np.array_equal(
+            transitions[col], expected[col].to_numpy(), equal_nan=col == "v_if"
+        )
+    # the sorted runs spilled are removed:
+    assert [path.name for path in tmp_path.iterdir()] == ["sorted.trans.bin"]
+
+
+def test_sorted_invalid(tmp_path):
+    store_path = tmp_path / "sorted.trans.bin"
+    assert write_sorted_trans_store([], store_path) == 0
+    assert len(read_trans_store(store_path)) == 0
+    with pytest.raises(TransParseError):
+        write_sorted_trans_store(trans_chunks([dummy_trans_path], 2), store_path)
+    with pytest.raises(ValueError):
+        write_sorted_trans_store([], store_path, max_runs=1)
+    with pytest.raises(ValueError):
+        write_sorted_trans_store([], store_path, memory_budget="1 XB")
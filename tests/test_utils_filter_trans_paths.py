@@ -0,0 +1,40 @@
+import pytest
+
+from exomole.utils import filter_trans_paths, get_wavenumber_range
+
+trans_paths = [
+    "H2O__POKAZATEL__00000-00100.trans.bz2",
+    "H2O__POKAZATEL__00100-00200.trans.bz2",
+    "H2O__POKAZATEL__00200-00300.trans",
+    "H2O__POKAZATEL.trans.bz2",
+]
+
+
+@pytest.mark.parametrize(
+    "file_path, expected",
+    [
+        ("H2O__POKAZATEL__00000-00100.trans.bz2", (0.0, 100.0)),
+        ("dir/H2O__POKAZATEL__41200-41300.trans", (41200.0, 41300.0)),
+        ("H2O__POKAZATEL.trans.bz2", None),
+        ("H2O__POKAZATEL__00000-00100.states.bz2", None),
+    ],
+)
+def test_get_wavenumber_range(file_path, expected):
+    assert get_wavenumber_range(file_path) == expected
+
+
+@pytest.mark.parametrize(
+    "wavenumber_range, expected_indices",
+    [
+        ((50, 60), [0, 3]),
+        ((100, 100), [1, 3]),
+        ((99.9, 100), [0, 1, 3]),
+        ((150, None), [1, 2, 3]),
+        ((None, None), [0, 1, 2, 3]),
+        ((1000, 2000), [3]),
+    ],
+)
+def test_filter_trans_paths(wavenumber_range, expected_indices):
+    assert filter_trans_paths(trans_paths, wavenumber_range) == [
+        trans_paths[i] for i in expected_indices
+    ]
@@ -1,20 +1,55 @@
+import bz2
+
 import pandas
-import numpy as np
 import pytest
 
 import exomole.utils
-from exomole.utils import get_num_columns
+from exomole.utils import get_num_columns, load_dataframe_chunks
+from . import resources_path
+
+
+@pytest.mark.parametrize(
+    "file_name, num_cols",
+    (
+        ("dummy_data_5x5_int.bz2", 5),
+        ("dummy_trans_5x3_int_int_float.trans.bz2", 3),
+        ("dummy_states_10x5_int_float_int_str_int.states.bz2", 5),
+    ),
+)
+def test_get_num_columns(file_name, num_cols):
+    assert get_num_columns(resources_path / file_name) == num_cols
 
 
-@pytest.mark.parametrize("df_shape", ((4, 3), (5, 1), (1, 5)))
-def test_get_num_columns(monkeypatch, df_shape):
-    r, c = df_shape
+def test_get_num_columns_memoised(tmp_path, monkeypatch):
+    file_path = tmp_path / "dummy.trans"
+    file_path.write_text("1 2 0.5\n2 3 0.5\n")
+    assert get_num_columns(file_path) == 3
+    monkeypatch.setattr(exomole.utils, "open_data_file", None)
+    # served from the memory, with no file opened:
+    assert get_num_columns(file_path) == 3
+    monkeypatch.undo()
+    file_path.write_text("1 2 0.5 1.0\n2 3 0.5 2.0\n")
+    assert get_num_columns(file_path) == 4
 
-    def mock_load_dataframe_chunks(*_, **__):
-        for _ in range(5):
-            yield pandas.DataFrame(np.arange(r * c).reshape(df_shape))
 
-    monkeypatch.setattr(
-        exomole.utils, "load_dataframe_chunks", mock_load_dataframe_chunks
+@pytest.mark.parametrize("num_workers", [None, 2])
+def test_load_dataframe_chunks_peeked(tmp_path, monkeypatch, num_workers):
+    file_path = tmp_path / "dummy.states.bz2"
+    file_path.write_bytes(
+        bz2.compress(b"".join(b"%d 0.5 a\n" % i for i in range(1, 1001)))
     )
-    assert get_num_columns(file_path="mock_path") == c
+    opened = []
+    open_data_file = exomole.utils.open_data_file
+
+    def spy(*args, **kwargs):
+        opened.append(args)
+        return open_data_file(*args, **kwargs)
+
+    monkeypatch.setattr(exomole.utils, "open_data_file", spy)
+    kwargs = dict(chunk_size=300, column_names=["i", "E", "lab"])
+    states = pandas.concat(load_dataframe_chunks(file_path, **kwargs))
+    assert len(opened) == 1
+    assert len(states) == 1000
+    assert list(states.iloc[-1]) == [1000, 0.5, "a"]
+    assert get_num_columns(file_path) == 3
+    assert len(opened) == 1
@@ -3,6 +3,7 @@ import re
 import pytest
 
 import exomole
+from exomole.filters import filter_dataframe
 from exomole.utils import load_dataframe_chunks, DataParseError, _get_compression
 from . import resources_path
 
@@ -184,3 +185,62 @@ def test_load_data_no_compression(monkeypatch):
         assert list(chunk.index) == [0, 1, 2, 3, 4]
         assert str(chunk.loc[4, "e"]) == "24"
         assert chunk.shape == (5, 5)
+
+
+def test_usecols(monkeypatch):
+    monkeypatch.setattr(exomole.utils, "get_num_columns", lambda x: 5)
+    names = "i a b c d".split()
+    (chunk,) = load_dataframe_chunks(data_path, 5, column_names=names, usecols=["c"])
+    assert list(chunk.columns) == ["c"]
+    (chunk,) = load_dataframe_chunks(
+        data_path, 5, first_col_is_index=True, column_names=names, usecols=["d", "a"]
+    )
+    assert list(chunk.columns) == ["a", "d"]
+    (full_chunk,) = load_dataframe_chunks(
+        data_path, 5, first_col_is_index=True, column_names=names
+    )
+    assert chunk.equals(full_chunk[["a", "d"]])
+    with pytest.raises(ValueError):
+        load_dataframe_chunks(data_path, 5, column_names=names, usecols=["e"])
+    with pytest.raises(ValueError):
+        load_dataframe_chunks(data_path, 5, usecols=["a"])
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"first_col_is_index": True},
+        {"usecols": ["a"]},
+        {"start_row": 1, "stop_row": 4},
+    ],
+)
+def test_filters_before_parsing(kwargs, tmp_path, monkeypatch):
+    monkeypatch.setattr(exomole.utils, "get_num_columns", lambda x: 5)
+    # a copy, so no block index ends up in resources:
+    path = tmp_path / data_path.name
+    path.write_bytes(data_path.read_bytes())
+    names = "i a b c d".split()
+    filters = [("b", ">", 5), ("i", "!=", 15)]
+    index_col = "i" if kwargs.get("first_col_is_index") else None
+    load_kwargs = dict(kwargs)
+    if "usecols" in kwargs:
+        load_kwargs["usecols"] = kwargs["usecols"] + ["b", "i"]
+    expected = [
+        filter_dataframe(chunk, filters, index_col).drop(
+            columns=["i"] if "usecols" in kwargs else []
+        )
+        for chunk in load_dataframe_chunks(path, 2, column_names=names, **load_kwargs)
+    ]
+
+    def no_filter_dataframe(*args, **kwargs):
+        raise AssertionError("The chunks should not be filtered after parsing.")
+
+    monkeypatch.setattr(exomole.utils, "filter_dataframe", no_filter_dataframe)
+    chunks = list(
+        load_dataframe_chunks(path, 2, column_names=names, filters=filters, **kwargs)
+    )
+    assert len(chunks) == len(expected)
+    for chunk, expected_chunk in zip(chunks, expected):
+        assert chunk.equals(expected_chunk)
+        assert list(chunk.index) == list(expected_chunk.index)
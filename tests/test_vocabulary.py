@@ -0,0 +1,80 @@
+import numpy as np
+import pandas
+import pytest
+
+from exomole.read_data import states_chunks
+from exomole.vocabulary import LabelVocabulary
+from . import resources_path
+
+dummy_states_path = resources_path.joinpath(
+    "dummy_states_10x5_int_float_int_str_int.states.bz2"
+)
+columns = ["i", "a", "b", "c", "d"]
+
+
+def test_encode_decode():
+    vocabulary = LabelVocabulary(["par", "e/f"], labels={"par": ["+"]})
+    codes = vocabulary.encode("par", np.array(["-", "+", None, "-"], dtype=object))
+    assert codes.dtype == "int32"
+    assert codes.tolist() == [1, 0, -1, 1]
+    assert vocabulary["par"] == ["+", "-"]
+    assert vocabulary["e/f"] == []
+    decoded = vocabulary.decode("par", codes)
+    assert decoded.tolist()[:2] == ["-", "+"] and pandas.isna(decoded[2])
+    assert vocabulary.encode("par", pandas.Categorical(["x", "+"])).tolist() == [2, 0]
+    restored = LabelVocabulary.from_dict(vocabulary.to_dict())
+    assert restored.columns == ["par", "e/f"]
+    assert restored["par"] == ["+", "-", "x"]
+
+
+@pytest.mark.parametrize("backend", ("pandas", "numpy"))
+@pytest.mark.parametrize("label_codes", (False, True))
+def test_states_chunks(tmp_path, backend, label_codes):
+    if backend == "numpy":
+        # the numpy backend needs a fixed-width file:
+        expected = pandas.concat(states_chunks(dummy_states_path, columns))
+        states_path = tmp_path / "fixed_width.states"
+        states_path.write_text(
+            "".join(
+                f"{i:3d} {a:>20} {b:>3} {c:>2} {d:>2}\n"
+                for i, (a, b, c, d) in expected.iterrows()
+            )
+        )
+    else:
+        states_path = dummy_states_path
+    expected = pandas.concat(states_chunks(states_path, columns))
+    vocabulary = LabelVocabulary(["c"], labels={"c": ["j"]})
+    chunks = list(
+        states_chunks(
+            states_path,
+            columns,
+            chunk_size=3,
+            vocabulary=vocabulary,
+            label_codes=label_codes,
+            backend=backend,
+            filters=[("c", "!=", "b")],
+        )
+    )
+    assert vocabulary["c"] == ["j", "a", "c", "d", "e", "f", "g", "h", "i"]
+    if label_codes:
+        assert all(chunk["c"].dtype == "int32" for chunk in chunks)
+        labels = [vocabulary.decode("c", chunk["c"]) for chunk in chunks]
+    else:
+        labels = [chunk["c"].cat.codes for chunk in chunks]
+        assert labels[0].tolist() == [1, 2]  # the same codes in all the chunks
+        labels = [chunk["c"].astype(vocabulary.get_dtype("c")) for chunk in chunks]
+    labels = pandas.concat([pandas.Series(values) for values in labels])
+    assert labels.astype(str).tolist() == list("acdefghij")
+    assert pandas.concat(chunks)["a"].equals(expected.loc[expected["c"] != "b", "a"])
+
+
+def test_states_chunks_invalid():
+    with pytest.raises(ValueError):
+        list(
+            states_chunks(
+                dummy_states_path,
+                columns,
+                vocabulary=LabelVocabulary(["c"]),
+                output="arrow",
+            )
+        )